@@ -0,0 +1,229 @@
+import atexit
+import datetime
+import logging
+import os
+import threading
+import time
+
+from collections import defaultdict, deque
+
+import keen
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class KeenSink():
+    """
+    Sends batches of events to Keen in a single API call. Keen accepts or
+    rejects each event on its own, so events that it rejects are logged
+    rather than put back, as they would only be rejected again.
+    """
+
+    def send(self, events):
+        response = keen.add_events(events)
+        for collection, results in (response or {}).items():
+            rejected = [
+                result for result in results if not result.get("success")
+            ]
+            if rejected:
+                logger.error(
+                    "Keen rejected %d of %d %s events: %s",
+                    len(rejected),
+                    len(results),
+                    collection,
+                    rejected[0].get("error")
+                )
+
+
+class LogSink():
+    """
+    A local stand-in for Keen that writes a summary of every batch to the
+    log, for development and for running without Keen credentials.
+    """
+
+    def send(self, events):
+        for collection, collection_events in events.items():
+            logger.info(
+                "Analytics: %d %s events",
+                len(collection_events),
+                collection
+            )
+
+
+class MemorySink():
+    """Keeps every batch in memory. Used by the tests."""
+
+    def __init__(self):
+        self.batches = []
+
+    def send(self, events):
+        self.batches.append(events)
+
+
+class AnalyticsBuffer():
+    """
+    Buffers analytics events in memory and sends them to a sink in batches
+    from a background thread, so that recording an event never has to
+    wait on the network.
+
+    The buffer is a ring: once it holds capacity events, each new event
+    pushes out the oldest one and is counted as dropped. If the sink fails,
+    the batch is put back and the consumer backs off exponentially, so an
+    outage costs us events (and shows up in the counters) rather than
+    slowing down API responses.
+    """
+
+    def __init__(
+        self,
+        sink,
+        capacity=10000,
+        batch_size=500,
+        flush_interval=5,
+        max_backoff=300,
+        autostart=True
+    ):
+        self.sink = sink
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.autostart = autostart
+
+        self._events = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._consumer = None
+        self._consumer_pid = None
+        self._backoff = 0
+
+        self.added = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed_batches = 0
+
+    def add(self, collection, event):
+        with self._lock:
+            if len(self._events) == self.capacity:
+                self.dropped += 1
+            self._events.append((collection, event))
+            self.added += 1
+            should_wake = len(self._events) >= self.batch_size
+
+        if self.autostart:
+            self._ensure_consumer()
+        if should_wake:
+            self._wakeup.set()
+
+    def _ensure_consumer(self):
+        # Threads do not survive a fork, so each gunicorn worker needs to
+        # start its own consumer.
+        if self._consumer_pid == os.getpid() and self._consumer.is_alive():
+            return
+
+        with self._lock:
+            if (
+                self._consumer_pid != os.getpid() or
+                not self._consumer.is_alive()
+            ):
+                self._consumer = threading.Thread(
+                    target=self._run,
+                    name="analytics-consumer",
+                    daemon=True
+                )
+                self._consumer_pid = os.getpid()
+                self._consumer.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval + self._backoff)
+            self._wakeup.clear()
+            self.flush()
+
+    def _take_batch(self):
+        with self._lock:
+            batch = []
+            while self._events and len(batch) < self.batch_size:
+                batch.append(self._events.popleft())
+            return batch
+
+    def _put_back(self, batch):
+        with self._lock:
+            # Events that arrived while the batch was being sent take
+            # priority over the failed batch if the buffer is now full.
+            space = self.capacity - len(self._events)
+            if space < len(batch):
+                self.dropped += len(batch) - space
+                batch = batch[len(batch) - space:] if space else []
+            self._events.extendleft(reversed(batch))
+
+    def flush(self):
+        """Sends everything in the buffer. Returns False if the sink failed."""
+        batch = self._take_batch()
+        while batch:
+            events = defaultdict(list)
+            for collection, event in batch:
+                events[collection].append(event)
+
+            try:
+                self.sink.send(dict(events))
+            except Exception:
+                logger.exception("Could not send analytics events")
+                self.failed_batches += 1
+                self._put_back(batch)
+                self._backoff = min(
+                    max(self._backoff * 2, self.flush_interval),
+                    self.max_backoff
+                )
+                return False
+
+            self.sent += len(batch)
+            self._backoff = 0
+            batch = self._take_batch()
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "buffered": len(self._events),
+                "added": self.added,
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "failed_batches": self.failed_batches,
+                "backoff": self._backoff
+            }
+
+
+def _create_sink():
+    if settings.ANALYTICS_SINK == "keen":
+        return KeenSink()
+    return LogSink()
+
+
+analytics_buffer = AnalyticsBuffer(
+    _create_sink(),
+    capacity=settings.ANALYTICS_BUFFER_CAPACITY,
+    batch_size=settings.ANALYTICS_BATCH_SIZE,
+    flush_interval=settings.ANALYTICS_FLUSH_INTERVAL
+)
+
+
+def add_event(collection, event):
+    # Events can sit in the buffer for a while, so Keen is told when they
+    # happened rather than using the time they are sent
+    event["keen"] = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+    analytics_buffer.add(collection, event)
+
+
+@atexit.register
+def _flush_on_exit():
+    # Give the sink one last chance so that events buffered when a worker
+    # is restarted are not lost.
+    start_time = time.monotonic()
+    while analytics_buffer.get_stats()["buffered"]:
+        if not analytics_buffer.flush() or time.monotonic() - start_time > 5:
+            break
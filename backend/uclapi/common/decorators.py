@@ -2,21 +2,24 @@ import ciso8601
 import datetime
 import pytz
 import re
-import redis
 
 from datetime import timezone
 from email.utils import format_datetime
-from functools import wraps
+from functools import lru_cache, wraps
 
 from dashboard.models import App
-from dashboard.tasks import keen_add_event_task as keen_add_event
 
 from oauth.models import OAuthToken
 from oauth.scoping import Scopes
 
-from .helpers import PrettyJsonResponse as JsonResponse
-
-from uclapi.settings import REDIS_UCLAPI_HOST
+from .analytics import add_event
+from .helpers import PrettyJsonResponse as JsonResponse, wants_pretty_json
+from .redis_pool import get_redis
+from .throttling import (  # noqa: F401
+    how_many_seconds_until_midnight,
+    TOKEN_TYPE_POLICIES
+)
+from .token_cache import token_cache
 
 
 # Gets a variable from GET or POST not caring which is which
@@ -29,6 +32,9 @@ def get_var(request, var_name):
         return None
 
 
+LAST_MODIFIED_KEY_PREFIX = "http:headers:Last-Modified:"
+
+
 class UclApiIncorrectDecoratorUsageException(Exception):
     pass
 
@@ -37,16 +43,6 @@ class UclApiIncorrectTokenTypeException(Exception):
     pass
 
 
-def how_many_seconds_until_midnight():
-    """Returns the number of seconds until midnight."""
-    tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
-    midnight = datetime.datetime(
-        year=tomorrow.year, month=tomorrow.month,
-        day=tomorrow.day, hour=0, minute=0, second=0
-    )
-    return (midnight - datetime.datetime.now()).seconds
-
-
 def log_api_call(request, token, token_type):
     service = request.path.split("/")[1]
     method = request.path.split("/")[2]
@@ -82,44 +78,73 @@ def log_api_call(request, token, token_type):
             "token_type": token_type
         }
 
-    keen_add_event.delay("apicall", parameters)
+    # Events are buffered and sent in batches by a background thread
+    add_event("apicall", parameters)
 
 
-def throttle_api_call(token, token_type):
-    if token_type == 'general':
-        cache_key = token.user.email
-        limit = 10000
-    elif token_type == 'general-temp':
-        cache_key = token
-        limit = 10
-    elif token_type == 'oauth':
+def _queue_throttle_api_call(pipe, token, token_type):
+    """
+    Adds the rate limiting check for token to a Redis pipeline and returns
+    a function that turns its reply into the throttle data tuple.
+    """
+    if token_type in {'general', 'oauth'}:
         cache_key = token.user.email
-        limit = 10000
-    elif token_type == 'test-token':
+    elif token_type in {'general-temp', 'test-token'}:
         cache_key = token
-        limit = 1
     else:
         raise UclApiIncorrectTokenTypeException
 
-    r = redis.Redis(host=REDIS_UCLAPI_HOST)
-    count_data = r.get(cache_key)
+    return TOKEN_TYPE_POLICIES[token_type].queue(pipe, cache_key)
 
-    secs = how_many_seconds_until_midnight()
-    if count_data is None:
-        r.set(cache_key, 1, secs)
-        return (False, limit, limit - 1, secs)
-    else:
-        count = int(count_data)
-        if count >= limit:
-            return (True, limit, limit - count, secs)
-        else:
-            r.incr(cache_key)
-            return (False, limit, limit - count, secs)
+
+def throttle_api_call(token, token_type):
+    pipe = get_redis().pipeline(transaction=False)
+    finish = _queue_throttle_api_call(pipe, token, token_type)
+    return finish(pipe.execute()[0])
+
+
+def _get_oauth_token(token_code):
+    # Resolve the token along with everything the decorator and views need
+    # from it, so that a cache hit costs no database queries at all.
+    cache_key = ("oauth", token_code)
+    token = token_cache.get(cache_key)
+    if token is None:
+        token = OAuthToken.objects.select_related(
+            'app',
+            'user',
+            'scope'
+        ).get(token=token_code)
+        token_cache.set(cache_key, token, tags=(
+            ("oauthtoken", token.id),
+            ("app", token.app_id),
+            ("user", token.user_id),
+            ("scope", token.scope_id)
+        ))
+    return token
+
+
+def _get_general_token(token_code):
+    cache_key = ("general", token_code)
+    token = token_cache.get(cache_key)
+    if token is None:
+        token = App.objects.select_related(
+            'user',
+            'scope'
+        ).get(
+            api_token=token_code,
+            deleted=False
+        )
+        token_cache.set(cache_key, token, tags=(
+            ("app", token.id),
+            ("user", token.user_id),
+            ("scope", token.scope_id)
+        ))
+    return token
 
 
 def _check_oauth_token_issues(token_code, client_secret, required_scopes):
     try:
-        token = OAuthToken.objects.get(token=token_code)
+        token = _get_oauth_token(token_code)
     except OAuthToken.DoesNotExist:
         response = JsonResponse({
             "ok": False,
@@ -162,12 +187,9 @@ def _check_oauth_token_issues(token_code, client_secret, required_scopes):
     return token
 
 
-def _check_temp_token_issues(
-    token_code,
-    personal_data,
-    request_path,
-    page_token=None
-):
+def _check_temp_token_request(personal_data, request_path, page_token=None):
+    # Checks what a temporary token is being used for, which does not need
+    # Redis. Returns None if there are no issues.
     # The token is a generic one, so sanity check
     if personal_data:
         response = JsonResponse({
@@ -177,16 +199,6 @@ def _check_temp_token_issues(
         response.status_code = 400
         return response
 
-    r = redis.Redis(host=REDIS_UCLAPI_HOST)
-
-    if not r.get(token_code):
-        response = JsonResponse({
-            "ok": False,
-            "error": "Temporary token is either invalid or expired."
-        })
-        response.status_code = 400
-        return response
-
     if request_path != "/roombookings/bookings":
         response = JsonResponse({
             "ok": False,
@@ -205,6 +217,47 @@ def _check_temp_token_issues(
         })
         response.status_code = 400
         return response
+
+    return None
+
+
+def _check_temp_token_exists(token_exists):
+    if not token_exists:
+        response = JsonResponse({
+            "ok": False,
+            "error": "Temporary token is either invalid or expired."
+        })
+        response.status_code = 400
+        return response
+
+    return None
+
+
+def _check_temp_token_issues(
+    token_code,
+    personal_data,
+    request_path,
+    page_token=None,
+    token_exists=None
+):
+    request_check = _check_temp_token_request(
+        personal_data,
+        request_path,
+        page_token
+    )
+    if request_check is not None:
+        return request_check
+
+    # The decorator looks the token up in Redis along with everything else
+    # it needs, so we only go to Redis ourselves if we have not been told
+    # whether the token exists.
+    if token_exists is None:
+        token_exists = get_redis().exists(token_code)
+
+    exists_check = _check_temp_token_exists(token_exists)
+    if exists_check is not None:
+        return exists_check
+
     # No issues, so return the temporary token
     return token_code
 
@@ -220,10 +273,7 @@ def _check_general_token_issues(token_code, personal_data):
         return response
 
     try:
-        token = App.objects.get(
-            api_token=token_code,
-            deleted=False
-        )
+        token = _get_general_token(token_code)
     except App.DoesNotExist:
         response = JsonResponse({
             "ok": False,
@@ -236,43 +286,54 @@ def _check_general_token_issues(token_code, personal_data):
     return token
 
 
-def _get_last_modified_header(redis_key=None):
+@lru_cache(maxsize=32)
+def _format_last_modified(value):
+    """
+    Formats a Last-Modified timestamp stored in Redis as an HTTP header.
+    The stored value only changes when a cache (e.g. gencache) is rebuilt,
+    so the result is memoised on the raw value.
+    """
+    # Convert the Redis bytes response to a string.
+    value = value.decode('utf-8')
+
+    # We need the UTC timezone so that we can convert to it.
+    utc_tz = pytz.timezone("UTC")
+
+    # Parse the ISO 8601 timestamp from Redis and represent it as UTC
+    utc_timestamp = ciso8601.parse_datetime(value).astimezone(utc_tz)
+
+    # Format the datetime object as per the HTTP Header RFC.
+    # We replace the inner tzinfo in the timestamp to force it to be a UTC
+    # timestamp as opposed to a naive one; this is a requirement for the
+    # format_datetime function.
+    return format_datetime(
+        utc_timestamp.replace(tzinfo=timezone.utc),
+        usegmt=True
+    )
+
+
+def _last_modified_header_from_value(value):
+    if value:
+        return _format_last_modified(value)
+
     # Default last modified is the UTC time now
-    last_modified = format_datetime(
+    return format_datetime(
         datetime.datetime.utcnow().replace(tzinfo=timezone.utc),
         usegmt=True
     )
 
+
+def _get_last_modified_header(redis_key=None):
     # If we haven't been passed a Redis key, we just return the
     # current timeztamp as a last modified header.
     if redis_key is None:
-        return last_modified
+        return _last_modified_header_from_value(None)
 
     # We have been given a Redis key, so attempt to pull it from Redis
-    r = redis.Redis(host=REDIS_UCLAPI_HOST)
-    redis_key = "http:headers:Last-Modified:" + redis_key
-    value = r.get(redis_key)
+    r = get_redis()
+    value = r.get(LAST_MODIFIED_KEY_PREFIX + redis_key)
 
-    if value:
-        # Convert the Redis bytes response to a string.
-        value = value.decode('utf-8')
-
-        # We need the UTC timezone so that we can convert to it.
-        utc_tz = pytz.timezone("UTC")
-
-        # Parse the ISO 8601 timestamp from Redis and represent it as UTC
-        utc_timestamp = ciso8601.parse_datetime(value).astimezone(utc_tz)
-
-        # Format the datetime object as per the HTTP Header RFC.
-        # We replace the inner tzinfo in the timestamp to force it to be a UTC
-        # timestamp as opposed to a naive one; this is a requirement for the
-        # format_datetime function.
-        last_modified = format_datetime(
-            utc_timestamp.replace(tzinfo=timezone.utc),
-            usegmt=True
-        )
-
-    return last_modified
+    return _last_modified_header_from_value(value)
 
 
 def uclapi_protected_endpoint(
@@ -327,25 +388,19 @@ def uclapi_protected_endpoint(
                 kwargs['token_type'] = 'oauth'
 
             elif token_code.startswith('uclapi-temp-'):
-                temp_token_check = _check_temp_token_issues(
-                    token_code,
+                # Anything that does not need Redis is checked first, so
+                # that a rejected request never counts towards the
+                # token's limit. Whether the token exists is checked below
+                # once all of the Redis data has been fetched.
+                temp_request_check = _check_temp_token_request(
                     personal_data,
                     request.path,
                     request.GET.get('page_token')
                 )
-                if isinstance(temp_token_check, JsonResponse):
-                    return temp_token_check
-                token = temp_token_check
-
-                # This is a horrible hack to force the temporary
-                # token to always return only 1 booking
-                # Courtesy of: https://stackoverflow.com/a/38372217/825916
-                # We make the GET data mutable first, then inject the
-                # results_per_page parameter so that there can only
-                # be one result returned.
-                request.GET._mutable = True
-                request.GET['results_per_page'] = 1
+                if temp_request_check is not None:
+                    return temp_request_check
 
+                token = token_code
                 kwargs['token_type'] = 'general-temp'
 
             elif token_code.startswith('uclapi-'):
@@ -376,6 +431,36 @@ def uclapi_protected_endpoint(
                 raise UclApiIncorrectTokenTypeException
 
             kwargs['token'] = token
+            kwargs['pretty_json'] = wants_pretty_json(request)
+
+            # Everything we need from Redis (whether a temporary token
+            # exists, the throttle counter and the Last-Modified timestamp)
+            # is fetched in a single pipelined round-trip.
+            pipe = get_redis().pipeline(transaction=False)
+            if kwargs['token_type'] == 'general-temp':
+                pipe.exists(token_code)
+            finish_throttle = _queue_throttle_api_call(
+                pipe,
+                token,
+                kwargs['token_type']
+            )
+            if last_modified_redis_key is not None:
+                pipe.get(LAST_MODIFIED_KEY_PREFIX + last_modified_redis_key)
+            replies = pipe.execute()
+
+            if kwargs['token_type'] == 'general-temp':
+                temp_token_check = _check_temp_token_exists(replies.pop(0))
+                if temp_token_check is not None:
+                    return temp_token_check
+
+                # This is a horrible hack to force the temporary
+                # token to always return only 1 booking
+                # Courtesy of: https://stackoverflow.com/a/38372217/825916
+                # We make the GET data mutable first, then inject the
+                # results_per_page parameter so that there can only
+                # be one result returned.
+                request.GET._mutable = True
+                request.GET['results_per_page'] = 1
 
             # Log the API call before carrying it out
             log_api_call(request, token, kwargs['token_type'])
@@ -386,11 +471,12 @@ def uclapi_protected_endpoint(
                 limit,
                 remaining,
                 reset_secs
-            ) = throttle_api_call(token, kwargs['token_type'])
+            ) = finish_throttle(replies.pop(0))
 
             # Get last modified header
-            kwargs['Last-Modified'] = _get_last_modified_header(
-                last_modified_redis_key
+            kwargs['Last-Modified'] = _last_modified_header_from_value(
+                replies.pop(0) if last_modified_redis_key is not None
+                else None
             )
 
             if throttled:
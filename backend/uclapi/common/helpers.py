@@ -1,13 +1,23 @@
 import datetime
+import json
 import os
 import textwrap
 
 from binascii import hexlify
+from collections.abc import Iterator
 
-from django.http import JsonResponse, HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 
 from dotenv import read_dotenv as rd
 
+# orjson is an optional dependency that makes rendering compact JSON
+# several times faster. We fall back to the standard library without it.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def read_dotenv(path=None):
     if not os.environ.get('DOCKER') == "yes":
@@ -29,10 +39,146 @@ CUSTOM_HEADERS = [
 ]
 
 
+def dumps_compact_json(data):
+    """
+    Serialises data as JSON without any whitespace, returning bytes.
+    Types that JSON does not support (e.g. datetimes) are serialised in
+    the same way as Django's JsonResponse, whichever encoder is used.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            data,
+            default=DjangoJSONEncoder().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        separators=(',', ':')
+    ).encode('utf-8')
+
+
+def wants_pretty_json(request):
+    """
+    Decides whether a response should be pretty printed. This is done if
+    explicitly requested with ?pretty=true, or if the request looks like it
+    came from a browser. API clients get compact JSON by default.
+    """
+    pretty = request.GET.get('pretty')
+    if pretty is not None:
+        return pretty.lower() in ('true', '1', 'yes')
+    return 'text/html' in request.META.get('HTTP_ACCEPT', '')
+
+
+def _is_pretty(custom_header_data):
+    # Protected endpoints pass their view kwargs as custom header data,
+    # which includes whether the client wants pretty printed JSON.
+    # Everything else is pretty printed as it always has been.
+    if custom_header_data and 'pretty_json' in custom_header_data:
+        return custom_header_data['pretty_json']
+    return True
+
+
 class PrettyJsonResponse(JsonResponse):
     def __init__(self, data, custom_header_data=None):
-        # Calls JsonResponse's constructure and requests 4 line indenting
-        super().__init__(data, json_dumps_params={'indent': 4})
+        if _is_pretty(custom_header_data):
+            # Calls JsonResponse's constructure and requests 4 line indenting
+            super().__init__(data, json_dumps_params={'indent': 4})
+        else:
+            # Skip JsonResponse's constructor as we have already encoded
+            # the data ourselves.
+            super(JsonResponse, self).__init__(
+                content=dumps_compact_json(data),
+                content_type='application/json'
+            )
+
+        # Adds custom headers from a passed view kwargs
+        if custom_header_data:
+            for header in CUSTOM_HEADERS:
+                if header in custom_header_data:
+                    self[header] = custom_header_data[header]
+
+
+# Serialised items are collected into chunks of roughly this many bytes
+# before being handed to the server, rather than written one by one.
+STREAMING_CHUNK_SIZE = 16 * 1024
+
+
+def _dumps_pretty_json(data, level):
+    # Matches json.dumps(indent=4) output for data nested level deep
+    return textwrap.indent(
+        json.dumps(data, cls=DjangoJSONEncoder, indent=4),
+        ' ' * 4 * level
+    ).lstrip().encode('utf-8')
+
+
+def _stream_json_array(items, pretty):
+    dumps = (
+        (lambda item: _dumps_pretty_json(item, 2)) if pretty
+        else dumps_compact_json
+    )
+    separator = b',\n        ' if pretty else b','
+
+    chunk = bytearray(b'[\n        ' if pretty else b'[')
+    first = True
+    for item in items:
+        if not first:
+            chunk += separator
+        chunk += dumps(item)
+        first = False
+        if len(chunk) >= STREAMING_CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk = bytearray()
+
+    if first:
+        # json.dumps renders empty lists on one line
+        chunk = bytearray(b'[]')
+    else:
+        chunk += b'\n    ]' if pretty else b']'
+    yield bytes(chunk)
+
+
+def _stream_json_object(data, pretty):
+    dumps = (
+        (lambda value: _dumps_pretty_json(value, 1)) if pretty
+        else dumps_compact_json
+    )
+
+    yield b'{\n    ' if pretty else b'{'
+    for index, (key, value) in enumerate(data.items()):
+        if index:
+            yield b',\n    ' if pretty else b','
+        yield dumps(key)
+        yield b': ' if pretty else b':'
+        if callable(value):
+            value = value()
+        if isinstance(value, Iterator):
+            yield from _stream_json_array(value, pretty)
+        else:
+            yield dumps(value)
+    yield b'\n}' if pretty else b'}'
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    Sends a JSON object to the client while it is still being serialised.
+    Any value in data that is an iterator (e.g. a generator reading from a
+    queryset's .iterator()) is written out as a JSON array one item at a
+    time, so that large results never have to be held in memory at once.
+    Values that are callables are called once everything before them has
+    been written, so they can depend on what has already been sent. Other
+    values are serialised as normal.
+
+    The body is identical to what PrettyJsonResponse would send for the
+    same data with the iterators turned into lists and the callables
+    called.
+    """
+
+    def __init__(self, data, custom_header_data=None):
+        super().__init__(
+            _stream_json_object(data, _is_pretty(custom_header_data)),
+            content_type='application/json'
+        )
 
         # Adds custom headers from a passed view kwargs
         if custom_header_data:
@@ -0,0 +1,165 @@
+import datetime
+import gzip
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from common.helpers import dumps_compact_json, orjson
+
+# brotli is optional, so only report it if it is installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _synthetic_bookings(count):
+    start = datetime.datetime(2019, 10, 14, 9, 0)
+    bookings = []
+    for i in range(count):
+        booking_start = start + datetime.timedelta(minutes=30 * i)
+        bookings.append({
+            "roomname": "Cruciform Building B.3.05",
+            "siteid": "212",
+            "roomid": "B305",
+            "description": "COMP0016 - Systems Engineering",
+            "start_time": booking_start.strftime("%Y-%m-%dT%H:%M:%S+01:00"),
+            "end_time": (
+                booking_start + datetime.timedelta(hours=1)
+            ).strftime("%Y-%m-%dT%H:%M:%S+01:00"),
+            "contact": "Professor Example",
+            "slotid": 1500000 + i,
+            "weeknumber": 5.0,
+            "phone": None
+        })
+    return {
+        "ok": True,
+        "bookings": bookings,
+        "next_page_exists": True,
+        "page_token": "zZQxNb1x8nvTNYzKMjWLTYQL5hmUDp"
+    }
+
+
+def _synthetic_timetable(days, events_per_day):
+    start = datetime.date(2019, 10, 14)
+    timetable = {}
+    for day in range(days):
+        date = start + datetime.timedelta(days=day)
+        timetable[date.isoformat()] = [
+            {
+                "start_time": "{:02d}:00".format(9 + i),
+                "end_time": "{:02d}:00".format(10 + i),
+                "duration": 60,
+                "module": {
+                    "module_id": "COMP0016",
+                    "name": "Systems Engineering",
+                    "department_id": "COMPS_ENG",
+                    "department_name": "Computer Science",
+                    "lecturer": {
+                        "name": "Professor Example",
+                        "email": "example@ucl.ac.uk",
+                        "department_id": "COMPS_ENG",
+                        "department_name": "Computer Science"
+                    }
+                },
+                "location": {
+                    "name": "Cruciform Building B.3.05",
+                    "capacity": 100,
+                    "type": "CR",
+                    "address": ["Gower Street", "London", "WC1E 6BT", ""],
+                    "site_name": "Cruciform Building",
+                    "coordinates": {"lat": "51.524", "lng": "-0.135"}
+                },
+                "session_type": "L",
+                "session_type_str": "Lecture",
+                "session_group": "",
+                "session_title": "Systems Engineering",
+                "contact": "Professor Example",
+                "instance": {
+                    "delivery": {
+                        "fheq_level": 6,
+                        "is_undergraduate": True
+                    },
+                    "periods": {
+                        "teaching_periods": {"term_1": True},
+                        "year_long": False,
+                        "lsr": False,
+                        "summer_school": {
+                            "is_summer_school": False,
+                            "sessions": {"session_1": False}
+                        }
+                    },
+                    "instance_code": "A6U-T1"
+                }
+            } for i in range(events_per_day)
+        ]
+    return {"ok": True, "timetable": timetable}
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Compares the size and serialisation time of pretty printed and '
+        'compact JSON for the largest API responses'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Number of times to serialise each payload'
+        )
+
+    def _time(self, function, repeat):
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            result = function()
+        return result, (time.perf_counter() - start_time) / repeat
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        payloads = {
+            "/roombookings/bookings (1000 bookings)": (
+                _synthetic_bookings(1000)
+            ),
+            "/timetable/personal (a term, 6 events a day)": (
+                _synthetic_timetable(70, 6)
+            )
+        }
+
+        print("Compact encoder: {}".format(
+            "orjson" if orjson is not None else "json"
+        ))
+        for name, payload in payloads.items():
+            pretty, pretty_time = self._time(
+                lambda: json.dumps(
+                    payload,
+                    cls=DjangoJSONEncoder,
+                    indent=4
+                ).encode('utf-8'),
+                repeat
+            )
+            compact, compact_time = self._time(
+                lambda: dumps_compact_json(payload),
+                repeat
+            )
+
+            print(name)
+            print("  pretty:  {:>9} bytes  {:7.2f}ms".format(
+                len(pretty), pretty_time * 1000
+            ))
+            print("  compact: {:>9} bytes  {:7.2f}ms  ({:.0%} smaller)".format(
+                len(compact),
+                compact_time * 1000,
+                1 - len(compact) / len(pretty)
+            ))
+            print("  compact + gzip:   {:>9} bytes".format(
+                len(gzip.compress(compact, 6))
+            ))
+            if brotli is not None:
+                print("  compact + brotli: {:>9} bytes".format(
+                    len(brotli.compress(compact, quality=4))
+                ))
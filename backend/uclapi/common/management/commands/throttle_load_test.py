@@ -0,0 +1,120 @@
+import random
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.throttling import (
+    FixedWindowPolicy,
+    SlidingWindowPolicy,
+    TokenBucketPolicy
+)
+
+
+KEY_PREFIX = "throttle-load-test:"
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Hammers the API rate limiter with many concurrent tokens and '
+        'reports its throughput and whether any token overshot its limit'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--policy',
+            choices=['fixed', 'sliding', 'bucket'],
+            default='fixed',
+            help='The rate limiting policy to test'
+        )
+        parser.add_argument(
+            '--tokens',
+            type=int,
+            default=1000,
+            help='Number of distinct tokens to spread calls across'
+        )
+        parser.add_argument(
+            '--calls',
+            type=int,
+            default=100000,
+            help='Total number of rate limiter calls to make'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Number of threads making calls at once'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Calls allowed per token'
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        if options['policy'] == 'fixed':
+            policy = FixedWindowPolicy(limit, window=3600)
+        elif options['policy'] == 'sliding':
+            policy = SlidingWindowPolicy(limit, window=3600)
+        else:
+            # Refill slowly enough that the bucket cannot refill
+            # noticeably while the test is running
+            policy = TokenBucketPolicy(limit, rate=limit / 86400)
+
+        r = redis.Redis(
+            host=settings.REDIS_UCLAPI_HOST,
+            max_connections=options['concurrency']
+        )
+        run_prefix = "{}{}:".format(KEY_PREFIX, int(time.time()))
+        tokens = [
+            "{}{}".format(run_prefix, i) for i in range(options['tokens'])
+        ]
+        calls = [random.choice(tokens) for _ in range(options['calls'])]
+
+        def call(token):
+            throttled, _, _, _ = policy.check(r, token)
+            return token, throttled
+
+        start_time = time.time()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(call, calls, chunksize=100))
+        elapsed_time = time.time() - start_time
+
+        calls_per_token = Counter(calls)
+        allowed_per_token = Counter(
+            token for token, throttled in results if not throttled
+        )
+        overshoots = 0
+        undershoots = 0
+        for token, made in calls_per_token.items():
+            expected = min(made, limit)
+            if allowed_per_token[token] > expected:
+                overshoots += 1
+            elif allowed_per_token[token] < expected:
+                undershoots += 1
+
+        for key in r.scan_iter(run_prefix + "*"):
+            r.delete(key)
+
+        print("Policy: {}".format(options['policy']))
+        print("{} calls over {} tokens with {} threads in {:.2f}s".format(
+            len(calls),
+            len(tokens),
+            options['concurrency'],
+            elapsed_time
+        ))
+        print("Throughput: {:.0f} calls/s".format(len(calls) / elapsed_time))
+        print("Tokens allowed more calls than their limit: {}".format(
+            overshoots
+        ))
+        print("Tokens allowed fewer calls than their limit: {}".format(
+            undershoots
+        ))
@@ -0,0 +1,94 @@
+import re
+
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+# brotli is an optional dependency. Without it, responses are gzipped.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Bodies smaller than this are sent as they are, since compressing them
+# saves next to nothing and costs CPU on both ends.
+MIN_COMPRESS_LENGTH = 1024
+
+# Quality 4 gives most of brotli's size reduction at around gzip speed
+BROTLI_QUALITY = 4
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+class JsonCompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses JSON responses with brotli, if the client accepts it and the
+    module is installed, or gzip otherwise. Unlike Django's GZipMiddleware,
+    everything that is not JSON (e.g. the dashboard's HTML and static files)
+    is left alone.
+    """
+
+    def process_response(self, request, response):
+        if not response.get('Content-Type', '').startswith(
+            'application/json'
+        ):
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        if (
+            not response.streaming and
+            len(response.content) < MIN_COMPRESS_LENGTH
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            encoding = 'br'
+        elif re_accepts_gzip.search(accept_encoding):
+            encoding = 'gzip'
+        else:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = _brotli_sequence(
+                    response.streaming_content
+                )
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content
+                )
+            del response['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(
+                    response.content,
+                    quality=BROTLI_QUALITY
+                )
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(response.content))
+
+        # Strong ETags no longer match once the body has been compressed
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+
+        return response
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
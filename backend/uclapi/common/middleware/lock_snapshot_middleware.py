@@ -0,0 +1,18 @@
+from django.utils.deprecation import MiddlewareMixin
+
+from timetable.lock_cache import pin_lock, unpin_lock
+
+
+class LockSnapshotMiddleware(MiddlewareMixin):
+    """
+    Makes every lookup of the gencache lock during a request return the same
+    state, so that views read from a single cache bucket throughout even if
+    update_gencache inverts the lock part of the way through.
+    """
+
+    def process_request(self, request):
+        pin_lock()
+
+    def process_response(self, request, response):
+        unpin_lock()
+        return response
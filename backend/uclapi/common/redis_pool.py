@@ -0,0 +1,109 @@
+import threading
+import time
+
+import redis
+
+from django.conf import settings
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    A blocking connection pool that keeps count of how often connections
+    are checked out and how long callers had to wait for one.
+
+    BlockingConnectionPool waits on a queue when every connection is in use
+    rather than opening yet another one. Under eventlet the queue module is
+    monkey patched, so waiting yields to other green threads instead of
+    blocking the whole worker.
+    """
+
+    def reset(self):
+        super().reset()
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.errors = 0
+
+    def get_connection(self, command_name, *keys, **options):
+        start_time = time.monotonic()
+        try:
+            connection = super().get_connection(
+                command_name,
+                *keys,
+                **options
+            )
+        except redis.ConnectionError:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+
+        waited = time.monotonic() - start_time
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+        return connection
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time,
+                "average_wait_time": (
+                    self.wait_time / self.checkouts if self.checkouts else 0
+                ),
+                "errors": self.errors,
+                "connections": len(self._connections),
+                "max_connections": self.max_connections
+            }
+
+
+# One pool per response type. Clients returning bytes and clients returning
+# decoded strings cannot share connections as decoding is a connection
+# level setting.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(decode_responses):
+    pool = _pools.get(decode_responses)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        if decode_responses not in _pools:
+            _pools[decode_responses] = InstrumentedConnectionPool(
+                host=settings.REDIS_UCLAPI_HOST,
+                max_connections=settings.REDIS_UCLAPI_MAX_CONNECTIONS,
+                timeout=settings.REDIS_UCLAPI_POOL_TIMEOUT,
+                socket_timeout=settings.REDIS_UCLAPI_SOCKET_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_UCLAPI_SOCKET_TIMEOUT,
+                socket_keepalive=True,
+                retry_on_timeout=True,
+                health_check_interval=(
+                    settings.REDIS_UCLAPI_HEALTH_CHECK_INTERVAL
+                ),
+                decode_responses=decode_responses,
+                encoding="utf-8"
+            )
+        return _pools[decode_responses]
+
+
+def get_redis(decode_responses=False):
+    """
+    Returns a Redis client backed by the process-wide connection pool.
+    Clients are cheap to create, so there is no need to hold on to them.
+    With decode_responses=True, replies are decoded into UTF-8 strings
+    instead of being returned as bytes.
+    """
+    return redis.Redis(connection_pool=_get_pool(decode_responses))
+
+
+def get_pool_stats():
+    """Returns checkout and wait time metrics for every pool in use"""
+    return {
+        "decoded" if decode_responses else "bytes": pool.get_stats()
+        for decode_responses, pool in _pools.items()
+    }
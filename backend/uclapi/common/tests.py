@@ -4,18 +4,34 @@ from .decorators import (
     _check_general_token_issues,
     _check_oauth_token_issues,
     _check_temp_token_issues,
+    _format_last_modified,
     _get_last_modified_header,
     how_many_seconds_until_midnight,
     get_var,
     throttle_api_call,
+    uclapi_protected_endpoint,
     UclApiIncorrectTokenTypeException
 )
 
+from .analytics import AnalyticsBuffer, KeenSink, MemorySink, add_event
+from .redis_pool import get_pool_stats, get_redis
+from .throttling import (
+    FixedWindowPolicy,
+    SlidingWindowPolicy,
+    TokenBucketPolicy,
+    TOKEN_TYPE_POLICIES
+)
+from .token_cache import TokenCache
+
 from .helpers import (
+    dumps_compact_json,
     generate_api_token,
     PrettyJsonResponse as JsonResponse,
-    RateLimitHttpResponse as HttpResponse
+    RateLimitHttpResponse as HttpResponse,
+    StreamingJsonResponse,
+    wants_pretty_json
 )
+from .middleware.json_compression_middleware import JsonCompressionMiddleware
 
 from dashboard.models import (
     App,
@@ -33,9 +49,11 @@ from rest_framework.test import APIRequestFactory
 from uclapi.settings import REDIS_UCLAPI_HOST
 
 import datetime
+import gzip
 import json
 import redis
 import time
+import unittest.mock
 
 class SecondsUntilMidnightTestCase(SimpleTestCase):
     def test_seconds_until_midnight(self):
@@ -75,6 +93,141 @@ class HttpResponseTestCase(TestCase):
             self.assertEqual(response[key], headers[key])
 
 
+class CompactJsonTestCase(SimpleTestCase):
+    test_factory = APIRequestFactory()
+
+    def test_compact_when_not_pretty(self):
+        response = JsonResponse(
+            {"foo": "bar", "baz": [1, 2]},
+            custom_header_data={"pretty_json": False}
+        )
+        self.assertEqual(
+            response.content.decode(),
+            '{"foo":"bar","baz":[1,2]}'
+        )
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_pretty_when_requested(self):
+        response = JsonResponse(
+            {"foo": "bar"},
+            custom_header_data={"pretty_json": True}
+        )
+        self.assertEqual(response.content.decode(), '{\n    "foo": "bar"\n}')
+
+    def test_compact_encodes_like_django(self):
+        data = {
+            "time": datetime.datetime(2019, 10, 14, 9, 30),
+            "date": datetime.date(2019, 10, 14),
+            "number": 1.5,
+            "missing": None
+        }
+        self.assertEqual(
+            json.loads(dumps_compact_json(data).decode()),
+            json.loads(JsonResponse(data).content.decode())
+        )
+
+    def test_wants_pretty_json(self):
+        request = self.test_factory.get('/test/', {'pretty': 'true'})
+        self.assertTrue(wants_pretty_json(request))
+
+        request = self.test_factory.get('/test/', {'pretty': 'false'})
+        self.assertFalse(wants_pretty_json(request))
+
+        request = self.test_factory.get(
+            '/test/',
+            HTTP_ACCEPT='text/html,application/xhtml+xml'
+        )
+        self.assertTrue(wants_pretty_json(request))
+
+        request = self.test_factory.get(
+            '/test/',
+            HTTP_ACCEPT='application/json'
+        )
+        self.assertFalse(wants_pretty_json(request))
+
+
+class StreamingJsonResponseTestCase(SimpleTestCase):
+    data = {
+        "ok": True,
+        "bookings": [
+            {"roomid": str(i), "start": datetime.datetime(2019, 10, 14, i)}
+            for i in range(10)
+        ],
+        "empty": [],
+        "count": 10
+    }
+
+    def _stream(self, custom_header_data=None):
+        data = {
+            key: iter(value) if isinstance(value, list) else value
+            for key, value in self.data.items()
+        }
+        response = StreamingJsonResponse(data, custom_header_data)
+        return b''.join(response.streaming_content)
+
+    def test_matches_pretty_response(self):
+        self.assertEqual(
+            self._stream(),
+            JsonResponse(self.data).content
+        )
+
+    def test_matches_compact_response(self):
+        header_data = {"pretty_json": False, "X-RateLimit-Limit": "1"}
+        self.assertEqual(
+            self._stream(header_data),
+            JsonResponse(self.data, header_data).content
+        )
+
+    def test_custom_headers_set(self):
+        response = StreamingJsonResponse(
+            {"bookings": iter([])},
+            custom_header_data={"Last-Modified": "1"}
+        )
+        self.assertEqual(response["Last-Modified"], "1")
+        self.assertEqual(response["Content-Type"], "application/json")
+
+
+class JsonCompressionMiddlewareTestCase(SimpleTestCase):
+    test_factory = APIRequestFactory()
+
+    def _process(self, data, **headers):
+        request = self.test_factory.get('/test/', **headers)
+        response = JsonResponse(data, custom_header_data={
+            "pretty_json": False
+        })
+        return JsonCompressionMiddleware().process_response(
+            request,
+            response
+        )
+
+    def test_large_json_gzipped(self):
+        data = {
+            "bookings": [{"roomname": "Room " + str(i)} for i in range(200)]
+        }
+        response = self._process(data, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content).decode()),
+            data
+        )
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_small_json_not_compressed(self):
+        response = self._process(
+            {"ok": True},
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_not_compressed_without_accept_encoding(self):
+        data = {
+            "bookings": [{"roomname": "Room " + str(i)} for i in range(200)]
+        }
+        response = self._process(data)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(json.loads(response.content.decode()), data)
+
+
 class GetVarTestCase(TestCase):
     test_factory = APIRequestFactory()
 
@@ -162,6 +315,81 @@ class ThrottleApiCallTest(TestCase):
             ) = throttle_api_call(token, "incorrect")
 
 
+class RedisPoolTestCase(TestCase):
+    def test_clients_share_pool(self):
+        self.assertIs(
+            get_redis().connection_pool,
+            get_redis().connection_pool
+        )
+        self.assertIsNot(
+            get_redis().connection_pool,
+            get_redis(decode_responses=True).connection_pool
+        )
+
+    def test_checkouts_counted(self):
+        r = get_redis(decode_responses=True)
+        key = generate_api_token("test")
+        r.set(key, "value", ex=10)
+        checkouts = get_pool_stats()["decoded"]["checkouts"]
+
+        self.assertEqual(r.get(key), "value")
+        self.assertEqual(
+            get_pool_stats()["decoded"]["checkouts"],
+            checkouts + 1
+        )
+        r.delete(key)
+
+
+class ThrottlePolicyTest(TestCase):
+    def setUp(self):
+        self.r = redis.Redis(host=REDIS_UCLAPI_HOST)
+        self.key = generate_api_token("test")
+
+    def tearDown(self):
+        for key in self.r.scan_iter(self.key + "*"):
+            self.r.delete(key)
+
+    def test_fixed_window(self):
+        policy = FixedWindowPolicy(2, window=60)
+        results = [policy.check(self.r, self.key) for _ in range(3)]
+
+        self.assertEqual(
+            [(throttled, remaining) for throttled, _, remaining, _ in results],
+            [(False, 1), (False, 0), (True, 0)]
+        )
+        self.assertTrue(0 < self.r.ttl(self.key) <= 60)
+
+    def test_temp_token_not_created_by_throttling(self):
+        policy = TOKEN_TYPE_POLICIES["general-temp"]
+        throttled, _, _, _ = policy.check(self.r, self.key)
+
+        self.assertFalse(throttled)
+        self.assertFalse(self.r.exists(self.key))
+
+    def test_sliding_window(self):
+        policy = SlidingWindowPolicy(3, window=60)
+        results = [policy.check(self.r, self.key) for _ in range(4)]
+
+        self.assertEqual(
+            [throttled for throttled, _, _, _ in results],
+            [False, False, False, True]
+        )
+        self.assertEqual(results[0][2], 2)
+        self.assertEqual(results[3][1], 3)
+
+    def test_token_bucket(self):
+        # A bucket that will not noticeably refill during the test
+        policy = TokenBucketPolicy(2, rate=0.001)
+        results = [policy.check(self.r, self.key) for _ in range(3)]
+
+        self.assertEqual(
+            [throttled for throttled, _, _, _ in results],
+            [False, False, True]
+        )
+        self.assertEqual(results[0][2], 1)
+        self.assertTrue(results[2][3] > 0)
+
+
 class TempTokenCheckerTest(TestCase):
     def setUp(self):
         self.valid_token = get_temp_token()
@@ -267,6 +495,38 @@ class TempTokenCheckerTest(TestCase):
         )
 
 
+@uclapi_protected_endpoint(last_modified_redis_key=None)
+def _protected_view(request, *args, **kwargs):
+    return JsonResponse({"ok": True}, custom_header_data=kwargs)
+
+
+class TempTokenThrottlingTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.token = get_temp_token()
+
+    def _get(self, path, **params):
+        params['token'] = self.token
+        return _protected_view(self.factory.get(path, params))
+
+    def test_rejected_request_not_counted(self):
+        response = self._get('/roombookings/bookings')
+        self.assertEqual(response.status_code, 200)
+        remaining = int(response['X-RateLimit-Remaining'])
+
+        for rejected in (
+            self._get('/roombookings/rooms'),
+            self._get('/roombookings/bookings', page_token='abcdefgXYZ')
+        ):
+            self.assertEqual(rejected.status_code, 400)
+
+        response = self._get('/roombookings/bookings')
+        self.assertEqual(
+            int(response['X-RateLimit-Remaining']),
+            remaining - 1
+        )
+
+
 class GeneralTokenCheckerTest(TestCase):
     def setUp(self):
         self.valid_user = User.objects.create(
@@ -360,6 +620,168 @@ class GenerateApiTokenTest(TestCase):
         )
 
 
+class FailingSink():
+    def send(self, events):
+        raise ConnectionError
+
+
+class AnalyticsBufferTestCase(SimpleTestCase):
+    def test_events_sent_in_batches(self):
+        sink = MemorySink()
+        buffer = AnalyticsBuffer(sink, batch_size=2, autostart=False)
+        for i in range(3):
+            buffer.add("apicall", {"i": i})
+        buffer.add("other", {"i": 3})
+
+        self.assertTrue(buffer.flush())
+        self.assertEqual(sink.batches, [
+            {"apicall": [{"i": 0}, {"i": 1}]},
+            {"apicall": [{"i": 2}], "other": [{"i": 3}]}
+        ])
+        self.assertEqual(buffer.get_stats()["sent"], 4)
+        self.assertEqual(buffer.get_stats()["buffered"], 0)
+
+    def test_oldest_events_dropped_when_full(self):
+        sink = MemorySink()
+        buffer = AnalyticsBuffer(sink, capacity=2, autostart=False)
+        for i in range(3):
+            buffer.add("apicall", {"i": i})
+
+        buffer.flush()
+        self.assertEqual(sink.batches, [
+            {"apicall": [{"i": 1}, {"i": 2}]}
+        ])
+        self.assertEqual(buffer.get_stats()["dropped"], 1)
+
+    def test_failed_batch_kept(self):
+        buffer = AnalyticsBuffer(FailingSink(), autostart=False)
+        buffer.add("apicall", {"i": 0})
+
+        self.assertFalse(buffer.flush())
+        stats = buffer.get_stats()
+        self.assertEqual(stats["buffered"], 1)
+        self.assertEqual(stats["failed_batches"], 1)
+        self.assertTrue(stats["backoff"] > 0)
+
+        sink = MemorySink()
+        buffer.sink = sink
+        self.assertTrue(buffer.flush())
+        self.assertEqual(sink.batches, [{"apicall": [{"i": 0}]}])
+        self.assertEqual(buffer.get_stats()["backoff"], 0)
+
+    @unittest.mock.patch("common.analytics.analytics_buffer")
+    def test_event_timestamped_when_added(self, analytics_buffer):
+        add_event("apicall", {"i": 0})
+
+        collection, event = analytics_buffer.add.call_args[0]
+        self.assertEqual(collection, "apicall")
+        self.assertTrue(event["keen"]["timestamp"].endswith("+00:00"))
+
+
+class KeenSinkTestCase(SimpleTestCase):
+    @unittest.mock.patch("common.analytics.keen.add_events")
+    def test_rejected_events_logged(self, add_events):
+        add_events.return_value = {
+            "apicall": [
+                {"success": True},
+                {"success": False, "error": {"name": "InvalidEvent"}}
+            ]
+        }
+
+        with self.assertLogs("common.analytics", "ERROR") as logs:
+            KeenSink().send({"apicall": [{"i": 0}, {"i": 1}]})
+        self.assertIn("Keen rejected 1 of 2 apicall events", logs.output[0])
+
+
+class TokenCacheTestCase(SimpleTestCase):
+    def test_get_and_set(self):
+        cache = TokenCache(max_size=10, ttl=60)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_least_recently_used_evicted(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # Touch a so that b becomes the least recently used entry
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expired_entries_dropped(self):
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set("a", 1)
+        cache.ttl = -1
+        cache.set("b", 2)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 1)
+
+    def test_invalidate_tag(self):
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set("a", 1, tags=(("app", "A1"), ("user", 1)))
+        cache.set("b", 2, tags=(("app", "A2"), ("user", 1)))
+        cache.set("c", 3, tags=(("app", "A3"), ("user", 2)))
+
+        cache.invalidate_tag(("app", "A2"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+        cache.invalidate_tag(("user", 1))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), 3)
+
+
+class TokenCacheInvalidationTest(TestCase):
+    def setUp(self):
+        self.valid_user = User.objects.create(
+            email="testusercache@ucl.ac.uk",
+            full_name="Test User",
+            given_name="Test",
+            cn="testcache",
+            department="Dept. of Tests",
+            employee_id="TESTCACHE1",
+            raw_intranet_groups="test1;test2",
+            agreement=True
+        )
+        self.valid_app = App.objects.create(
+            user=self.valid_user,
+            name="Test App"
+        )
+
+    def test_regenerated_token_rejected(self):
+        old_token = self.valid_app.api_token
+        result = _check_general_token_issues(old_token, False)
+        self.assertEqual(result.api_token, old_token)
+
+        self.valid_app.regenerate_token()
+
+        result = _check_general_token_issues(old_token, False)
+        self.assertTrue(isinstance(result, JsonResponse))
+        data = json.loads(result.content.decode())
+        self.assertEqual(data['error'], "Token does not exist.")
+
+    def test_deleted_app_rejected(self):
+        token = self.valid_app.api_token
+        result = _check_general_token_issues(token, False)
+        self.assertEqual(result.api_token, token)
+
+        self.valid_app.deleted = True
+        self.valid_app.save()
+
+        result = _check_general_token_issues(token, False)
+        self.assertTrue(isinstance(result, JsonResponse))
+        self.assertEqual(result.status_code, 400)
+
+
 class OAuthTokenCheckerTest(TestCase):
     def setUp(self):
         self.valid_user = User.objects.create(
@@ -541,6 +963,17 @@ class LastModifiedHeaderTestCase(TestCase):
         )
         r.delete(redis_key)
 
+    def test_formatting_memoised(self):
+        value = b"2019-01-24T00:10:05+01:00"
+        _format_last_modified(value)
+        hits = _format_last_modified.cache_info().hits
+
+        self.assertEqual(
+            _format_last_modified(value),
+            "Wed, 23 Jan 2019 23:10:05 GMT"
+        )
+        self.assertEqual(_format_last_modified.cache_info().hits, hits + 1)
+
     def test_current_time_case_1(self):
         last_modified_header = _get_last_modified_header()
         current_time = datetime.datetime.utcnow()
@@ -0,0 +1,230 @@
+import datetime
+import math
+import time
+
+
+def how_many_seconds_until_midnight():
+    """Returns the number of seconds until midnight."""
+    tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
+    midnight = datetime.datetime(
+        year=tomorrow.year, month=tomorrow.month,
+        day=tomorrow.day, hour=0, minute=0, second=0
+    )
+    return (midnight - datetime.datetime.now()).seconds
+
+
+# Every policy is implemented as a single Lua script so that reading and
+# updating the counter happens atomically inside Redis, no matter how many
+# workers are serving the same token at once. Scripts are sent with EVAL
+# rather than EVALSHA so that they can be pipelined with other commands
+# without an extra round-trip to check that Redis has them loaded.
+
+# KEYS[1]: counter key
+# ARGV[1]: seconds until the window resets
+# Returns: the number of calls made in this window, including this one
+FIXED_WINDOW_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+# As above, but nothing is counted (and 0 is returned) if the key does not
+# already exist.
+EXISTING_FIXED_WINDOW_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+# KEYS[1]: counter key for the current window
+# KEYS[2]: counter key for the previous window
+# ARGV[1]: limit
+# ARGV[2]: fraction of the current window that has elapsed
+# ARGV[3]: window length in seconds
+# Returns: {allowed (1 or 0), weighted number of calls in the window}
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local elapsed = tonumber(ARGV[2])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local weighted = math.floor(previous * (1 - elapsed)) + current
+if weighted >= limit then
+    return {0, weighted}
+end
+current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], 2 * tonumber(ARGV[3]))
+end
+return {1, weighted + 1}
+"""
+
+# KEYS[1]: bucket hash key
+# ARGV[1]: bucket capacity
+# ARGV[2]: tokens added per second
+# ARGV[3]: current UNIX timestamp
+# Returns: {allowed (1 or 0), thousandths of a token left in the bucket}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, math.floor(tokens * 1000)}
+"""
+
+
+class ThrottlePolicy():
+    """
+    Base class for rate limiting policies.
+
+    queue() adds the policy's script to a Redis pipeline so that it can be
+    sent along with other commands, and returns a function that turns the
+    script's reply into a tuple of (throttled, limit, remaining, reset_secs),
+    which is what throttle_api_call has always returned.
+    """
+
+    def queue(self, pipe, key):
+        raise NotImplementedError
+
+    def check(self, client, key):
+        pipe = client.pipeline(transaction=False)
+        finish = self.queue(pipe, key)
+        return finish(pipe.execute()[0])
+
+
+class FixedWindowPolicy(ThrottlePolicy):
+    """
+    Allows limit calls per window. By default the window runs until
+    midnight, which gives every token a daily allowance.
+
+    With require_existing, calls are only counted against keys that already
+    exist. This is used for temporary tokens, whose counter is the key that
+    marks them as valid in the first place, so that a bad token can never
+    create itself by being throttled.
+    """
+
+    def __init__(self, limit, window=None, require_existing=False):
+        self.limit = limit
+        self.window = window
+        self.script_source = (
+            EXISTING_FIXED_WINDOW_SCRIPT if require_existing
+            else FIXED_WINDOW_SCRIPT
+        )
+
+    def _seconds_until_reset(self):
+        if self.window is None:
+            return how_many_seconds_until_midnight()
+        return self.window - int(time.time()) % self.window
+
+    def queue(self, pipe, key):
+        secs = self._seconds_until_reset()
+        # EXPIRE with a TTL of zero deletes the key straight away
+        pipe.eval(self.script_source, 1, key, max(secs, 1))
+
+        def finish(count):
+            return (
+                count > self.limit,
+                self.limit,
+                max(self.limit - count, 0),
+                secs
+            )
+        return finish
+
+
+class SlidingWindowPolicy(ThrottlePolicy):
+    """
+    Allows limit calls in any period of window seconds. The count for the
+    previous window is weighted by how much of it still overlaps the
+    sliding window, which avoids the burst at the boundary of fixed
+    windows while only storing two counters per token.
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    def queue(self, pipe, key):
+        now = time.time()
+        current_window = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+        pipe.eval(
+            SLIDING_WINDOW_SCRIPT,
+            2,
+            "{}:{}".format(key, current_window),
+            "{}:{}".format(key, current_window - 1),
+            self.limit,
+            elapsed,
+            self.window
+        )
+
+        def finish(reply):
+            allowed, count = reply
+            return (
+                not allowed,
+                self.limit,
+                max(self.limit - count, 0),
+                int(math.ceil(self.window - now % self.window))
+            )
+        return finish
+
+
+class TokenBucketPolicy(ThrottlePolicy):
+    """
+    Allows bursts of up to capacity calls, refilled continuously at rate
+    calls per second.
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+
+    def queue(self, pipe, key):
+        pipe.eval(
+            TOKEN_BUCKET_SCRIPT,
+            1,
+            key,
+            self.capacity,
+            self.rate,
+            time.time()
+        )
+
+        def finish(reply):
+            allowed, millitokens = reply
+            tokens = millitokens / 1000
+            if allowed:
+                reset_secs = 0
+            else:
+                reset_secs = int(math.ceil((1 - tokens) / self.rate))
+            return (
+                not allowed,
+                self.capacity,
+                int(tokens),
+                reset_secs
+            )
+        return finish
+
+
+# The policy applied to each type of token accepted by
+# uclapi_protected_endpoint.
+TOKEN_TYPE_POLICIES = {
+    "general": FixedWindowPolicy(10000),
+    "general-temp": FixedWindowPolicy(10, require_existing=True),
+    "oauth": FixedWindowPolicy(10000),
+    "test-token": FixedWindowPolicy(1),
+}
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+# How many tokens each worker process will remember at once, and how long
+# (in seconds) a resolved token may be served from memory before we go back
+# to the database. The TTL bounds how stale a token can be in *other* worker
+# processes after it has been changed, as invalidation is only local.
+TOKEN_CACHE_MAX_SIZE = 10000
+TOKEN_CACHE_TTL = 60
+
+
+class TokenCache():
+    """
+    A bounded, thread safe LRU cache with a per entry time to live.
+
+    Each entry can be tagged (e.g. with the ID of the app or user that the
+    token belongs to) so that every token affected by a change to a single
+    database row can be dropped at once.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_MAX_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value for key, or None if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expiry, _ = entry
+            if expiry < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, tags=()):
+        with self._lock:
+            self._entries[key] = (
+                value,
+                time.monotonic() + self.ttl,
+                frozenset(tags)
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_tag(self, tag):
+        """Drops every entry that was stored with the given tag"""
+        with self._lock:
+            stale_keys = [
+                key for key, (_, _, tags) in self._entries.items()
+                if tag in tags
+            ]
+            for key in stale_keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# The process-wide cache used by uclapi_protected_endpoint
+token_cache = TokenCache()
+
+
+def invalidate_app(app_id):
+    token_cache.invalidate_tag(("app", app_id))
+
+
+def invalidate_user(user_id):
+    token_cache.invalidate_tag(("user", user_id))
+
+
+def invalidate_scope(scope_id):
+    token_cache.invalidate_tag(("scope", scope_id))
+
+
+def invalidate_oauth_token(oauth_token_id):
+    token_cache.invalidate_tag(("oauthtoken", oauth_token_id))
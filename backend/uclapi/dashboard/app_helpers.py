@@ -2,20 +2,19 @@ from binascii import hexlify
 from random import SystemRandom
 
 from common.helpers import generate_api_token
+from common.redis_pool import get_redis
 from uclapi.settings import (
     MEDIUM_ARTICLE_QUANTITY,
-    REDIS_UCLAPI_HOST,
     DEBUG
 )
 from django.core.management import call_command
 import os
-import redis
 import textwrap
 import validators
 
 
 def get_articles():
-    r = redis.Redis(host=REDIS_UCLAPI_HOST)
+    r = get_redis()
     if not r.exists("Blog:item:1:url"):
         if DEBUG:
             call_command('update_medium')
@@ -41,7 +40,7 @@ def generate_temp_api_token():
 
 
 def get_temp_token():
-    r = redis.Redis(host=REDIS_UCLAPI_HOST)
+    r = get_redis()
 
     token = generate_temp_api_token()
     # We initialise a new temporary token and set it to 1
@@ -8,10 +8,11 @@ from .app_helpers import (
 )
 
 from common.helpers import generate_api_token
+from common.token_cache import invalidate_app, invalidate_user
 
 from oauth.models import OAuthScope
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 models.options.DEFAULT_NAMES += ('_DATABASE',)
@@ -132,3 +133,17 @@ def create_webhook_on_app_creation(sender, instance, created, **kwargs):
     if created:
         new_webhook = Webhook(app=instance)
         new_webhook.save()
+
+
+# Django signals to drop cached tokens whenever the rows they were resolved
+# from change, e.g. when a token is regenerated or an app is deleted.
+@receiver(post_save, sender=App)
+@receiver(post_delete, sender=App)
+def invalidate_cached_app_tokens(sender, instance, **kwargs):
+    invalidate_app(instance.id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_tokens(sender, instance, **kwargs):
+    invalidate_user(instance.id)
@@ -1,4 +1,8 @@
 import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest.mock import patch
 
 from django.test import RequestFactory, TestCase
@@ -10,7 +14,12 @@ from .app_helpers import is_url_safe, generate_api_token, \
     generate_app_client_id, generate_app_client_secret, \
     generate_app_id, get_articles
 from .middleware.fake_shibboleth_middleware import FakeShibbolethMiddleWare
-from .models import App, User
+from .models import App, User, Webhook, WebhookTriggerHistory
+from .webhook_delivery import (
+    WebhookDeliveryService,
+    create_delivery,
+    record_fired_webhooks
+)
 from .webhook_views import (
     edit_webhook, refresh_verification_secret, user_owns_app, verify_ownership
 )
@@ -1007,3 +1016,200 @@ class ApiApplicationsTestCase(TestCase):
         )
         app_ = App.objects.filter(id=app_.id, user=user_.id)[0]
         self.assertEqual(app_.scope.scope_number, 2)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeWebhookReceiver():
+    """
+    A local HTTP server standing in for an app's webhook endpoint. It
+    records what it is sent, answers with the given status codes in turn
+    (then 200) after an optional delay, and tracks how many requests it was
+    handling at once.
+    """
+
+    def __init__(self, status_codes=(), delay=0):
+        self.status_codes = list(status_codes)
+        self.delay = delay
+        self.received = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with receiver._lock:
+                    receiver.received.append((
+                        json.loads(body.decode()),
+                        self.headers["User-Agent"]
+                    ))
+                    receiver.in_flight += 1
+                    receiver.max_in_flight = max(
+                        receiver.max_in_flight,
+                        receiver.in_flight
+                    )
+                    status_code = (
+                        receiver.status_codes.pop(0)
+                        if receiver.status_codes else 200
+                    )
+
+                time.sleep(receiver.delay)
+                with receiver._lock:
+                    receiver.in_flight -= 1
+
+                self.send_response(status_code)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}/webhook".format(
+            self.server.server_address[1]
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WebhookDeliveryTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create(cn="test", employee_id=7357)
+        self.app = App.objects.create(user=user, name="An App")
+        self.webhook = Webhook.objects.get(app=self.app)
+        self.receivers = []
+
+        self.retry_key = "test:webhooks:delivery:retries"
+        self.metrics_key = "test:webhooks:delivery:metrics"
+        self.r = redis.Redis(host=settings.REDIS_UCLAPI_HOST)
+        self.r.delete(self.retry_key, self.metrics_key)
+
+    def tearDown(self):
+        for receiver in self.receivers:
+            receiver.close()
+        self.r.delete(self.retry_key, self.metrics_key)
+
+    def _receiver(self, **kwargs):
+        receiver = FakeWebhookReceiver(**kwargs)
+        self.receivers.append(receiver)
+        self.webhook.url = receiver.url
+        self.webhook.save()
+        return receiver
+
+    def _service(self, **kwargs):
+        kwargs.setdefault("timeout", 2)
+        kwargs.setdefault("retry_delay", 60)
+        return WebhookDeliveryService(
+            retry_key=self.retry_key,
+            metrics_key=self.metrics_key,
+            **kwargs
+        )
+
+    def test_delivered(self):
+        receiver = self._receiver()
+        service = self._service()
+
+        results = service.deliver([
+            create_delivery(self.webhook, {"content": "hello"})
+        ])
+
+        self.assertTrue(results[0].delivered)
+        self.assertEqual(results[0].status_code, 200)
+        self.assertEqual(
+            receiver.received,
+            [({"content": "hello"}, "uclapi-bot/1")]
+        )
+        self.assertEqual(service.get_stats()["delivered"], 1)
+        self.assertEqual(int(self.r.hget(self.metrics_key, "delivered")), 1)
+
+    def test_failure_retried(self):
+        receiver = self._receiver(status_codes=[500])
+        service = self._service(retry_delay=0.1)
+
+        results = service.deliver([
+            create_delivery(self.webhook, {"content": "hello"})
+        ])
+        self.assertFalse(results[0].delivered)
+        self.assertEqual(service.get_stats()["retries_scheduled"], 1)
+        # Not due yet
+        self.assertEqual(service.take_due_retries(), [])
+
+        time.sleep(0.2)
+        retries = service.take_due_retries()
+        self.assertEqual(len(retries), 1)
+        self.assertEqual(retries[0]["attempts"], 1)
+        self.assertEqual(self.r.zcard(self.retry_key), 0)
+
+        results = service.deliver(retries)
+        self.assertTrue(results[0].delivered)
+        self.assertEqual(len(receiver.received), 2)
+
+    def test_backoff(self):
+        service = self._service(retry_delay=10)
+        self.assertEqual(service._get_retry_delay(1), 10)
+        self.assertEqual(service._get_retry_delay(3), 40)
+
+    def test_given_up_after_max_attempts(self):
+        self._receiver(status_codes=[500])
+        service = self._service(max_attempts=1)
+
+        service.deliver([create_delivery(self.webhook, {})])
+
+        self.assertEqual(service.get_stats()["abandoned"], 1)
+        self.assertEqual(self.r.zcard(self.retry_key), 0)
+
+    def test_timeout(self):
+        self._receiver(delay=1)
+        service = self._service(timeout=0.1)
+
+        results = service.deliver([create_delivery(self.webhook, {})])
+
+        self.assertFalse(results[0].delivered)
+        self.assertIsNone(results[0].status_code)
+        self.assertIsNotNone(results[0].error)
+
+    def test_host_limit(self):
+        receiver = self._receiver(delay=0.2)
+        service = self._service(workers=8, host_limit=2)
+
+        results = service.deliver([
+            create_delivery(self.webhook, {"n": n}) for n in range(8)
+        ])
+
+        self.assertTrue(all(result.delivered for result in results))
+        self.assertEqual(len(receiver.received), 8)
+        self.assertLessEqual(receiver.max_in_flight, 2)
+
+    def test_retry_dropped_when_url_changes(self):
+        self._receiver(status_codes=[500])
+        service = self._service(retry_delay=0.1)
+        service.deliver([create_delivery(self.webhook, {})])
+
+        self.webhook.url = "http://127.0.0.1:1/elsewhere"
+        self.webhook.save()
+        time.sleep(0.2)
+
+        self.assertEqual(service.take_due_retries(), [])
+
+    def test_record_fired_webhooks(self):
+        other_app = App.objects.create(user=self.app.user, name="Another")
+        other_webhook = Webhook.objects.get(app=other_app)
+
+        with self.assertNumQueries(2):
+            record_fired_webhooks([
+                (self.webhook, {"content": 1}),
+                (other_webhook, {"content": 2})
+            ])
+
+        self.assertEqual(WebhookTriggerHistory.objects.count(), 2)
+        self.assertEqual(
+            Webhook.objects.filter(last_fired__isnull=False).count(),
+            2
+        )
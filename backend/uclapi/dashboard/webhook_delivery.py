@@ -0,0 +1,286 @@
+import json
+import logging
+import threading
+import time
+import uuid
+
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, zip_longest
+from urllib.parse import urlparse
+
+import requests
+
+from django.conf import settings
+from django.utils import timezone
+
+from common.redis_pool import get_redis
+
+from .models import Webhook, WebhookTriggerHistory
+
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of deliveries waiting to be retried, scored by when they are due
+RETRY_KEY = "webhooks:delivery:retries"
+# Hash of delivery counters, added to by every run
+METRICS_KEY = "webhooks:delivery:metrics"
+
+# The longest a retry is ever put off for, however many times it has failed
+MAX_RETRY_DELAY = 6 * 60 * 60
+
+USER_AGENT = "uclapi-bot/1"
+
+DeliveryResult = namedtuple(
+    "DeliveryResult",
+    ["delivery", "delivered", "status_code", "latency", "error"]
+)
+
+
+def create_delivery(webhook, payload):
+    """
+    Returns a delivery of payload to webhook. Deliveries are plain
+    dictionaries so that they can be stored in the retry queue as JSON.
+    """
+    return {
+        "id": uuid.uuid4().hex,
+        "webhook_id": webhook.id,
+        "url": webhook.url,
+        "payload": payload,
+        "attempts": 0
+    }
+
+
+def _get_host(delivery):
+    return urlparse(delivery["url"]).netloc.lower()
+
+
+def _interleave_by_host(deliveries):
+    # Spreading each host's deliveries out stops workers from piling up
+    # behind one host's concurrency limit while other hosts are idle
+    by_host = OrderedDict()
+    for delivery in deliveries:
+        by_host.setdefault(_get_host(delivery), []).append(delivery)
+    return [
+        delivery
+        for delivery in chain.from_iterable(zip_longest(*by_host.values()))
+        if delivery is not None
+    ]
+
+
+class WebhookDeliveryService():
+    """
+    Posts webhooks from a bounded pool of threads, with at most host_limit
+    requests in flight to any one host and a timeout on every request.
+
+    A delivery fails if the request errors, times out or gets anything but
+    a 2xx response. Failed deliveries are put in a queue in Redis to be
+    retried with exponential backoff by a later run (see take_due_retries),
+    until they have been attempted max_attempts times.
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        host_limit=None,
+        timeout=None,
+        max_attempts=None,
+        retry_delay=None,
+        retry_key=RETRY_KEY,
+        metrics_key=METRICS_KEY
+    ):
+        self.workers = workers or settings.WEBHOOK_DELIVERY_WORKERS
+        self.host_limit = host_limit or settings.WEBHOOK_DELIVERY_HOST_LIMIT
+        self.timeout = timeout or settings.WEBHOOK_DELIVERY_TIMEOUT
+        self.max_attempts = (
+            max_attempts or settings.WEBHOOK_DELIVERY_MAX_ATTEMPTS
+        )
+        self.retry_delay = (
+            retry_delay or settings.WEBHOOK_DELIVERY_RETRY_DELAY
+        )
+        self.retry_key = retry_key
+        self.metrics_key = metrics_key
+
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.workers,
+            pool_maxsize=self.host_limit
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+        self.attempted = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries_scheduled = 0
+        self.abandoned = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _get_host_semaphore(self, delivery):
+        host = _get_host(delivery)
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(
+                    self.host_limit
+                )
+            return self._host_semaphores[host]
+
+    def _post(self, delivery):
+        with self._get_host_semaphore(delivery):
+            start_time = time.monotonic()
+            try:
+                response = self._session.post(
+                    delivery["url"],
+                    json=delivery["payload"],
+                    headers={"User-Agent": USER_AGENT},
+                    timeout=self.timeout
+                )
+            except requests.exceptions.RequestException as e:
+                return DeliveryResult(
+                    delivery,
+                    False,
+                    None,
+                    time.monotonic() - start_time,
+                    str(e)
+                )
+
+        return DeliveryResult(
+            delivery,
+            200 <= response.status_code < 300,
+            response.status_code,
+            time.monotonic() - start_time,
+            None
+        )
+
+    def deliver(self, deliveries):
+        """
+        Posts every delivery and queues the ones that failed to be retried.
+        Returns a DeliveryResult for each delivery.
+        """
+        if not deliveries:
+            return []
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            results = list(executor.map(
+                self._post,
+                _interleave_by_host(deliveries)
+            ))
+
+        retries = []
+        for result in results:
+            delivery = result.delivery
+            delivery["attempts"] += 1
+            if result.delivered:
+                continue
+
+            if delivery["attempts"] < self.max_attempts:
+                retries.append(delivery)
+            else:
+                logger.error(
+                    "Giving up on webhook %s to %s after %d attempts: %s",
+                    delivery["webhook_id"],
+                    delivery["url"],
+                    delivery["attempts"],
+                    result.error or result.status_code
+                )
+
+        self._schedule_retries(retries)
+        self._record_metrics(results, len(retries))
+        return results
+
+    def _get_retry_delay(self, attempts):
+        return min(self.retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+    def _schedule_retries(self, deliveries):
+        if not deliveries:
+            return
+
+        now = time.time()
+        get_redis().zadd(self.retry_key, {
+            json.dumps(delivery): (
+                now + self._get_retry_delay(delivery["attempts"])
+            )
+            for delivery in deliveries
+        })
+
+    def take_due_retries(self):
+        """
+        Removes the deliveries that are due to be retried from the queue and
+        returns them. Retries for webhooks that have since been deleted or
+        pointed somewhere else are dropped.
+        """
+        now = time.time()
+        pipe = get_redis(decode_responses=True).pipeline(transaction=True)
+        pipe.zrangebyscore(self.retry_key, "-inf", now)
+        pipe.zremrangebyscore(self.retry_key, "-inf", now)
+        due, _ = pipe.execute()
+
+        deliveries = [json.loads(delivery) for delivery in due]
+        urls = dict(Webhook.objects.filter(
+            id__in=[delivery["webhook_id"] for delivery in deliveries]
+        ).values_list("id", "url"))
+        return [
+            delivery for delivery in deliveries
+            if urls.get(delivery["webhook_id"]) == delivery["url"]
+        ]
+
+    def _record_metrics(self, results, retries_scheduled):
+        delivered = sum(1 for result in results if result.delivered)
+        failed = len(results) - delivered
+        abandoned = failed - retries_scheduled
+        latencies = [result.latency for result in results]
+
+        with self._lock:
+            self.attempted += len(results)
+            self.delivered += delivered
+            self.failed += failed
+            self.retries_scheduled += retries_scheduled
+            self.abandoned += abandoned
+            self.latency_total += sum(latencies)
+            self.latency_max = max([self.latency_max] + latencies)
+
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hincrby(self.metrics_key, "attempted", len(results))
+        pipe.hincrby(self.metrics_key, "delivered", delivered)
+        pipe.hincrby(self.metrics_key, "failed", failed)
+        pipe.hincrby(self.metrics_key, "retries_scheduled", retries_scheduled)
+        pipe.hincrby(self.metrics_key, "abandoned", abandoned)
+        pipe.hincrbyfloat(self.metrics_key, "latency_total", sum(latencies))
+        pipe.execute()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "attempted": self.attempted,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "retries_scheduled": self.retries_scheduled,
+                "abandoned": self.abandoned,
+                "average_latency": (
+                    self.latency_total / self.attempted
+                    if self.attempted else 0
+                ),
+                "max_latency": self.latency_max
+            }
+
+
+def record_fired_webhooks(fired):
+    """
+    Saves a WebhookTriggerHistory entry for each (webhook, payload) in fired
+    and sets when the webhooks were last fired, in two queries rather than
+    two per webhook.
+    """
+    if not fired:
+        return
+
+    WebhookTriggerHistory.objects.bulk_create([
+        WebhookTriggerHistory(webhook=webhook, payload=payload)
+        for webhook, payload in fired
+    ])
+    Webhook.objects.filter(
+        id__in=[webhook.id for webhook, _ in fired]
+    ).update(last_fired=timezone.now())
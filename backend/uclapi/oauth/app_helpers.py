@@ -2,7 +2,8 @@ import os
 import textwrap
 from binascii import hexlify
 
-from timetable.models import Lock, StudentsA, StudentsB
+from timetable.lock_cache import get_lock
+from timetable.models import StudentsA, StudentsB
 
 def generate_user_token():
     key = hexlify(os.urandom(30)).decode()
@@ -21,7 +22,7 @@ def generate_random_verification_code():
 def get_student_by_upi(upi):
     """Returns a StudentA or StudentB object by UPI"""
     students = StudentsA \
-               if Lock.objects.all()[0].a \
+               if get_lock().a \
                else StudentsB
 
     # Assume the current Set ID due to caching
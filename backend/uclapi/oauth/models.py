@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from common.token_cache import invalidate_oauth_token, invalidate_scope
 
 from .app_helpers import generate_user_token
 
@@ -44,3 +48,17 @@ class OAuthToken(models.Model):
 
     # Whether the token is active or not
     active = models.BooleanField(default=True)
+
+
+# Django signals to drop cached tokens whenever the rows they were resolved
+# from change, e.g. when a user denies an app access to their data.
+@receiver(post_save, sender=OAuthToken)
+@receiver(post_delete, sender=OAuthToken)
+def invalidate_cached_oauth_token(sender, instance, **kwargs):
+    invalidate_oauth_token(instance.id)
+
+
+@receiver(post_save, sender=OAuthScope)
+@receiver(post_delete, sender=OAuthScope)
+def invalidate_cached_scope_tokens(sender, instance, **kwargs):
+    invalidate_scope(instance.id)
@@ -1,7 +1,6 @@
 import json
 import os
 
-import redis
 from django.core import signing
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.signing import TimestampSigner
@@ -23,9 +22,9 @@ from .app_helpers import (
 from .models import OAuthToken
 from .scoping import Scopes
 
-from uclapi.settings import REDIS_UCLAPI_HOST
 from common.decorators import uclapi_protected_endpoint, get_var
 from common.helpers import PrettyJsonResponse
+from common.redis_pool import get_redis
 
 
 # The endpoint that creates a Shibboleth login and redirects the user to it
@@ -311,7 +310,7 @@ def userallow(request):
 
     code = generate_random_verification_code()
 
-    r = redis.Redis(host=REDIS_UCLAPI_HOST)
+    r = get_redis()
 
     verification_data = {
         "client_id": app.client_id,
@@ -352,7 +351,7 @@ def token(request):
         response.status_code = 400
         return response
 
-    r = redis.Redis(host=REDIS_UCLAPI_HOST)
+    r = get_redis()
     try:
         data_json = r.get(code).decode('ascii')
 
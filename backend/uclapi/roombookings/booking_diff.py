@@ -0,0 +1,87 @@
+import hashlib
+
+from collections import defaultdict
+
+from .helpers import _serialize_booking
+
+
+# The fields that make up a booking as webhooks see it (see
+# _serialize_booking). A change to any other field is not a change to the
+# booking as far as webhooks are concerned.
+HASHED_FIELDS = (
+    "roomname",
+    "siteid",
+    "roomid",
+    "title",
+    "startdatetime",
+    "finishdatetime",
+    "condisplayname",
+    "slotid",
+    "weeknumber",
+    "phone"
+)
+
+_SLOTID_POSITION = HASHED_FIELDS.index("slotid")
+
+# Number of changed bookings to fetch from the database at once
+FETCH_BATCH_SIZE = 1000
+
+
+def booking_hash(values):
+    """Returns a hash of a booking's HASHED_FIELDS values"""
+    return hashlib.md5(repr(tuple(values)).encode("utf-8")).digest()
+
+
+def _index_bookings(rows):
+    # (slotid, hash) -> IDs of every booking with that key. Only the keys
+    # are kept, so memory use does not depend on how big bookings are.
+    index = defaultdict(list)
+    for row in rows:
+        values = row[1:]
+        index[(values[_SLOTID_POSITION], booking_hash(values))].append(
+            row[0]
+        )
+    return index
+
+
+def _difference(index, other_index):
+    # IDs of the bookings in index that have no counterpart in other_index.
+    # Keys are compared as multisets, just like DeepDiff's ignore_order.
+    ids = []
+    for key, key_ids in index.items():
+        excess = len(key_ids) - len(other_index.get(key, ()))
+        if excess > 0:
+            ids.extend(key_ids[:excess])
+    return ids
+
+
+class BookingDiff():
+    """
+    Finds the bookings added and removed between two sets of bookings.
+
+    Each set is given as an iterable of (id, *HASHED_FIELDS) tuples, which
+    is read once and never held in memory. A booking whose details have
+    changed is counted as removed and then added again.
+    """
+
+    def __init__(self, old_rows, new_rows):
+        old_index = _index_bookings(old_rows)
+        new_index = _index_bookings(new_rows)
+
+        self.added_ids = _difference(new_index, old_index)
+        self.removed_ids = _difference(old_index, new_index)
+
+
+def get_booking_rows(queryset):
+    """Streams the rows that BookingDiff needs from a queryset of bookings"""
+    return queryset.values_list('id', *HASHED_FIELDS).iterator()
+
+
+def iter_serialized_bookings(queryset, ids):
+    """Serialises the bookings in queryset with the given IDs, in batches"""
+    for start in range(0, len(ids), FETCH_BATCH_SIZE):
+        bookings = queryset.filter(
+            id__in=ids[start:start + FETCH_BATCH_SIZE]
+        ).order_by('startdatetime', 'id')
+        for booking in bookings:
+            yield _serialize_booking(booking)
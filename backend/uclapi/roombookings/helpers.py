@@ -1,26 +1,33 @@
 from __future__ import unicode_literals
 
+import bisect
 import datetime
 import json
 from datetime import timedelta
 
 import ciso8601
 import pytz
-import redis
 
 from django.conf import settings
+from django.core import signing
 from django.core.exceptions import FieldError
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.models import Q
 
 from .api_helpers import generate_token
 from .models import BookingA, BookingB, Location, SiteLocation
-from common.helpers import PrettyJsonResponse
-from timetable.models import Lock
+from common.helpers import PrettyJsonResponse, StreamingJsonResponse
+from common.redis_pool import get_redis
+from timetable.lock_cache import get_lock
 
 
 TOKEN_EXPIRY_TIME = 30 * 60
 
+LONDON_TIMEZONE = pytz.timezone("Europe/London")
+
+# Keeps signed page tokens from being valid anywhere else that signs data
+# with the secret key
+PAGE_TOKEN_SALT = "roombookings.page_token"
+
 ROOM_TYPE_MAP = {
     "AN": "Anechoic Chamber",
     "CI": "Clinic Room",
@@ -46,85 +53,225 @@ ROOM_TYPE_MAP = {
 
 
 def _create_page_token(query, pagination):
-    r = redis.Redis(host=settings.REDIS_UCLAPI_HOST)
     page_data = {
         "current_page": 0,
         "pagination": pagination,
         "query": json.dumps(query, default=str),
+        # The (startdatetime, id) of the last booking sent. Tokens without
+        # a cursor predate keyset pagination and are paged by offset.
+        "cursor": None,
+        # Counted once, when the first page is fetched
+        "count": None
     }
+    if settings.ROOMBOOKINGS_SIGNED_PAGE_TOKENS:
+        return _sign_page_data(page_data)
+
     page_token = generate_token()
-    r.set(page_token, json.dumps(page_data), ex=TOKEN_EXPIRY_TIME)
+    _save_page_data(page_token, page_data)
     return page_token
 
 
-def _get_paginated_bookings(page_token):
-    r = redis.Redis(host=settings.REDIS_UCLAPI_HOST)
+def _sign_page_data(page_data):
+    return signing.dumps(page_data, salt=PAGE_TOKEN_SALT, compress=True)
+
+
+def _is_signed_page_token(page_token):
+    # Tokens stored in Redis are purely alphanumeric, whereas signed
+    # tokens always include a separator before the signature
+    return ":" in page_token
+
+
+def _load_page_data(page_token):
+    """
+    Returns the pagination state for page_token, or None if the token does
+    not exist or has expired.
+
+    Signed tokens carry their own state, which can be trusted as long as
+    the signature matches, and expire TOKEN_EXPIRY_TIME seconds after they
+    were issued. Other tokens are looked up in Redis.
+    """
+    if _is_signed_page_token(page_token):
+        try:
+            return signing.loads(
+                page_token,
+                salt=PAGE_TOKEN_SALT,
+                max_age=TOKEN_EXPIRY_TIME
+            )
+        except signing.BadSignature:
+            # Also raised when the token has expired
+            return None
+
+    r = get_redis()
     try:
-        page_data = json.loads(r.get(page_token).decode('ascii'))
+        return json.loads(r.get(page_token).decode('ascii'))
     except (AttributeError, json.decoder.JSONDecodeError):
+        return None
+
+
+def _save_page_data(page_token, page_data):
+    """
+    Stores the pagination state for page_token, returning the token that
+    the client should use to get the next page. Signed tokens cannot be
+    changed, so a new one is issued instead.
+    """
+    if _is_signed_page_token(page_token):
+        return _sign_page_data(page_data)
+
+    r = get_redis()
+    r.set(page_token, json.dumps(page_data), ex=TOKEN_EXPIRY_TIME)
+    return page_token
+
+
+def _get_paginated_bookings(page_token):
+    page_data = _load_page_data(page_token)
+    if page_data is None:
         return {
             "error": "Page token does not exist"
         }
 
     page_data["current_page"] += 1
-    r.set(page_token, json.dumps(page_data), ex=TOKEN_EXPIRY_TIME)
 
     pagination = page_data["pagination"]
     query = json.loads(page_data["query"])
-    bookings, is_last_page = _paginated_result(
-        query,
-        page_data["current_page"],
-        pagination
-    )
+    if "cursor" in page_data:
+        bookings, is_last_page = _keyset_paginated_result(query, page_data)
+
+        def save_page_token():
+            # The cursor is only known once the page has been sent
+            return _save_page_data(page_token, page_data)
+    else:
+        _save_page_data(page_token, page_data)
+        bookings, is_last_page = _paginated_result(
+            query,
+            page_data["current_page"],
+            pagination
+        )
+
+        def save_page_token():
+            return page_token
 
     # if there is a next page
     bookings["next_page_exists"] = not is_last_page
 
+    # The total is only sent with the first page
+    if page_data["current_page"] != 1:
+        bookings.pop("count", None)
+
     if not is_last_page:
         # append the page_token to return json
-        bookings["page_token"] = page_token
+        bookings["page_token"] = save_page_token
 
     return bookings
 
 
-def _paginated_result(query, page_number, pagination):
+def _get_bookings_queryset(query):
+    """
+    Returns the bookings matching query from the current cache, ordered by
+    start time. Raises FieldError if query is not valid.
+    """
+    lock = get_lock()
+    curr = BookingA if not lock.a else BookingB
+    # id breaks ties between bookings that start at the same time, which
+    # keyset pagination relies on
+    return curr.objects.filter(
+        Q(bookabletype='CB') | Q(siteid='238') | Q(siteid='240'),
+        **query
+    ).order_by('startdatetime', 'id')
+
+
+def _get_cursor(booking):
+    return [
+        booking.startdatetime.isoformat() if booking.startdatetime else None,
+        booking.id
+    ]
+
+
+def _after_cursor(cursor):
+    """
+    Returns a filter for the bookings that come after cursor when ordered
+    by (startdatetime, id). Bookings without a start time sort last.
+    """
+    start, pk = cursor
+    if start is None:
+        return Q(startdatetime__isnull=True, id__gt=pk)
+
+    start = ciso8601.parse_datetime(start)
+    return (
+        Q(startdatetime__gt=start) |
+        Q(startdatetime=start, id__gt=pk) |
+        Q(startdatetime__isnull=True)
+    )
+
+
+def _keyset_paginated_result(query, page_data):
+    """
+    Returns the page of bookings that follows page_data's cursor and
+    whether it is the last page. Each page is found by seeking to the
+    cursor in (startdatetime, id) order, so fetching a page costs the same
+    however deep into the results it is. The cursor in page_data is moved
+    along as the bookings are read, and the count is only run once.
+    """
     try:
-        lock = Lock.objects.all()[0]
-        curr = BookingA if not lock.a else BookingB
-        all_bookings = curr.objects.filter(
-            Q(bookabletype='CB') | Q(siteid='238') | Q(siteid='240'),
-            **query
-        ).order_by('startdatetime')
+        all_bookings = _get_bookings_queryset(query)
     except FieldError:
         return {
             "error": "something wrong with encoded query params"
         }, False
 
-    paginator = Paginator(all_bookings, pagination)
+    if page_data["count"] is None:
+        page_data["count"] = all_bookings.count()
+
+    if page_data["cursor"] is not None:
+        all_bookings = all_bookings.filter(_after_cursor(page_data["cursor"]))
+
+    pagination = page_data["pagination"]
+    page = all_bookings[:pagination]
+
+    return (
+        {
+            "bookings": _stream_bookings(page, page_data),
+            "count": page_data["count"]
+        },
+        (page_data["current_page"] * pagination >= page_data["count"])
+    )
+
+
+def _paginated_result(query, page_number, pagination):
+    """
+    Returns a page of bookings and whether it is the last page. The
+    bookings are a generator reading from the database as it is consumed,
+    so the page has to be sent with StreamingJsonResponse.
 
+    This pages by offset, and is only used for page tokens created before
+    keyset pagination was introduced.
+    """
     try:
-        bookings = paginator.page(page_number)
-    except PageNotAnInteger:
-        # give first page
-        bookings = paginator.page(1)
-    except EmptyPage:
-        # return empty page
-        # bookings = paginator.page(paginator.num_pages)
-        bookings = []
+        all_bookings = _get_bookings_queryset(query)
+    except FieldError:
+        return {
+            "error": "something wrong with encoded query params"
+        }, False
+
+    count = all_bookings.count()
+    # There is always at least one (possibly empty) page
+    num_pages = max(1, -(-count // pagination))
 
-    serialized_bookings = _serialize_bookings(bookings)
+    offset = (page_number - 1) * pagination
+    page = all_bookings[offset:offset + pagination]
 
     return (
-        {"bookings": serialized_bookings},
-        (page_number == paginator.num_pages)
+        {
+            "bookings": _stream_bookings(page),
+            "count": count
+        },
+        (page_number >= num_pages)
     )
 
 
 def _localize_time(time_string):
-    london_time = pytz.timezone("Europe/London")
     ret_time = time_string.replace(" ", "+")
     ret_time = ciso8601.parse_datetime(ret_time)
-    ret_time = ret_time.astimezone(london_time)
+    ret_time = ret_time.astimezone(LONDON_TIMEZONE)
     return ret_time.replace(tzinfo=None)
 
 
@@ -176,7 +323,39 @@ def _parse_datetime(start_time, end_time, search_date):
     return parsed_start_time, parsed_end_time, True
 
 
+def _get_coordinate_maps(rooms):
+    """
+    Loads the coordinates of rooms and of their sites in two queries.
+    Returns a map of (siteid, roomid) to coordinates and a map of siteid to
+    coordinates.
+    """
+    siteids = {room.siteid for room in rooms}
+    roomids = {room.roomid for room in rooms}
+
+    # This may also load rooms with the same roomid on another of the sites,
+    # which are never looked up
+    room_coordinates = {
+        (siteid, roomid): {"lat": lat, "lng": lng}
+        for siteid, roomid, lat, lng in Location.objects.filter(
+            siteid__in=siteids,
+            roomid__in=roomids
+        ).values_list("siteid", "roomid", "lat", "lng")
+    }
+
+    # Should a site have more than one location, use the first one
+    site_coordinates = {}
+    for siteid, lat, lng in SiteLocation.objects.filter(
+        siteid__in=siteids
+    ).order_by("id").values_list("siteid", "lat", "lng"):
+        site_coordinates.setdefault(siteid, {"lat": lat, "lng": lng})
+
+    return room_coordinates, site_coordinates
+
+
 def _serialize_rooms(room_set):
+    room_set = list(room_set)
+    room_coordinates, site_coordinates = _get_coordinate_maps(room_set)
+
     rooms = []
     for room in room_set:
         # Maps room classification to a textual version
@@ -204,52 +383,55 @@ def _serialize_rooms(room_set):
             }
         }
 
-        try:
-            location = Location.objects.get(
-                siteid=room.siteid,
-                roomid=room.roomid
-            )
-            room_to_add['location']['coordinates'] = {
-                "lat": location.lat,
-                "lng": location.lng
-            }
-        except Location.DoesNotExist:
-            # no location for this room, try building
-            try:
-                location = SiteLocation.objects.get(
-                    siteid=room.siteid
-                )
-                room_to_add['location']['coordinates'] = {
-                    "lat": location.lat,
-                    "lng": location.lng
-                }
-            except SiteLocation.DoesNotExist:
-                # no location for this room
-                pass
+        # If there is no location for this room, try the building
+        coordinates = room_coordinates.get(
+            (room.siteid, room.roomid),
+            site_coordinates.get(room.siteid)
+        )
+        if coordinates:
+            room_to_add['location']['coordinates'] = dict(coordinates)
 
         rooms.append(room_to_add)
     return rooms
 
 
 def _serialize_bookings(bookings):
-    ret_bookings = []
-    for bk in bookings:
-        ret_bookings.append({
-            "roomname": bk.roomname,
-            "siteid": bk.siteid,
-            "roomid": bk.roomid,
-            "description": bk.title,
-            "start_time": _kloppify(datetime.datetime.strftime(
-                bk.startdatetime, "%Y-%m-%dT%H:%M:%S"), bk.startdatetime),
-            "end_time": _kloppify(datetime.datetime.strftime(
-                bk.finishdatetime, "%Y-%m-%dT%H:%M:%S"), bk.finishdatetime),
-            "contact": bk.condisplayname,
-            "slotid": bk.slotid,
-            "weeknumber": bk.weeknumber,
-            "phone": bk.phone
-        })
+    return list(_iter_serialized_bookings(bookings))
+
 
-    return ret_bookings
+def _stream_bookings(queryset, page_data=None):
+    """
+    Serialises bookings as they are read from the database, without
+    caching them on the queryset. Nothing is queried until the generator
+    is first advanced, i.e. when the response starts being sent.
+
+    If page_data is given, its cursor is kept pointing at the last booking
+    serialised.
+    """
+    for booking in queryset.iterator():
+        if page_data is not None:
+            page_data["cursor"] = _get_cursor(booking)
+        yield _serialize_booking(booking)
+
+
+def _iter_serialized_bookings(bookings):
+    for bk in bookings:
+        yield _serialize_booking(bk)
+
+
+def _serialize_booking(bk):
+    return {
+        "roomname": bk.roomname,
+        "siteid": bk.siteid,
+        "roomid": bk.roomid,
+        "description": bk.title,
+        "start_time": _format_local_time(bk.startdatetime),
+        "end_time": _format_local_time(bk.finishdatetime),
+        "contact": bk.condisplayname,
+        "slotid": bk.slotid,
+        "weeknumber": bk.weeknumber,
+        "phone": bk.phone
+    }
 
 
 def _serialize_equipment(equipment):
@@ -265,12 +447,50 @@ def _serialize_equipment(equipment):
     return ret_equipment
 
 
-def _kloppify(date_string, date):
-    local_time = pytz.timezone('Europe/London')
+def _build_dst_transitions(timezone):
+    """
+    Returns a sorted list of the local times at which timezone's offset
+    changes, and for each one whether daylight saving is in effect from
+    then on.
+
+    pytz records when each transition happens in UTC. Adding the offset
+    in effect after the transition gives the first local time that falls
+    on the new side of it, which resolves ambiguous and non-existent
+    times in the same way as localize(), i.e. as standard time.
+    """
+    transitions = [datetime.datetime.min]
+    is_dst = [timezone._transition_info[0][1] > timedelta(0)]
+    for utc_time, (utcoffset, dst, _) in list(zip(
+        timezone._utc_transition_times,
+        timezone._transition_info
+    ))[1:]:
+        transitions.append(utc_time + utcoffset)
+        is_dst.append(dst > timedelta(0))
+    return transitions, is_dst
+
+
+LONDON_DST_TRANSITIONS, LONDON_IS_DST = _build_dst_transitions(
+    LONDON_TIMEZONE
+)
+
 
-    if (local_time.localize(date).dst() > timedelta(0)):
-        return date_string + "+01:00"
-    return date_string + "+00:00"
+def _is_dst(date):
+    # Whether daylight saving applies to a naive London time. Equivalent
+    # to LONDON_TIMEZONE.localize(date).dst() > timedelta(0), but only
+    # needs a binary search.
+    return LONDON_IS_DST[
+        bisect.bisect_right(LONDON_DST_TRANSITIONS, date) - 1
+    ]
+
+
+def _format_local_time(date):
+    """
+    Formats a naive London time as ISO 8601 with its UTC offset, e.g.
+    2019-10-14T09:00:00+01:00
+    """
+    return date.isoformat(timespec="seconds") + (
+        "+01:00" if _is_dst(date) else "+00:00"
+    )
 
 
 def _return_json_bookings(bookings, custom_header_data=None):
@@ -282,7 +502,7 @@ def _return_json_bookings(bookings, custom_header_data=None):
 
     bookings["ok"] = True
 
-    return PrettyJsonResponse(bookings, custom_header_data)
+    return StreamingJsonResponse(bookings, custom_header_data)
 
 
 def how_many_seconds_until_midnight():
@@ -293,61 +513,3 @@ def how_many_seconds_until_midnight():
         day=tomorrow.day, hour=0, minute=0, second=0
     )
     return (midnight - datetime.datetime.now()).seconds
-
-
-def _create_map_of_overlapping_bookings(bookings, start, end):
-    """
-    Creates map of room to bookings where each booking overlaps
-    with the given time range
-    """
-    bookings_map = {}
-
-    for booking in bookings:
-        booking_start = _localize_time(booking["start_time"])
-        booking_end = _localize_time(booking["end_time"])
-
-        if _overlaps(
-            start1=booking_start,
-            end1=booking_end,
-            start2=start,
-            end2=end
-        ):
-            roomid, siteid = booking["roomid"], booking["siteid"]
-            bookings_map[(roomid, siteid)] = bookings_map.get(
-                (roomid, siteid), []
-            ) + [booking]
-
-    return bookings_map
-
-
-def _overlaps(start1, end1, start2, end2):
-    """
-    takes 4 datetimes
-    checks if they overlap
-    """
-    return max(start1, start2) < min(end1, end2)
-
-
-def _filter_for_free_rooms(all_rooms, bookings, start, end):
-    """
-    Find all rooms which don't have any bookings.
-    Args:
-        all_rooms: All available rooms.
-        bookings: All the bookings made in the days of the given time period
-        start: Start time for free rooms
-        end: End time for free rooms
-    """
-    rooms_with_bookings = list(all_rooms)
-    bookings_map = _create_map_of_overlapping_bookings(bookings, start, end)
-
-    free_rooms = []
-    for room in rooms_with_bookings:
-        roomid, siteid = room["roomid"], room["siteid"]
-        if (
-            (roomid, siteid) not in bookings_map or
-            not bookings_map[(roomid, siteid)]
-        ):
-            # if room doesn't have any overlapping bookings
-            free_rooms.append(room)
-
-    return free_rooms
@@ -0,0 +1,122 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from roombookings.booking_diff import BookingDiff, HASHED_FIELDS
+from roombookings.helpers import _serialize_booking, _serialize_bookings
+from roombookings.management.commands.benchmark_booking_serialisation import (
+    _generate_bookings
+)
+
+# DeepDiff is only needed to compare against the old way of diffing
+try:
+    from deepdiff import DeepDiff
+except ImportError:
+    DeepDiff = None
+
+
+def _make_buckets(count, changes):
+    # The new bucket has changes bookings edited, removed and added
+    old_bookings = _generate_bookings(count)
+    new_bookings = list(old_bookings)
+
+    changed = random.sample(range(count), changes * 2)
+    for i in changed[:changes]:
+        new_bookings[i] = new_bookings[i]._replace(title="Changed")
+    removed = set(changed[changes:])
+    new_bookings = [
+        booking for i, booking in enumerate(new_bookings) if i not in removed
+    ]
+    new_bookings.extend(
+        booking._replace(slotid=booking.slotid + count)
+        for booking in _generate_bookings(changes)
+    )
+    return old_bookings, new_bookings
+
+
+def _rows(bookings):
+    # BookingDiff's rows, using the position in the list as the ID
+    for i, booking in enumerate(bookings):
+        yield (i, ) + tuple(getattr(booking, field) for field in HASHED_FIELDS)
+
+
+def _sorted(bookings):
+    return sorted(json.dumps(booking, sort_keys=True) for booking in bookings)
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Times diffing two buckets of bookings by their hashes, and '
+        'optionally with DeepDiff as trigger_webhooks used to'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=100000,
+            help='Number of bookings in each bucket'
+        )
+        parser.add_argument(
+            '--changes',
+            type=int,
+            default=500,
+            help='Number of bookings edited, removed and added'
+        )
+        parser.add_argument(
+            '--deepdiff',
+            action='store_true',
+            default=False,
+            help='Also diff with DeepDiff, which is very slow'
+        )
+
+    def handle(self, *args, **options):
+        old_bookings, new_bookings = _make_buckets(
+            options['bookings'],
+            options['changes']
+        )
+
+        start_time = time.perf_counter()
+        diff = BookingDiff(_rows(old_bookings), _rows(new_bookings))
+        added = [_serialize_booking(new_bookings[i]) for i in diff.added_ids]
+        removed = [
+            _serialize_booking(old_bookings[i]) for i in diff.removed_ids
+        ]
+        hash_time = time.perf_counter() - start_time
+
+        print("Diffed {} and {} bookings".format(
+            len(old_bookings),
+            len(new_bookings)
+        ))
+        print("{} added, {} removed".format(len(added), len(removed)))
+        print("Hashes:   {:.3f}s".format(hash_time))
+
+        if not options['deepdiff']:
+            return
+        if DeepDiff is None:
+            self.stderr.write("DeepDiff is not installed")
+            return
+
+        start_time = time.perf_counter()
+        ddiff = DeepDiff(
+            _serialize_bookings(old_bookings),
+            _serialize_bookings(new_bookings),
+            ignore_order=True
+        )
+        deepdiff_time = time.perf_counter() - start_time
+
+        deepdiff_added = ddiff.get("iterable_item_added", {}).values()
+        deepdiff_removed = ddiff.get("iterable_item_removed", {}).values()
+        if (
+            _sorted(added) != _sorted(deepdiff_added) or
+            _sorted(removed) != _sorted(deepdiff_removed)
+        ):
+            self.stderr.write("The two methods gave different results!")
+
+        print("DeepDiff: {:.3f}s ({:.1f}x slower)".format(
+            deepdiff_time,
+            deepdiff_time / hash_time
+        ))
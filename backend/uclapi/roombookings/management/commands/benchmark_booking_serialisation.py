@@ -0,0 +1,112 @@
+import datetime
+import time
+
+from collections import namedtuple
+
+import pytz
+
+from django.core.management.base import BaseCommand
+
+from roombookings.helpers import _serialize_bookings
+
+
+FakeBooking = namedtuple("FakeBooking", [
+    "roomname",
+    "siteid",
+    "roomid",
+    "title",
+    "startdatetime",
+    "finishdatetime",
+    "condisplayname",
+    "slotid",
+    "weeknumber",
+    "phone"
+])
+
+
+def _generate_bookings(count):
+    # Spread bookings over the academic year so that both sides of each
+    # daylight saving change are covered
+    start = datetime.datetime(2019, 9, 1, 9, 0)
+    return [
+        FakeBooking(
+            roomname="Room {}".format(i % 500),
+            siteid=str(i % 50),
+            roomid=str(i % 500),
+            title="Booking {}".format(i),
+            startdatetime=start + datetime.timedelta(minutes=5 * i),
+            finishdatetime=start + datetime.timedelta(minutes=5 * i + 60),
+            condisplayname="Someone",
+            slotid=i,
+            weeknumber=float(i % 52),
+            phone=None
+        )
+        for i in range(count)
+    ]
+
+
+def _kloppify(date_string, date):
+    local_time = pytz.timezone('Europe/London')
+
+    if (local_time.localize(date).dst() > datetime.timedelta(0)):
+        return date_string + "+01:00"
+    return date_string + "+00:00"
+
+
+def _serialize_bookings_pytz(bookings):
+    # How bookings were serialised before the DST transition table
+    ret_bookings = []
+    for bk in bookings:
+        ret_bookings.append({
+            "roomname": bk.roomname,
+            "siteid": bk.siteid,
+            "roomid": bk.roomid,
+            "description": bk.title,
+            "start_time": _kloppify(datetime.datetime.strftime(
+                bk.startdatetime, "%Y-%m-%dT%H:%M:%S"), bk.startdatetime),
+            "end_time": _kloppify(datetime.datetime.strftime(
+                bk.finishdatetime, "%Y-%m-%dT%H:%M:%S"), bk.finishdatetime),
+            "contact": bk.condisplayname,
+            "slotid": bk.slotid,
+            "weeknumber": bk.weeknumber,
+            "phone": bk.phone
+        })
+
+    return ret_bookings
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Compares serialising bookings with pytz against the DST '
+        'transition table'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=100000,
+            help='Number of bookings to serialise'
+        )
+
+    def _time(self, function, bookings):
+        start_time = time.perf_counter()
+        result = function(bookings)
+        return result, time.perf_counter() - start_time
+
+    def handle(self, *args, **options):
+        bookings = _generate_bookings(options['bookings'])
+
+        old, old_time = self._time(_serialize_bookings_pytz, bookings)
+        new, new_time = self._time(_serialize_bookings, bookings)
+
+        if old != new:
+            self.stderr.write("The two methods gave different results!")
+
+        print("Serialised {} bookings".format(len(bookings)))
+        print("pytz:                 {:.3f}s".format(old_time))
+        print("DST transition table: {:.3f}s ({:.1f}x faster)".format(
+            new_time,
+            old_time / new_time
+        ))
@@ -1,12 +1,19 @@
 from django.core.management.base import BaseCommand
 from roombookings.models import BookingA, BookingB
 from timetable.models import Lock
-from roombookings.helpers import _serialize_bookings
-from dashboard.models import Webhook, WebhookTriggerHistory
+from roombookings.booking_diff import (
+    BookingDiff,
+    get_booking_rows,
+    iter_serialized_bookings
+)
+from roombookings.webhook_subscriptions import WebhookIndex
+from dashboard.models import Webhook
+from dashboard.webhook_delivery import (
+    WebhookDeliveryService,
+    create_delivery,
+    record_fired_webhooks
+)
 from datetime import datetime
-from deepdiff import DeepDiff
-from django.utils import timezone
-from requests_futures.sessions import FuturesSession
 
 
 class Command(BaseCommand):
@@ -23,7 +30,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.stdout.write("Triggering webhooks")
-        session = FuturesSession()
+        delivery_service = WebhookDeliveryService()
 
         # currently locked table is the old one, more recent one is not locked
         lock = Lock.objects.all()[0]  # there is only ever one lock
@@ -37,81 +44,56 @@ class Command(BaseCommand):
 
         now = datetime.now()
 
-        old_bookings = _serialize_bookings(
-            old_booking_table.objects.filter(
-                startdatetime__gt=now
-            )
+        old_bookings = old_booking_table.objects.filter(
+            startdatetime__gt=now
         )
-        new_bookings = _serialize_bookings(
-            new_booking_table.objects.filter(
-                startdatetime__gt=now
-            )
+        new_bookings = new_booking_table.objects.filter(
+            startdatetime__gt=now
         )
 
-        ddiff = DeepDiff(old_bookings, new_bookings, ignore_order=True)
+        diff = BookingDiff(
+            get_booking_rows(old_bookings),
+            get_booking_rows(new_bookings)
+        )
+        # Only the bookings that have changed are serialised
+        all_bookings_added = list(
+            iter_serialized_bookings(new_bookings, diff.added_ids)
+        )
+        all_bookings_removed = list(
+            iter_serialized_bookings(old_bookings, diff.removed_ids)
+        )
 
         webhooks = Webhook.objects.all()
-        #  assumption: list of webhooks will be longer than ddiff
-
-        num_bookings_added = 0
-        num_bookings_removed = 0
-        if "iterable_item_added" in ddiff:
-                num_bookings_added = len(
-                    ddiff["iterable_item_added"].values()
-                )
-
-        if "iterable_item_removed" in ddiff:
-                num_bookings_removed = len(
-                    ddiff["iterable_item_removed"].values()
-                )
+        #  assumption: list of webhooks will be longer than the diff
 
         self.stdout.write(
             "{} bookings added\n{} bookings removed.".format(
-                num_bookings_added,
-                num_bookings_removed
+                len(all_bookings_added),
+                len(all_bookings_removed)
             )
         )
 
+        index = WebhookIndex(webhooks)
+        added_by_webhook = index.route(all_bookings_added)
+        removed_by_webhook = index.route(all_bookings_removed)
+
         def webhook_map(webhook):
-            def webhook_filter(booking):
-                return (
-                    (
-                        webhook.siteid == '' or
-                        booking["siteid"] == webhook.siteid
-                    ) and
-                    (
-                        webhook.roomid == '' or
-                        booking["roomid"] == webhook.roomid
-                    ) and
-                    (
-                        webhook.contact == '' or
-                        # mimick SQL 'like'
-                        webhook.contact in str(booking["contact"])
-                    )
-                )
             output = {
                 "webhook_in_db": webhook,
                 "url": webhook.url,
                 "verification_secret": webhook.verification_secret
             }
-            if "iterable_item_added" in ddiff:
-                bookings_added = list(filter(
-                    webhook_filter, ddiff["iterable_item_added"].values()
-                ))
-                if bookings_added != []:
-                    output["bookings_added"] = bookings_added
-            if "iterable_item_removed" in ddiff:
-                bookings_removed = list(filter(
-                    webhook_filter, ddiff["iterable_item_removed"].values()
-                ))
-                if bookings_removed != []:
-                    output["bookings_removed"] = bookings_removed
+            if webhook.id in added_by_webhook:
+                output["bookings_added"] = added_by_webhook[webhook.id]
+            if webhook.id in removed_by_webhook:
+                output["bookings_removed"] = removed_by_webhook[webhook.id]
 
             return output
 
         webhooks_to_enact = list(map(webhook_map, webhooks))
 
-        unsent_requests = []
+        deliveries = []
+        fired = []
         for idx, webhook in enumerate(webhooks_to_enact):
             payload = {
                 "service": "roombookings",
@@ -131,34 +113,37 @@ class Command(BaseCommand):
 
             webhooks_to_enact[idx]["payload"] = payload
 
-            if payload["content"] != {} and webhook["url"] != "":
-                unsent_requests.append(
-                    session.post(
-                        webhook["url"], json=payload,
-                        headers={
-                            "User-Agent": "uclapi-bot/1"
-                        }
+            if payload["content"] != {}:
+                fired.append((webhook["webhook_in_db"], payload))
+                if webhook["url"] != "":
+                    deliveries.append(
+                        create_delivery(webhook["webhook_in_db"], payload)
                     )
-                )
+
+        retries = delivery_service.take_due_retries()
         self.stdout.write(
-            "Triggering {} webhooks.".format(len(unsent_requests))
+            "Triggering {} webhooks and retrying {}.".format(
+                len(deliveries),
+                len(retries)
+            )
         )
-        if("debug" in options):
-            for i in unsent_requests:
-                self.stdout.write(
-                    'response status {0}'.format(i.result().status_code)
-                )
-
-        for webhook in webhooks_to_enact:
-            if webhook["payload"]["content"] != {}:
-                webhook_in_db = webhook["webhook_in_db"]
-                webhook_in_db.last_fired = timezone.now()
-                webhook_in_db.save()
+        results = delivery_service.deliver(deliveries + retries)
+        if options["debug"]:
+            for result in results:
+                self.stdout.write('{} response status {}'.format(
+                    result.delivery["url"],
+                    result.status_code or result.error
+                ))
 
-                new_webhook_history_entry = WebhookTriggerHistory(
-                    webhook=webhook_in_db,
-                    payload=webhook["payload"]
-                )
-                new_webhook_history_entry.save()
+        record_fired_webhooks(fired)
 
-        self.stdout.write("Webhooks triggered.")
+        stats = delivery_service.get_stats()
+        self.stdout.write(
+            "Webhooks triggered: {} delivered, {} failed ({} to be retried), "
+            "{:.3f}s average latency.".format(
+                stats["delivered"],
+                stats["failed"],
+                stats["retries_scheduled"],
+                stats["average_latency"]
+            )
+        )
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roombookings', '0012_delete_lock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookinga',
+            index=models.Index(fields=['slotid'], name='bookinga_slotid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinga',
+            index=models.Index(fields=['startdatetime', 'id'], name='bookinga_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinga',
+            index=models.Index(fields=['siteid', 'roomid', 'startdatetime'], name='bookinga_room_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingb',
+            index=models.Index(fields=['slotid'], name='bookingb_slotid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingb',
+            index=models.Index(fields=['startdatetime', 'id'], name='bookingb_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingb',
+            index=models.Index(fields=['siteid', 'roomid', 'startdatetime'], name='bookingb_room_idx'),
+        ),
+    ]
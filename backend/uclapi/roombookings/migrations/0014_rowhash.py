@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roombookings', '0013_booking_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookinga',
+            name='rowhash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='bookingb',
+            name='rowhash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='rooma',
+            name='rowhash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='roomb',
+            name='rowhash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
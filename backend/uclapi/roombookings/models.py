@@ -49,9 +49,21 @@ class BookingA(models.Model):
     phone = models.CharField(max_length=160, blank=True, null=True)
     descrip = models.CharField(max_length=400, blank=True, null=True)
     title = models.CharField(max_length=523, blank=True, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
+        indexes = [
+            models.Index(fields=['slotid'], name='bookinga_slotid_idx'),
+            models.Index(
+                fields=['startdatetime', 'id'],
+                name='bookinga_start_idx'
+            ),
+            models.Index(
+                fields=['siteid', 'roomid', 'startdatetime'],
+                name='bookinga_room_idx'
+            ),
+        ]
 
 
 class BookingB(models.Model):
@@ -72,9 +84,21 @@ class BookingB(models.Model):
     phone = models.CharField(max_length=160, blank=True, null=True)
     descrip = models.CharField(max_length=400, blank=True, null=True)
     title = models.CharField(max_length=523, blank=True, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
+        indexes = [
+            models.Index(fields=['slotid'], name='bookingb_slotid_idx'),
+            models.Index(
+                fields=['startdatetime', 'id'],
+                name='bookingb_start_idx'
+            ),
+            models.Index(
+                fields=['siteid', 'roomid', 'startdatetime'],
+                name='bookingb_room_idx'
+            ),
+        ]
 
 
 class Room(models.Model):
@@ -120,6 +144,7 @@ class RoomA(models.Model):
     automated = models.CharField(max_length=4, blank=True, null=True)
     capacity = models.FloatField(blank=True, null=True)
     category = models.CharField(max_length=40, blank=True, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -143,6 +168,7 @@ class RoomB(models.Model):
     automated = models.CharField(max_length=4, blank=True, null=True)
     capacity = models.FloatField(blank=True, null=True)
     category = models.CharField(max_length=40, blank=True, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
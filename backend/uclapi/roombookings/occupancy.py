@@ -0,0 +1,298 @@
+import bisect
+import threading
+
+from array import array
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+
+from .models import BookingA, BookingB
+from common.redis_pool import get_redis
+
+
+EPOCH = datetime(1970, 1, 1)
+
+# Occupancy bitmaps split every day into slots of this many minutes
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BITMAP_BYTES = SLOTS_PER_DAY // 8
+
+OCCUPANCY_KEY_PREFIX = "roombookings:occupancy:"
+
+
+def _to_seconds(value):
+    # Bookings are stored as naive London times and are only ever compared
+    # with other naive London times, so no time zone handling is needed.
+    # Dates are treated as midnight at the start of that day.
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time())
+    return int((value - EPOCH).total_seconds())
+
+
+class RoomIntervalIndex():
+    """
+    The bookings of every room, indexed so that whether a room is free
+    between two times takes a single binary search.
+
+    For each room, the start times of its bookings are kept in a sorted
+    array, alongside an array of the latest finish time of any booking up
+    to and including that one. The bookings that start before the end of a
+    period are always a prefix of the first array, and the room is busy
+    exactly when the latest finish time within that prefix is after the
+    start of the period.
+    """
+
+    def __init__(self, bookings):
+        """bookings is an iterable of (roomid, siteid, start, finish)"""
+        intervals = defaultdict(list)
+        for roomid, siteid, start, finish in bookings:
+            if start is None or finish is None:
+                continue
+            intervals[(roomid, siteid)].append(
+                (_to_seconds(start), _to_seconds(finish))
+            )
+
+        self._starts = {}
+        self._latest_finishes = {}
+        for room, room_intervals in intervals.items():
+            room_intervals.sort()
+            starts = array('q')
+            latest_finishes = array('q')
+            latest_finish = room_intervals[0][1]
+            for start, finish in room_intervals:
+                latest_finish = max(latest_finish, finish)
+                starts.append(start)
+                latest_finishes.append(latest_finish)
+            self._starts[room] = starts
+            self._latest_finishes[room] = latest_finishes
+
+    def __len__(self):
+        return sum(len(starts) for starts in self._starts.values())
+
+    def _is_free(self, room, start, end):
+        starts = self._starts.get(room)
+        if starts is None:
+            return True
+        i = bisect.bisect_left(starts, end)
+        return i == 0 or self._latest_finishes[room][i - 1] <= start
+
+    def is_free(self, roomid, siteid, start, end):
+        """Returns whether no booking for the room overlaps start to end"""
+        return self._is_free(
+            (roomid, siteid),
+            _to_seconds(start),
+            _to_seconds(end)
+        )
+
+    def free_rooms(self, rooms, start, end):
+        """Returns the serialised rooms that are free from start to end"""
+        start = _to_seconds(start)
+        end = _to_seconds(end)
+        return [
+            room for room in rooms
+            if self._is_free((room["roomid"], room["siteid"]), start, end)
+        ]
+
+
+# Each worker process builds the index for the current gencache
+# generation the first time it is needed, and keeps it until the
+# generation changes.
+_index = None
+_index_generation = None
+_index_lock = threading.Lock()
+
+
+def _get_generation(lock):
+    # The lock cache starts a new generation every time the lock is
+    # published, so this changes every time the cache is rebuilt, even if
+    # it is rebuilt into the same bucket within the same second
+    return (lock.a, lock.generation)
+
+
+def get_room_interval_index(lock):
+    """
+    Returns the interval index over every booking in the bucket of the
+    gencache that lock says is current.
+    """
+    global _index, _index_generation
+
+    generation = _get_generation(lock)
+    if _index_generation == generation:
+        return _index
+
+    with _index_lock:
+        if _index_generation != generation:
+            curr = BookingA if not lock.a else BookingB
+            _index = RoomIntervalIndex(_get_bookings(curr).iterator())
+            _index_generation = generation
+        return _index
+
+
+def _get_bookings(model):
+    return model.objects.filter(
+        Q(bookabletype='CB') | Q(siteid='238') | Q(siteid='240')
+    ).values_list(
+        'roomid',
+        'siteid',
+        'startdatetime',
+        'finishdatetime'
+    )
+
+
+def _slot(value):
+    # The slot that value falls in, counted from midnight
+    return (value.hour * 60 + value.minute) // SLOT_MINUTES
+
+
+def _slot_mask(first_slot, last_slot):
+    # Bits first_slot to last_slot - 1 set
+    return ((1 << (last_slot - first_slot)) - 1) << first_slot
+
+
+def _day_slot_masks(start, end):
+    """
+    Yields (date, mask) for every day from start to end, where mask has a
+    bit set for every slot of that day that overlaps start to end.
+    """
+    day = start.date()
+    while datetime.combine(day, time()) < end:
+        day_start = datetime.combine(day, time())
+        next_day = day_start + timedelta(days=1)
+
+        first_slot = _slot(start) if start > day_start else 0
+        if end < next_day:
+            # A slot only overlaps if it starts before end
+            last_slot = -(-(end - day_start) // timedelta(
+                minutes=SLOT_MINUTES
+            ))
+        else:
+            last_slot = SLOTS_PER_DAY
+
+        if last_slot > first_slot:
+            yield day, _slot_mask(first_slot, last_slot)
+        day += timedelta(days=1)
+
+
+def _is_slot_aligned(value):
+    return (
+        value.minute % SLOT_MINUTES == 0 and
+        value.second == 0 and
+        value.microsecond == 0
+    )
+
+
+def build_occupancy_bitmaps(bookings):
+    """
+    Turns an iterable of (roomid, siteid, start, finish) into a map of
+    date to a map of (roomid, siteid) to a bitmap (as an int) with a bit
+    set for every slot of that day in which the room is booked at all.
+    """
+    bitmaps = defaultdict(lambda: defaultdict(int))
+    for roomid, siteid, start, finish in bookings:
+        if start is None or finish is None or finish <= start:
+            continue
+        for day, mask in _day_slot_masks(start, finish):
+            bitmaps[day][(roomid, siteid)] |= mask
+    return bitmaps
+
+
+def _get_bucket_name(lock):
+    # The bucket of bookings that roombookings reads from for lock
+    return "a" if not lock.a else "b"
+
+
+def _get_next_bucket_name(lock):
+    # The bucket that roombookings will read from once lock is inverted
+    return "a" if lock.a else "b"
+
+
+def _bucket_key(bucket):
+    return "{}{}:".format(OCCUPANCY_KEY_PREFIX, bucket)
+
+
+def _room_field(roomid, siteid):
+    return "{}|{}".format(siteid, roomid)
+
+
+def store_occupancy_bitmaps(lock):
+    """
+    Builds occupancy bitmaps for the bucket that roombookings will read
+    from once lock has been inverted, and stores them in Redis with one
+    hash per day. Called by update_gencache before it inverts the lock, so
+    the bitmaps are in place before any request can use them. Returns the
+    bitmaps, as returned by build_occupancy_bitmaps.
+    """
+    bucket = _get_next_bucket_name(lock)
+    model = BookingA if bucket == "a" else BookingB
+
+    bitmaps = build_occupancy_bitmaps(_get_bookings(model).iterator())
+
+    r = get_redis()
+    bucket_key = _bucket_key(bucket)
+    pipe = r.pipeline(transaction=False)
+    for key in r.scan_iter(bucket_key + "*"):
+        pipe.delete(key)
+    for day, rooms in bitmaps.items():
+        pipe.hmset(bucket_key + day.isoformat(), {
+            _room_field(roomid, siteid): bitmap.to_bytes(
+                BITMAP_BYTES,
+                "little"
+            )
+            for (roomid, siteid), bitmap in rooms.items()
+        })
+    pipe.set(bucket_key + "built", "1")
+    pipe.execute()
+
+    return bitmaps
+
+
+class OccupancyBitmaps():
+    """
+    Reads the occupancy bitmaps stored by update_gencache. Every worker
+    shares the same bitmaps, and checking a room is a bitwise AND.
+
+    Slots are occupied if any booking overlaps them at all, so answers are
+    exact for periods that start and end on a slot boundary. For other
+    periods a room may be reported busy when it is not, so those should be
+    answered with the RoomIntervalIndex instead.
+    """
+
+    def __init__(self, lock):
+        self._bucket_key = _bucket_key(_get_bucket_name(lock))
+
+    @staticmethod
+    def can_answer(start, end):
+        return _is_slot_aligned(start) and _is_slot_aligned(end)
+
+    def is_available(self):
+        return get_redis().exists(self._bucket_key + "built")
+
+    def _get_day_bitmaps(self, start, end, fields=None):
+        day_masks = list(_day_slot_masks(start, end))
+        pipe = get_redis().pipeline(transaction=False)
+        for day, _ in day_masks:
+            if fields is None:
+                pipe.hgetall(self._bucket_key + day.isoformat())
+            else:
+                pipe.hmget(self._bucket_key + day.isoformat(), fields)
+        return zip((mask for _, mask in day_masks), pipe.execute())
+
+    def is_free(self, roomid, siteid, start, end):
+        field = _room_field(roomid, siteid)
+        for mask, (bitmap,) in self._get_day_bitmaps(start, end, [field]):
+            if bitmap and int.from_bytes(bitmap, "little") & mask:
+                return False
+        return True
+
+    def free_rooms(self, rooms, start, end):
+        """Returns the serialised rooms that are free from start to end"""
+        busy = set()
+        for mask, day_bitmaps in self._get_day_bitmaps(start, end):
+            for field, bitmap in day_bitmaps.items():
+                if int.from_bytes(bitmap, "little") & mask:
+                    busy.add(field.decode())
+        return [
+            room for room in rooms
+            if _room_field(room["roomid"], room["siteid"]) not in busy
+        ]
@@ -3,10 +3,13 @@ import json
 import unittest.mock
 from itertools import chain, repeat
 
+import pytz
 import redis
 
 from django.core.management import call_command
-from django.test import SimpleTestCase, TestCase
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIRequestFactory
 from django.conf import settings
 from django_mock_queries.query import MockSet, MockModel
@@ -14,22 +17,49 @@ from django_mock_queries.query import MockSet, MockModel
 from dashboard.app_helpers import get_temp_token
 from dashboard.models import App, User
 
+from .booking_diff import (
+    BookingDiff,
+    HASHED_FIELDS,
+    get_booking_rows,
+    iter_serialized_bookings
+)
 from .helpers import (
     _create_page_token,
-    _filter_for_free_rooms,
+    _format_local_time,
+    _get_coordinate_maps,
+    _get_paginated_bookings,
     _localize_time,
     _parse_datetime,
     _round_date,
     _serialize_equipment,
+    _serialize_rooms,
     PrettyJsonResponse,
     TOKEN_EXPIRY_TIME
 )
 
-from .models import Room
+from .models import (
+    BookingA,
+    BookingB,
+    Location,
+    Room,
+    RoomA,
+    SiteLocation
+)
+from .occupancy import (
+    OccupancyBitmaps,
+    RoomIntervalIndex,
+    build_occupancy_bitmaps,
+    get_room_interval_index,
+    store_occupancy_bitmaps
+)
+from . import utilisation
+from .webhook_subscriptions import ContactMatcher, WebhookIndex
+from timetable.lock_cache import LockState
 from timetable.models import Lock
 
-from .views import get_bookings
+from .views import get_bookings, get_free_rooms, get_rooms, get_utilisation
 
+from uclapi.custom_test_runner import GencacheTestMixin
 from uclapi.settings import REDIS_UCLAPI_HOST
 
 
@@ -377,6 +407,29 @@ class DoesTokenExistTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class FormatLocalTimeTestCase(SimpleTestCase):
+    def test_matches_pytz(self):
+        london = pytz.timezone("Europe/London")
+        # Every 15 minutes around the 2019 clock changes, including the
+        # hour that does not exist and the hour that happens twice
+        times = chain.from_iterable(
+            (
+                change + datetime.timedelta(minutes=15 * i)
+                for i in range(-16, 16)
+            )
+            for change in [
+                datetime.datetime(2019, 3, 31, 1, 0),
+                datetime.datetime(2019, 10, 27, 1, 0)
+            ]
+        )
+        for time in times:
+            offset = "+01:00" if london.localize(time).dst() else "+00:00"
+            self.assertEqual(
+                _format_local_time(time),
+                time.strftime("%Y-%m-%dT%H:%M:%S") + offset
+            )
+
+
 class RoundDateTestCase(SimpleTestCase):
     def test_round_down(self):
         time_string = "2017-10-25T03:36:45+00:00"
@@ -391,21 +444,163 @@ class RoundDateTestCase(SimpleTestCase):
         self.assertEqual(round_down, date)
 
 
-class FilterFreeRoomsTestCase(SimpleTestCase):
-    def test_empty_rooms_and_bookings(self):
-        start = datetime.date(2017, 10, 25)
-        end = datetime.date(2017, 10, 26)
-        result = _filter_for_free_rooms([], [], start, end)
-        self.assertEqual(result, [])
+class RoomIntervalIndexTestCase(SimpleTestCase):
+    day = datetime.datetime(2019, 10, 14)
+
+    def _time(self, hour, minute=0):
+        return self.day + datetime.timedelta(hours=hour, minutes=minute)
+
+    def setUp(self):
+        self.index = RoomIntervalIndex([
+            ('1', '238', self._time(9), self._time(10)),
+            # A long booking hidden behind a later, shorter one
+            ('1', '238', self._time(11), self._time(17)),
+            ('1', '238', self._time(12), self._time(13)),
+            ('2', '238', self._time(14), self._time(15)),
+        ])
+
+    def test_is_free(self):
+        cases = [
+            ('1', self._time(8), self._time(9), True),
+            ('1', self._time(8), self._time(9, 30), False),
+            ('1', self._time(10), self._time(11), True),
+            ('1', self._time(13), self._time(14), False),
+            ('1', self._time(17), self._time(18), True),
+            ('2', self._time(13), self._time(14), True),
+            ('2', self._time(14, 30), self._time(14, 45), False),
+            ('3', self._time(9), self._time(17), True),
+        ]
+        for roomid, start, end, free in cases:
+            self.assertEqual(
+                self.index.is_free(roomid, '238', start, end),
+                free
+            )
+
+    def test_free_rooms(self):
+        rooms = [
+            {"roomid": "1", "siteid": "238"},
+            {"roomid": "2", "siteid": "238"},
+            {"roomid": "1", "siteid": "240"},
+        ]
+        self.assertEqual(
+            self.index.free_rooms(rooms, self._time(14), self._time(16)),
+            rooms[2:]
+        )
+
+
+class RoomIntervalIndexCacheTestCase(SimpleTestCase):
+    @unittest.mock.patch("roombookings.occupancy._get_bookings")
+    def test_rebuilt_for_each_generation(self, get_bookings):
+        get_bookings.return_value.iterator.side_effect = lambda: iter([])
+
+        lock = LockState(a=False, b=True, generation=1)
+        index = get_room_interval_index(lock)
+        self.assertIs(get_room_interval_index(lock), index)
+        # A rebuild into the same bucket
+        self.assertIsNot(
+            get_room_interval_index(lock._replace(generation=2)),
+            index
+        )
+
+
+class OccupancyBitmapTestCase(SimpleTestCase):
+    def test_partly_booked_slots_are_occupied(self):
+        bitmaps = build_occupancy_bitmaps([
+            (
+                '1',
+                '238',
+                datetime.datetime(2019, 10, 14, 0, 7),
+                datetime.datetime(2019, 10, 14, 0, 15)
+            )
+        ])
+        # Slots 0:05 to 0:10 and 0:10 to 0:15
+        self.assertEqual(
+            bitmaps[datetime.date(2019, 10, 14)][('1', '238')],
+            0b110
+        )
 
-    def test_empty_bookings(self):
-        start = datetime.date(2017, 10, 25)
-        end = datetime.date(2017, 10, 26)
+    def test_bookings_over_midnight_split_by_day(self):
+        bitmaps = build_occupancy_bitmaps([
+            (
+                '1',
+                '238',
+                datetime.datetime(2019, 10, 14, 23, 55),
+                datetime.datetime(2019, 10, 15, 0, 5)
+            )
+        ])
+        self.assertEqual(
+            bitmaps[datetime.date(2019, 10, 14)][('1', '238')],
+            1 << 287
+        )
+        self.assertEqual(
+            bitmaps[datetime.date(2019, 10, 15)][('1', '238')],
+            1
+        )
+
+    def test_can_answer(self):
+        self.assertTrue(OccupancyBitmaps.can_answer(
+            datetime.datetime(2019, 10, 14, 9, 0),
+            datetime.datetime(2019, 10, 14, 9, 55)
+        ))
+        self.assertFalse(OccupancyBitmaps.can_answer(
+            datetime.datetime(2019, 10, 14, 9, 0),
+            datetime.datetime(2019, 10, 14, 9, 58)
+        ))
+
+
+class StoredOccupancyBitmapTestCase(GencacheTestMixin, TestCase):
+    def setUp(self):
+        for roomid, start_hour, end_hour in [('1', 9, 11), ('2', 13, 14)]:
+            BookingA.objects.create(
+                siteid='238',
+                roomid=roomid,
+                bookabletype='CB',
+                startdatetime=datetime.datetime(2019, 10, 14, start_hour),
+                finishdatetime=datetime.datetime(2019, 10, 14, end_hour)
+            )
+
+        # update_gencache builds the bitmaps before inverting the lock, so
+        # these are for BookingA, which is read once lock.a is False
+        store_occupancy_bitmaps(unittest.mock.Mock(a=True))
+        self.bitmaps = OccupancyBitmaps(unittest.mock.Mock(a=False))
+
+    def test_available(self):
+        self.assertTrue(self.bitmaps.is_available())
+
+    def test_free_rooms(self):
         rooms = [
-            {"roomid": 1, "siteid": 1},
+            {"roomid": "1", "siteid": "238"},
+            {"roomid": "2", "siteid": "238"},
+            {"roomid": "3", "siteid": "238"},
+        ]
+        cases = [
+            ((9, 0), (10, 0), rooms[1:]),
+            ((11, 0), (13, 0), rooms),
+            ((10, 55), (13, 5), rooms[2:]),
         ]
-        result = _filter_for_free_rooms(rooms, [], start, end)
-        self.assertEqual(result, rooms)
+        for (start_hour, start_minute), (end_hour, end_minute), free in cases:
+            self.assertEqual(
+                self.bitmaps.free_rooms(
+                    rooms,
+                    datetime.datetime(2019, 10, 14, start_hour, start_minute),
+                    datetime.datetime(2019, 10, 14, end_hour, end_minute)
+                ),
+                free
+            )
+
+    def test_is_free(self):
+        self.assertFalse(self.bitmaps.is_free(
+            '1',
+            '238',
+            datetime.datetime(2019, 10, 14, 10, 0),
+            datetime.datetime(2019, 10, 15, 10, 0)
+        ))
+        self.assertTrue(self.bitmaps.is_free(
+            '1',
+            '238',
+            datetime.datetime(2019, 10, 13, 10, 0),
+            datetime.datetime(2019, 10, 14, 9, 0)
+        ))
 
 
 class CreateRedisPageTokenTest(TestCase):
@@ -442,3 +637,538 @@ class CreateRedisPageTokenTest(TestCase):
             query_decoded["test"],
             "test_data"
         )
+
+
+class PaginationTestCase(GencacheTestMixin, TestCase):
+    def setUp(self):
+        Lock.objects.all().delete()
+        Lock.objects.create(a=False, b=True)
+
+        # Several bookings share a start time, so that the id has to be
+        # used to tell them apart
+        start = datetime.datetime(2019, 10, 14, 9, 0)
+        for i in range(25):
+            booking_start = start + datetime.timedelta(hours=i // 3)
+            BookingA.objects.create(
+                siteid='238',
+                roomid=str(i),
+                roomname='Room {}'.format(i),
+                bookabletype='CB',
+                slotid=i,
+                startdatetime=booking_start,
+                finishdatetime=booking_start + datetime.timedelta(hours=1)
+            )
+
+    def _walk_pages(self, page_token):
+        slotids = []
+        counts = []
+        while True:
+            page = _get_paginated_bookings(page_token)
+            slotids.extend(booking["slotid"] for booking in page["bookings"])
+            counts.append(page.get("count"))
+            if not page["next_page_exists"]:
+                return slotids, counts
+            page_token = page["page_token"]()
+
+
+class KeysetPaginationTestCase(PaginationTestCase):
+    def test_pages_cover_every_booking_once(self):
+        page_token = _create_page_token({}, 10)
+        slotids, counts = self._walk_pages(page_token)
+
+        self.assertEqual(slotids, list(range(25)))
+        self.assertEqual(counts, [25, None, None])
+
+    def test_count_is_stored_with_token(self):
+        page_token = _create_page_token({}, 10)
+        page = _get_paginated_bookings(page_token)
+        list(page["bookings"])
+        page["page_token"]()
+
+        r = redis.Redis(host=REDIS_UCLAPI_HOST)
+        page_data = json.loads(r.get(page_token).decode('ascii'))
+        self.assertEqual(page_data["count"], 25)
+        self.assertEqual(page_data["cursor"][1], BookingA.objects.order_by(
+            'startdatetime', 'id'
+        )[9].id)
+
+    def test_offset_tokens_still_work(self):
+        # Tokens created before keyset pagination have no cursor
+        page_token = _create_page_token({}, 10)
+        r = redis.Redis(host=REDIS_UCLAPI_HOST)
+        page_data = json.loads(r.get(page_token).decode('ascii'))
+        del page_data["cursor"]
+        del page_data["count"]
+        r.set(page_token, json.dumps(page_data), ex=TOKEN_EXPIRY_TIME)
+
+        slotids, _ = self._walk_pages(page_token)
+        self.assertEqual(slotids, list(range(25)))
+
+
+@override_settings(ROOMBOOKINGS_SIGNED_PAGE_TOKENS=True)
+class SignedPageTokenTestCase(PaginationTestCase):
+    def test_pages_cover_every_booking_once(self):
+        page_token = _create_page_token({"siteid": "238"}, 10)
+        slotids, counts = self._walk_pages(page_token)
+
+        self.assertEqual(slotids, list(range(25)))
+        self.assertEqual(counts, [25, None, None])
+
+    def test_nothing_stored_in_redis(self):
+        page_token = _create_page_token({}, 10)
+        page = _get_paginated_bookings(page_token)
+        list(page["bookings"])
+        next_page_token = page["page_token"]()
+
+        self.assertNotEqual(next_page_token, page_token)
+        r = redis.Redis(host=REDIS_UCLAPI_HOST)
+        self.assertIsNone(r.get(page_token))
+        self.assertIsNone(r.get(next_page_token))
+
+    def test_tampered_token_rejected(self):
+        page_token = _create_page_token({}, 10)
+        tampered = page_token[:-1] + (
+            "A" if page_token[-1] != "A" else "B"
+        )
+        self.assertEqual(
+            _get_paginated_bookings(tampered),
+            {"error": "Page token does not exist"}
+        )
+
+    def test_expired_token_rejected(self):
+        page_token = _create_page_token({}, 10)
+        with unittest.mock.patch(
+            'roombookings.helpers.TOKEN_EXPIRY_TIME',
+            -1
+        ):
+            self.assertEqual(
+                _get_paginated_bookings(page_token),
+                {"error": "Page token does not exist"}
+            )
+
+
+class RoomQueryCountTestCase(GencacheTestMixin, TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        user = User.objects.create(cn="test", employee_id=7357)
+        self.app = App.objects.create(user=user, name="An App")
+
+        Lock.objects.all().delete()
+        Lock.objects.create(a=False, b=True)
+
+        SiteLocation.objects.create(siteid='238', lat='51.5', lng='-0.1')
+        self._add_rooms(0, 5)
+
+    def _add_rooms(self, start, end):
+        for i in range(start, end):
+            RoomA.objects.create(
+                siteid='238',
+                roomid=str(i),
+                roomname='Room {}'.format(i),
+                bookabletype='CB'
+            )
+            # Only some rooms have their own location
+            if i % 2:
+                Location.objects.create(
+                    siteid='238',
+                    roomid=str(i),
+                    lat='51.{}'.format(i),
+                    lng='-0.{}'.format(i)
+                )
+
+    def _count_queries(self, view, params):
+        params['token'] = self.app.api_token
+        request = self.factory.get('/roombookings/', params)
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections['gencache']) as gencache:
+            response = view(request)
+        self.assertEqual(response.status_code, 200)
+        return len(default) + len(gencache)
+
+    def _assert_constant_queries(self, view, params):
+        # The first call warms up the token cache
+        self._count_queries(view, dict(params))
+        queries = self._count_queries(view, dict(params))
+
+        self._add_rooms(5, 50)
+        self.assertEqual(self._count_queries(view, dict(params)), queries)
+
+    def test_get_rooms(self):
+        self._assert_constant_queries(get_rooms, {})
+
+    def test_get_free_rooms(self):
+        self._assert_constant_queries(get_free_rooms, {
+            'start_datetime': '2019-10-14T09:00:00+01:00',
+            'end_datetime': '2019-10-14T10:00:00+01:00'
+        })
+
+    def test_serialize_rooms(self):
+        rooms = RoomA.objects.order_by('id')
+        with self.assertNumQueries(2):
+            serialized = _serialize_rooms(rooms)
+
+        self.assertEqual(
+            serialized[0]['location']['coordinates'],
+            {'lat': '51.5', 'lng': '-0.1'}
+        )
+        self.assertEqual(
+            serialized[1]['location']['coordinates'],
+            {'lat': '51.1', 'lng': '-0.1'}
+        )
+
+    def test_coordinates_of_other_rooms_not_loaded(self):
+        SiteLocation.objects.create(siteid='240', lat='51.6', lng='-0.2')
+        Location.objects.create(siteid='240', roomid='99', lat='1', lng='1')
+
+        room_coordinates, site_coordinates = _get_coordinate_maps(
+            RoomA.objects.all()
+        )
+        self.assertEqual(set(site_coordinates), {'238'})
+        self.assertEqual(
+            set(room_coordinates),
+            {('238', '1'), ('238', '3')}
+        )
+
+
+class UtilisationTestCase(SimpleTestCase):
+    # Monday 14th October 2019
+    monday = datetime.datetime(2019, 10, 14)
+
+    def _booking(self, roomid, day, start_hour, end_hour):
+        day = self.monday + datetime.timedelta(days=day)
+        return (
+            roomid,
+            '238',
+            day + datetime.timedelta(hours=start_hour),
+            day + datetime.timedelta(hours=end_hour)
+        )
+
+    def setUp(self):
+        self.stats = utilisation.build_utilisation(build_occupancy_bitmaps([
+            self._booking('1', 0, 9, 11),
+            # Overlaps the booking above, so only adds an hour
+            self._booking('1', 0, 10, 12),
+            # Only the hour before closing counts towards utilisation
+            self._booking('1', 1, 17, 20),
+            # Nothing at the weekend counts towards utilisation
+            self._booking('1', 5, 10, 12),
+            self._booking('1', 7, 10, 11),
+        ]))
+
+    def test_build_utilisation(self):
+        stats = self.stats['238|1']
+        self.assertEqual(stats['days'], {
+            '2019-10-14': {
+                'minutes': 180,
+                'hours': {'9': 60, '10': 60, '11': 60}
+            },
+            '2019-10-15': {'minutes': 60, 'hours': {'17': 60}},
+            '2019-10-21': {'minutes': 60, 'hours': {'10': 60}}
+        })
+
+    def test_summarise_by_week(self):
+        start = datetime.date(2019, 10, 14)
+        end = datetime.date(2019, 10, 27)
+        calendar = utilisation.get_opening_calendar(start, end, 'week')
+        summary = utilisation.summarise_room(
+            self.stats['238|1'],
+            start,
+            end,
+            'week',
+            calendar
+        )
+
+        self.assertEqual(summary['booked_minutes'], 300)
+        # Two weeks of five nine hour days
+        self.assertEqual(summary['opening_minutes'], 2 * 5 * 9 * 60)
+        self.assertEqual(summary['utilisation'], 5.6)
+        self.assertEqual(summary['peak_hours'][0], 10)
+        self.assertEqual(summary['periods'], [
+            {
+                'start_date': '2019-10-14',
+                'booked_minutes': 240,
+                'opening_minutes': 2700,
+                'utilisation': 8.9
+            },
+            {
+                'start_date': '2019-10-21',
+                'booked_minutes': 60,
+                'opening_minutes': 2700,
+                'utilisation': 2.2
+            }
+        ])
+
+    def test_summarise_unbooked_room(self):
+        start = datetime.date(2019, 10, 14)
+        end = datetime.date(2019, 10, 14)
+        calendar = utilisation.get_opening_calendar(start, end, 'day')
+        summary = utilisation.summarise_room(
+            None,
+            start,
+            end,
+            'day',
+            calendar
+        )
+        self.assertEqual(summary['booked_minutes'], 0)
+        self.assertEqual(summary['utilisation'], 0)
+        self.assertEqual(summary['periods'], [])
+
+    def test_peak_hours_in_date_range(self):
+        def get_peak_hours(day):
+            calendar = utilisation.get_opening_calendar(day, day, 'day')
+            return utilisation.summarise_room(
+                self.stats['238|1'],
+                day,
+                day,
+                'day',
+                calendar
+            )['peak_hours']
+
+        self.assertEqual(get_peak_hours(datetime.date(2019, 10, 15)), [17])
+        self.assertEqual(get_peak_hours(datetime.date(2019, 10, 21)), [10])
+        # Weekend bookings are never peak hours
+        self.assertEqual(get_peak_hours(datetime.date(2019, 10, 19)), [])
+
+
+class UtilisationEndpointTestCase(GencacheTestMixin, TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        user = User.objects.create(cn="test", employee_id=7357)
+        self.app = App.objects.create(user=user, name="An App")
+
+        Lock.objects.all().delete()
+        Lock.objects.create(a=False, b=True)
+
+        for roomid in ['1', '2']:
+            RoomA.objects.create(
+                siteid='238',
+                roomid=roomid,
+                roomname='Room {}'.format(roomid),
+                bookabletype='CB'
+            )
+        BookingA.objects.create(
+            siteid='238',
+            roomid='1',
+            bookabletype='CB',
+            startdatetime=datetime.datetime(2019, 10, 14, 9),
+            finishdatetime=datetime.datetime(2019, 10, 14, 18)
+        )
+
+        # As update_gencache does, before the lock is inverted
+        old_lock = unittest.mock.Mock(a=True)
+        store_occupancy_bitmaps(old_lock)
+        utilisation.store_utilisation(
+            old_lock,
+            build_occupancy_bitmaps([
+                ('1', '238', b.startdatetime, b.finishdatetime)
+                for b in BookingA.objects.all()
+            ])
+        )
+        # Statistics from other tests may be cached for this generation
+        utilisation._utilisation_generation = None
+
+    def _get(self, params):
+        params['token'] = self.app.api_token
+        request = self.factory.get('/roombookings/utilisation', params)
+        return json.loads(get_utilisation(request).content.decode())
+
+    def test_get_utilisation(self):
+        content = self._get({'period': 'day'})
+
+        self.assertTrue(content['ok'])
+        self.assertEqual(content['start_date'], '2019-10-14')
+        self.assertEqual(content['end_date'], '2019-10-14')
+        rooms = {room['roomid']: room for room in content['rooms']}
+        self.assertEqual(rooms['1']['utilisation'], 100)
+        self.assertEqual(rooms['1']['roomname'], 'Room 1')
+        self.assertEqual(rooms['2']['utilisation'], 0)
+        self.assertEqual(rooms['2']['periods'], [])
+
+    def test_room_filter(self):
+        content = self._get({'roomid': '2'})
+        self.assertEqual(
+            [room['roomid'] for room in content['rooms']],
+            ['2']
+        )
+
+    def test_invalid_period(self):
+        content = self._get({'period': 'month'})
+        self.assertFalse(content['ok'])
+
+    def test_dates_clamped(self):
+        content = self._get({
+            'start_date': '00010101',
+            'end_date': '99991231'
+        })
+
+        self.assertTrue(content['ok'])
+        self.assertEqual(content['start_date'], '2019-10-14')
+        self.assertEqual(content['end_date'], '2019-10-14')
+        rooms = {room['roomid']: room for room in content['rooms']}
+        self.assertEqual(rooms['1']['utilisation'], 100)
+
+    def test_start_after_end(self):
+        content = self._get({
+            'start_date': '20191015',
+            'end_date': '20191014'
+        })
+        self.assertFalse(content['ok'])
+
+    def test_dates_out_of_range(self):
+        content = self._get({
+            'start_date': '20191101',
+            'end_date': '20191130'
+        })
+        self.assertFalse(content['ok'])
+
+
+class BookingDiffTestCase(SimpleTestCase):
+    def _row(self, booking_id, slotid, title="A booking"):
+        values = {field: None for field in HASHED_FIELDS}
+        values["slotid"] = slotid
+        values["title"] = title
+        return (booking_id, ) + tuple(values[field] for field in HASHED_FIELDS)
+
+    def test_no_changes(self):
+        rows = [self._row(i, i) for i in range(5)]
+        # IDs can differ between buckets without it being a change
+        new_rows = [self._row(i + 10, i) for i in range(5)]
+        diff = BookingDiff(iter(rows), iter(new_rows))
+        self.assertEqual(diff.added_ids, [])
+        self.assertEqual(diff.removed_ids, [])
+
+    def test_added_and_removed(self):
+        diff = BookingDiff(
+            iter([self._row(1, 1), self._row(2, 2)]),
+            iter([self._row(3, 2), self._row(4, 3)])
+        )
+        self.assertEqual(diff.added_ids, [4])
+        self.assertEqual(diff.removed_ids, [1])
+
+    def test_changed(self):
+        diff = BookingDiff(
+            iter([self._row(1, 1)]),
+            iter([self._row(2, 1, title="Renamed")])
+        )
+        self.assertEqual(diff.added_ids, [2])
+        self.assertEqual(diff.removed_ids, [1])
+
+    def test_duplicates(self):
+        diff = BookingDiff(
+            iter([self._row(1, 1)]),
+            iter([self._row(2, 1), self._row(3, 1)])
+        )
+        self.assertEqual(len(diff.added_ids), 1)
+        self.assertEqual(diff.removed_ids, [])
+
+
+class BookingDiffDatabaseTestCase(GencacheTestMixin, TestCase):
+    def _create(self, model, slotid, title):
+        return model.objects.create(
+            siteid='238',
+            roomid='1',
+            roomname='Room 1',
+            slotid=slotid,
+            title=title,
+            startdatetime=datetime.datetime(2019, 10, 14, 9),
+            finishdatetime=datetime.datetime(2019, 10, 14, 10)
+        )
+
+    def test_changed_bookings_serialised(self):
+        self._create(BookingA, 1, "Kept")
+        self._create(BookingA, 2, "Old title")
+        self._create(BookingB, 1, "Kept")
+        self._create(BookingB, 2, "New title")
+
+        diff = BookingDiff(
+            get_booking_rows(BookingA.objects.all()),
+            get_booking_rows(BookingB.objects.all())
+        )
+        added = list(
+            iter_serialized_bookings(BookingB.objects.all(), diff.added_ids)
+        )
+        removed = list(
+            iter_serialized_bookings(BookingA.objects.all(), diff.removed_ids)
+        )
+
+        self.assertEqual([b["description"] for b in added], ["New title"])
+        self.assertEqual([b["description"] for b in removed], ["Old title"])
+        self.assertEqual(added[0]["start_time"], "2019-10-14T09:00:00+01:00")
+
+
+class ContactMatcherTestCase(SimpleTestCase):
+    def test_overlapping_patterns(self):
+        matcher = ContactMatcher(["he", "she", "his", "hers"])
+        self.assertEqual(matcher.find("ushers"), {"he", "she", "hers"})
+
+    def test_no_match(self):
+        matcher = ContactMatcher(["Smith"])
+        self.assertEqual(matcher.find("Smyth"), set())
+        self.assertEqual(matcher.find(""), set())
+
+    def test_no_patterns(self):
+        self.assertEqual(ContactMatcher([]).find("Smith"), set())
+
+
+class WebhookIndexTestCase(SimpleTestCase):
+    def _matches(self, webhook, booking):
+        # The filter trigger_webhooks used to run for every webhook
+        return (
+            (webhook.siteid == '' or booking["siteid"] == webhook.siteid) and
+            (webhook.roomid == '' or booking["roomid"] == webhook.roomid) and
+            (
+                webhook.contact == '' or
+                webhook.contact in str(booking["contact"])
+            )
+        )
+
+    def test_matches_filter(self):
+        webhooks = [
+            FakeModelClass(id=i, siteid=siteid, roomid=roomid, contact=contact)
+            for i, (siteid, roomid, contact) in enumerate(
+                (siteid, roomid, contact)
+                for siteid in ['', '086', '212']
+                for roomid in ['', '433', '101']
+                for contact in ['', 'Smith', 'John', 'n S']
+            )
+        ]
+        bookings = [
+            {"siteid": siteid, "roomid": roomid, "contact": contact}
+            for siteid in ['', '086', '999']
+            for roomid in ['', '433', '999']
+            for contact in [None, '', 'John Smith', 'Jane Doe']
+        ]
+
+        index = WebhookIndex(webhooks)
+        for booking in bookings:
+            self.assertEqual(
+                sorted(webhook.id for webhook in index.match(booking)),
+                [
+                    webhook.id for webhook in webhooks
+                    if self._matches(webhook, booking)
+                ]
+            )
+
+    def test_route(self):
+        webhooks = [
+            FakeModelClass(id=1, siteid='086', roomid='', contact=''),
+            FakeModelClass(id=2, siteid='', roomid='', contact='Smith'),
+            FakeModelClass(id=3, siteid='212', roomid='', contact='')
+        ]
+        bookings = [
+            {"siteid": "086", "roomid": "433", "contact": "John Smith"},
+            {"siteid": "086", "roomid": "101", "contact": "Jane Doe"},
+            {"siteid": "212", "roomid": "101", "contact": "Ann Smith"}
+        ]
+
+        routed = WebhookIndex(webhooks).route(bookings)
+        self.assertEqual(routed[1], bookings[:2])
+        self.assertEqual(routed[2], [bookings[0], bookings[2]])
+        self.assertEqual(routed[3], [bookings[2]])
+
+    def test_route_nothing_matched(self):
+        webhooks = [
+            FakeModelClass(id=1, siteid='086', roomid='', contact='')
+        ]
+        bookings = [{"siteid": "212", "roomid": "101", "contact": "Smith"}]
+        self.assertEqual(WebhookIndex(webhooks).route(bookings), {})
@@ -7,4 +7,5 @@ urlpatterns = [
     url(r'^bookings$', roombookings.views.get_bookings),
     url(r'^equipment$', roombookings.views.get_equipment),
     url(r'^freerooms$', roombookings.views.get_free_rooms),
+    url(r'^utilisation$', roombookings.views.get_utilisation),
 ]
@@ -0,0 +1,253 @@
+import datetime
+import json
+import threading
+
+from django.conf import settings
+
+from .occupancy import (
+    SLOT_MINUTES,
+    SLOTS_PER_DAY,
+    _get_bucket_name,
+    _get_generation,
+    _get_next_bucket_name,
+    _room_field,
+    _slot_mask
+)
+from common.redis_pool import get_redis
+
+
+UTILISATION_KEY_PREFIX = "roombookings:utilisation:"
+
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+HOUR_MASK = (1 << SLOTS_PER_HOUR) - 1
+
+# How many of a room's busiest hours of the day to report
+PEAK_HOURS_COUNT = 3
+
+
+def _popcount(value):
+    return bin(value).count("1")
+
+
+def _parse_time(time_string):
+    return datetime.datetime.strptime(time_string, "%H:%M").time()
+
+
+def _get_opening_slots():
+    opening_time = _parse_time(settings.ROOMBOOKINGS_OPENING_TIME)
+    closing_time = _parse_time(settings.ROOMBOOKINGS_CLOSING_TIME)
+    return (
+        (opening_time.hour * 60 + opening_time.minute) // SLOT_MINUTES,
+        (closing_time.hour * 60 + closing_time.minute) // SLOT_MINUTES
+    )
+
+
+def get_opening_minutes(day):
+    """Returns how many minutes rooms are open for on day"""
+    if day.weekday() not in settings.ROOMBOOKINGS_OPEN_DAYS:
+        return 0
+    opening_slot, closing_slot = _get_opening_slots()
+    return (closing_slot - opening_slot) * SLOT_MINUTES
+
+
+def build_utilisation(bitmaps):
+    """
+    Aggregates occupancy bitmaps, as returned by build_occupancy_bitmaps,
+    into a map of room field to the room's statistics:
+        days: a map of ISO date to the room's statistics for that day, for
+            every open day it was booked within opening hours at all:
+            minutes: the minutes it was booked within opening hours
+            hours: a map of each hour of the day (as a string, as it will
+                be once stored as JSON) to the minutes it was booked within
+                opening hours in that hour, for the hours it was booked
+    Working from the bitmaps rather than the bookings means overlapping
+    bookings are only counted once. Hours are kept per day so that peak
+    hours can be worked out for any range of days.
+    """
+    opening_slot, closing_slot = _get_opening_slots()
+    opening_mask = _slot_mask(opening_slot, min(closing_slot, SLOTS_PER_DAY))
+
+    utilisation = {}
+    for day, rooms in bitmaps.items():
+        is_open = day.weekday() in settings.ROOMBOOKINGS_OPEN_DAYS
+        for (roomid, siteid), bitmap in rooms.items():
+            stats = utilisation.setdefault(_room_field(roomid, siteid), {
+                "days": {}
+            })
+            if not is_open:
+                continue
+
+            bitmap &= opening_mask
+            if not bitmap:
+                continue
+
+            hours = {}
+            for hour in range(24):
+                hour_bitmap = (bitmap >> (hour * SLOTS_PER_HOUR)) & HOUR_MASK
+                if hour_bitmap:
+                    hours[str(hour)] = _popcount(hour_bitmap) * SLOT_MINUTES
+            stats["days"][day.isoformat()] = {
+                "minutes": _popcount(bitmap) * SLOT_MINUTES,
+                "hours": hours
+            }
+
+    return utilisation
+
+
+def store_utilisation(lock, bitmaps):
+    """
+    Stores utilisation statistics built from bitmaps in Redis, for the
+    bucket that roombookings will read from once lock has been inverted.
+    Along with the statistics, the range of days covered is stored so that
+    rooms which were never booked can still be reported on.
+    """
+    utilisation = build_utilisation(bitmaps)
+    days = sorted(bitmaps.keys())
+
+    key = UTILISATION_KEY_PREFIX + _get_next_bucket_name(lock)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.delete(key, key + ":range")
+    if utilisation:
+        pipe.hmset(key, {
+            field: json.dumps(stats)
+            for field, stats in utilisation.items()
+        })
+    if days:
+        pipe.set(key + ":range", json.dumps([
+            days[0].isoformat(),
+            days[-1].isoformat()
+        ]))
+    pipe.execute()
+
+    return utilisation
+
+
+# Each worker process loads the statistics for the current gencache
+# generation the first time they are needed, and keeps them until the
+# generation changes.
+_utilisation = None
+_utilisation_generation = None
+_utilisation_lock = threading.Lock()
+
+
+def load_utilisation(lock):
+    """
+    Returns a tuple of the utilisation statistics for the bucket that lock
+    says is current, and the first and last dates that they cover. Returns
+    None if update_gencache has not stored any for that bucket yet.
+    """
+    global _utilisation, _utilisation_generation
+
+    generation = _get_generation(lock)
+    if _utilisation_generation == generation:
+        return _utilisation
+
+    with _utilisation_lock:
+        if _utilisation_generation != generation:
+            key = UTILISATION_KEY_PREFIX + _get_bucket_name(lock)
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.hgetall(key)
+            pipe.get(key + ":range")
+            stats, day_range = pipe.execute()
+
+            if day_range is None:
+                _utilisation = None
+            else:
+                first_day, last_day = json.loads(day_range.decode())
+                _utilisation = (
+                    {
+                        field.decode(): json.loads(value.decode())
+                        for field, value in stats.items()
+                    },
+                    datetime.datetime.strptime(first_day, "%Y-%m-%d").date(),
+                    datetime.datetime.strptime(last_day, "%Y-%m-%d").date()
+                )
+            _utilisation_generation = generation
+        return _utilisation
+
+
+def _percentage(booked_minutes, opening_minutes):
+    if not opening_minutes:
+        return None
+    return round(100 * booked_minutes / opening_minutes, 1)
+
+
+def _get_period_start(day, period):
+    if period == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    return day
+
+
+def get_opening_calendar(start_date, end_date, period):
+    """
+    Returns a map of the start of each "day" or "week" (starting on
+    Mondays) from start_date to end_date inclusive to the number of minutes
+    rooms are open for in it. This is the same for every room, so it is
+    worked out once per request.
+    """
+    calendar = {}
+    day = start_date
+    while day <= end_date:
+        period_start = _get_period_start(day, period)
+        calendar[period_start] = (
+            calendar.get(period_start, 0) + get_opening_minutes(day)
+        )
+        day += datetime.timedelta(days=1)
+    return calendar
+
+
+def summarise_room(stats, start_date, end_date, period, calendar):
+    """
+    Summarises a room's statistics from start_date to end_date inclusive,
+    broken down by period, using the calendar from get_opening_calendar.
+    stats may be None for a room that was never booked. Periods in which
+    the room was not booked at all are left out of the breakdown, so this
+    only has to look at the days on which the room was booked. Peak hours
+    are likewise the busiest hours over those days alone.
+    """
+    stats = stats or {"days": {}}
+    start_date = start_date.isoformat()
+    end_date = end_date.isoformat()
+
+    periods = {}
+    hours = [0] * 24
+    for day, day_stats in stats["days"].items():
+        # ISO dates sort in the same order as the dates themselves
+        if start_date <= day <= end_date:
+            period_start = _get_period_start(
+                datetime.datetime.strptime(day, "%Y-%m-%d").date(),
+                period
+            )
+            periods[period_start] = (
+                periods.get(period_start, 0) + day_stats["minutes"]
+            )
+            for hour, minutes in day_stats["hours"].items():
+                hours[int(hour)] += minutes
+
+    booked_minutes = sum(periods.values())
+    opening_minutes = sum(calendar.values())
+
+    peak_hours = sorted(
+        (hour for hour in range(24) if hours[hour]),
+        key=lambda hour: hours[hour],
+        reverse=True
+    )[:PEAK_HOURS_COUNT]
+
+    return {
+        "booked_minutes": booked_minutes,
+        "opening_minutes": opening_minutes,
+        "utilisation": _percentage(booked_minutes, opening_minutes),
+        "peak_hours": peak_hours,
+        "periods": [
+            {
+                "start_date": period_start.isoformat(),
+                "booked_minutes": period_booked,
+                "opening_minutes": calendar[period_start],
+                "utilisation": _percentage(
+                    period_booked,
+                    calendar[period_start]
+                )
+            }
+            for period_start, period_booked in sorted(periods.items())
+        ]
+    }
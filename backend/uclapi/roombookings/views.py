@@ -1,3 +1,4 @@
+import datetime
 from functools import reduce
 
 from rest_framework.decorators import api_view
@@ -7,9 +8,13 @@ from django.db.models import Q
 from .helpers import (PrettyJsonResponse, _create_page_token,
                       _get_paginated_bookings, _parse_datetime,
                       _return_json_bookings, _serialize_equipment,
-                      _serialize_rooms, _filter_for_free_rooms, _round_date)
-from .models import BookingA, BookingB, Equipment, RoomA, RoomB
-from timetable.models import Lock
+                      _serialize_rooms)
+from .models import Equipment, RoomA, RoomB
+from .occupancy import (OccupancyBitmaps, _room_field,
+                        get_room_interval_index)
+from .utilisation import (get_opening_calendar, load_utilisation,
+                          summarise_room)
+from timetable.lock_cache import get_lock
 from common.decorators import uclapi_protected_endpoint
 
 
@@ -34,7 +39,7 @@ def get_rooms(request, *args, **kwargs):
     # - Filtered by this academic year only
     # - Anything centrally bookable
     # - All ICH rooms (Site IDs 238 and 240)
-    lock = Lock.objects.all()[0]
+    lock = get_lock()
     curr = RoomA if not lock.a else RoomB
 
     # No filters provided, return all rooms serialised
@@ -125,17 +130,9 @@ def get_bookings(request, *args, **kwargs):
     # create a database entry for token
     page_token = _create_page_token(request_params, results_per_page)
 
-    # first page
+    # first page, which includes the total number of bookings
     bookings = _get_paginated_bookings(page_token)
 
-    lock = Lock.objects.all()[0]
-    curr = BookingA if not lock.a else BookingB
-
-    bookings["count"] = curr.objects.filter(
-        Q(bookabletype='CB') | Q(siteid='238') | Q(siteid='240'),
-        **request_params
-    ).count()
-
     return _return_json_bookings(bookings, custom_header_data=kwargs)
 
 
@@ -206,22 +203,7 @@ def get_free_rooms(request, *args, **kwargs):
             "error": "date/time isn't formatted as suggested in the docs"
         }, custom_header_data=kwargs)
 
-    # Rounding down start date to start of day
-    request_params["startdatetime__gte"] = _round_date(start)
-
-    # Rounding up end date to start of next day
-    request_params["finishdatetime__lte"] = _round_date(end, up=True)
-
-    # Pagination Logic
-    # maxing out results_per_page to get all the bookings in one page
-    results_per_page = 100000
-    request_params = {k: v for k, v in request_params.items() if v}
-    page_token = _create_page_token(request_params, results_per_page)
-
-    # All bookings in the given time period
-    bookings = _get_paginated_bookings(page_token)["bookings"]
-
-    lock = Lock.objects.all()[0]
+    lock = get_lock()
     curr = RoomA if not lock.a else RoomB
 
     # Get available rooms:
@@ -233,10 +215,115 @@ def get_free_rooms(request, *args, **kwargs):
     )
     all_rooms = _serialize_rooms(all_rooms)
 
-    free_rooms = _filter_for_free_rooms(all_rooms, bookings, start, end)
+    # Periods on a slot boundary are checked against the occupancy bitmaps
+    # built by update_gencache. Anything else is checked against an
+    # in-memory index of every booking, which is built once each time the
+    # cache is updated.
+    bitmaps = OccupancyBitmaps(lock)
+    if bitmaps.can_answer(start, end) and bitmaps.is_available():
+        free_rooms = bitmaps.free_rooms(all_rooms, start, end)
+    else:
+        free_rooms = get_room_interval_index(lock).free_rooms(
+            all_rooms,
+            start,
+            end
+        )
 
     return PrettyJsonResponse({
         "ok": True,
         "count": len(free_rooms),
         "free_rooms": free_rooms
     }, custom_header_data=kwargs)
+
+
+@api_view(['GET'])
+@uclapi_protected_endpoint(
+    last_modified_redis_key='gencache'  # Precomputed from cached data
+)
+def get_utilisation(request, *args, **kwargs):
+    period = request.GET.get('period') or 'week'
+    if period not in ('day', 'week'):
+        return PrettyJsonResponse({
+            "ok": False,
+            "error": "period should be either day or week"
+        }, custom_header_data=kwargs)
+
+    lock = get_lock()
+    utilisation = load_utilisation(lock)
+    if utilisation is None:
+        return PrettyJsonResponse({
+            "ok": False,
+            "error": "Utilisation statistics are not available yet"
+        }, custom_header_data=kwargs)
+    room_stats, first_date, last_date = utilisation
+
+    start_date = first_date
+    end_date = last_date
+    try:
+        if request.GET.get('start_date'):
+            start_date = datetime.datetime.strptime(
+                request.GET['start_date'], "%Y%m%d"
+            ).date()
+        if request.GET.get('end_date'):
+            end_date = datetime.datetime.strptime(
+                request.GET['end_date'], "%Y%m%d"
+            ).date()
+    except ValueError:
+        return PrettyJsonResponse({
+            "ok": False,
+            "error": "date isn't formatted as suggested in the docs"
+        }, custom_header_data=kwargs)
+
+    if start_date > end_date:
+        return PrettyJsonResponse({
+            "ok": False,
+            "error": "start_date should not be after end_date"
+        }, custom_header_data=kwargs)
+
+    # There are no statistics outside of the stored range, so days outside
+    # of it would otherwise count as not being booked at all
+    if start_date > last_date or end_date < first_date:
+        return PrettyJsonResponse({
+            "ok": False,
+            "error": "Utilisation statistics are only available from {} to "
+                     "{}".format(first_date.isoformat(), last_date.isoformat())
+        }, custom_header_data=kwargs)
+    first_date = max(start_date, first_date)
+    last_date = min(end_date, last_date)
+
+    request_params = {}
+    request_params['roomid'] = request.GET.get('roomid')
+    request_params['siteid'] = request.GET.get('siteid')
+    request_params = {k: v for k, v in request_params.items() if v}
+
+    curr = RoomA if not lock.a else RoomB
+    rooms = curr.objects.filter(
+        Q(bookabletype='CB') | Q(siteid='238') | Q(siteid='240'),
+        **request_params
+    ).values_list('roomid', 'siteid', 'roomname')
+
+    calendar = get_opening_calendar(first_date, last_date, period)
+
+    room_utilisation = []
+    for roomid, siteid, roomname in rooms:
+        room = {
+            "roomid": roomid,
+            "siteid": siteid,
+            "roomname": roomname
+        }
+        room.update(summarise_room(
+            room_stats.get(_room_field(roomid, siteid)),
+            first_date,
+            last_date,
+            period,
+            calendar
+        ))
+        room_utilisation.append(room)
+
+    return PrettyJsonResponse({
+        "ok": True,
+        "start_date": first_date.isoformat(),
+        "end_date": last_date.isoformat(),
+        "period": period,
+        "rooms": room_utilisation
+    }, custom_header_data=kwargs)
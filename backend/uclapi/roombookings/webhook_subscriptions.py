@@ -0,0 +1,126 @@
+from collections import OrderedDict, deque
+
+
+class ContactMatcher():
+    """
+    An Aho-Corasick automaton over a set of patterns, which finds every
+    pattern that occurs in a piece of text in a single pass over it, however
+    many patterns there are.
+    """
+
+    def __init__(self, patterns):
+        # State 0 is the root. Each state has its transitions, the state to
+        # fall back to when there is no transition for the next character
+        # and the patterns that end at it.
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].add(pattern)
+
+        # Fall back links are set breadth first, so that every state's link
+        # points to a state that is already complete
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] |= (
+                    self._output[self._fail[next_state]]
+                )
+
+    def find(self, text):
+        """Returns the set of patterns that occur in text"""
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            found |= self._output[state]
+        return found
+
+
+class WebhookIndex():
+    """
+    Routes bookings to the webhooks whose filters they match.
+
+    A webhook matches a booking if its siteid and roomid are blank or equal
+    to the booking's, and its contact is blank or appears anywhere in the
+    booking's contact. Webhooks are grouped by (siteid, roomid), so each
+    booking only has to look up the four groups it could match, and every
+    contact filter is looked for at once with a ContactMatcher.
+    """
+
+    def __init__(self, webhooks):
+        # (siteid, roomid) -> (webhooks with no contact filter,
+        #                      {contact: webhooks filtering on it})
+        self._groups = {}
+        contacts = set()
+        for webhook in webhooks:
+            without_contact, by_contact = self._groups.setdefault(
+                (webhook.siteid, webhook.roomid),
+                ([], {})
+            )
+            if webhook.contact == '':
+                without_contact.append(webhook)
+            else:
+                by_contact.setdefault(webhook.contact, []).append(webhook)
+                contacts.add(webhook.contact)
+
+        self._contact_matcher = ContactMatcher(contacts)
+
+    def match(self, booking):
+        """Returns the webhooks that booking should be sent to"""
+        contacts = None
+        matches = []
+        # A booking with a blank siteid or roomid would otherwise look up
+        # some groups twice
+        keys = OrderedDict.fromkeys([
+            (booking["siteid"], booking["roomid"]),
+            (booking["siteid"], ''),
+            ('', booking["roomid"]),
+            ('', '')
+        ])
+        for key in keys:
+            group = self._groups.get(key)
+            if group is None:
+                continue
+
+            without_contact, by_contact = group
+            matches.extend(without_contact)
+            if by_contact:
+                if contacts is None:
+                    # mimick SQL 'like'
+                    contacts = self._contact_matcher.find(
+                        str(booking["contact"])
+                    )
+                for contact in contacts & by_contact.keys():
+                    matches.extend(by_contact[contact])
+
+        return matches
+
+    def route(self, bookings):
+        """
+        Returns a dictionary of webhook ID to the list of bookings to send
+        to it, in the order they were given. Webhooks with nothing to be
+        sent are left out.
+        """
+        routed = {}
+        for booking in bookings:
+            for webhook in self.match(booking):
+                routed.setdefault(webhook.id, []).append(booking)
+        return routed
@@ -1,7 +1,3 @@
-import datetime
-import json
-
-import redis
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 
@@ -12,29 +8,24 @@ from roombookings.models import (
     RoomB
 )
 
-from .amp import ModuleInstance
-from .models import (DeptsA, DeptsB, LecturerA, LecturerB, Lock, ModuleA,
+from .lock_cache import get_lock
+from .models import (DeptsA, DeptsB, LecturerA, LecturerB, ModuleA,
                      ModuleB, SitesA, SitesB, StudentsA,
                      StudentsB, StumodulesA, StumodulesB,  TimetableA,
                      TimetableB, WeekmapnumericA, WeekmapnumericB,
                      WeekstructureA, WeekstructureB,
                      CminstancesA, CminstancesB)
 from .personal_timetable import get_personal_timetable
-from .tasks import cache_student_timetable
-from .utils import (
-    get_location_coordinates,
-    SESSION_TYPE_MAP
+from .personal_timetable_cache import (
+    get_bucket_name,
+    load_personal_timetable
 )
+from .reference_data import get_reference_data
+from .tasks import cache_student_timetable
+from .utils import SESSION_TYPE_MAP
 
 _SETID = settings.ROOMBOOKINGS_SETID
 
-_week_map = {}
-_week_num_date_map = {}
-_rooms_cache = {}
-_instance_cache = {}
-_lecturers_cache = {}
-_department_name_cache = {}
-
 
 def get_cache(model_name):
     """Returns the cache bucket for the requested model name"""
@@ -55,13 +46,13 @@ def get_cache(model_name):
         "booking": [BookingA, BookingB]
     }
     if model_name in timetable_models:
-        timetable_lock = Lock.objects.all()[0]
+        timetable_lock = get_lock()
         if timetable_lock.a:
             model = timetable_models[model_name][0]
         else:
             model = timetable_models[model_name][1]
     elif model_name in roombookings_models:
-        roombooking_lock = Lock.objects.all()[0]
+        roombooking_lock = get_lock()
         if roombooking_lock.a:
             model = roombookings_models[model_name][0]
         else:
@@ -75,70 +66,67 @@ def get_cache(model_name):
 def _get_full_department_name(department_code):
     """Converts a department code, such as COMPS_ENG, into a full name
     such as Computer Science"""
-    if department_code in _department_name_cache:
-        return _department_name_cache[department_code]
-    else:
-        departments = get_cache("departments")
-        try:
-            dept = departments.objects.get(deptid=department_code)
-            _department_name_cache[department_code] = dept.name
-            return dept.name
-        except ObjectDoesNotExist:
-            return "Unknown"
+    return get_reference_data().get_department_name(department_code)
 
 
 def _get_lecturer_details(lecturer_upi):
     """Returns a lecturer's name and email address from their UPI"""
-    if lecturer_upi in _lecturers_cache:
-        return _lecturers_cache[lecturer_upi]
-    lecturers = get_cache("lecturer")
-    details = {
-        "name": "Unknown",
-        "email": "Unknown",
-        "department_id": "Unknown",
-        "department_name": "Unknown"
-    }
-    try:
-        lecturer = lecturers.objects.get(lecturerid=lecturer_upi)
-    except ObjectDoesNotExist:
-        return details
-
-    details["name"] = lecturer.name
-    details["email"] = lecturer.linkcode + "@ucl.ac.uk"
-
-    if lecturer.owner:
-        details["department_id"] = lecturer.owner
-        details["department_name"] = _get_full_department_name(lecturer.owner)
-    _lecturers_cache[lecturer_upi] = details
-    return details
+    return get_reference_data().get_lecturer(lecturer_upi)
 
 
 def _get_instance_details(instid):
-    if instid in _instance_cache:
-        return _instance_cache[instid]
-    cminstances = get_cache("cminstances")
-    instance_data = cminstances.objects.get(instid=instid)
-    instance = ModuleInstance(instance_data.instcode)
-    data = {
-        "delivery": instance.delivery.get_delivery(),
-        "periods": instance.periods.get_periods(),
-        "instance_code": instance_data.instcode
-    }
-    _instance_cache[instid] = data
+    data = get_reference_data().get_instance(instid)
+    if data is None:
+        raise ObjectDoesNotExist(
+            "There is no instance with ID {}".format(instid)
+        )
     return data
 
 
-def _get_timetable_events(full_modules):
+def _get_module_events(modules):
     """
-    Gets a dictionary of timetabled events for a list of Module objects
+    Returns a dictionary of (moduleid, instid) to the timetabled events of
+    each of the given modules, fetched in a single query
     """
-    if not _week_map:
-        _map_weeks()
-
     timetable = get_cache("timetable")
+    module_keys = {(module.moduleid, module.instid) for module in modules}
+    if not module_keys:
+        return {}
+
+    # Filtering on both lists can fetch events for a module in an instance
+    # that was not asked for, so those are dropped here
+    events_data = timetable.objects.filter(
+        moduleid__in={moduleid for moduleid, _ in module_keys},
+        instid__in={instid for _, instid in module_keys}
+    )
+    module_events = {}
+    for event in events_data:
+        key = (event.moduleid, event.instid)
+        if key in module_keys:
+            module_events.setdefault(key, []).append(event)
+    return module_events
 
+
+def _get_slot_bookings(slotids):
+    """
+    Returns a dictionary of slot ID to the bookings made for each of the
+    given slots, fetched in a single query. Slots with no bookings are left
+    out.
+    """
     bookings = get_cache("booking")
-    event_bookings_list = {}
+    if not slotids:
+        return {}
+
+    slot_bookings = {}
+    for booking in bookings.objects.filter(slotid__in=slotids):
+        slot_bookings.setdefault(booking.slotid, []).append(booking)
+    return slot_bookings
+
+
+def _get_timetable_events(full_modules):
+    """
+    Gets a dictionary of timetabled events for a list of Module objects
+    """
     full_timetable = {}
     modules_chosen = {}
     for module in full_modules:
@@ -151,19 +139,19 @@ def _get_timetable_events(full_modules):
             del modules_chosen[key]
         modules_chosen[lab_key] = module
 
+    module_events = _get_module_events(modules_chosen.values())
+    slot_bookings = _get_slot_bookings({
+        event.slotid
+        for events in module_events.values()
+        for event in events
+    })
+
     for _, module in modules_chosen.items():
-        events_data = timetable.objects.filter(
-            moduleid=module.moduleid,
-            instid=module.instid
-        )
+        events_data = module_events.get((module.moduleid, module.instid), [])
         instance_data = _get_instance_details(module.instid)
         for event in events_data:
-            if event.slotid not in event_bookings_list:
-                event_bookings_list[event.slotid] =  \
-                    bookings.objects.filter(slotid=event.slotid)
-            event_bookings = event_bookings_list[event.slotid]
-            # .exists() instead of len so we don't evaluate all of the filter
-            if not event_bookings.exists():
+            event_bookings = slot_bookings.get(event.slotid)
+            if not event_bookings:
                 # We have to trust the data in the event because
                 # no rooms are booked for some weird reason.
                 for date in _get_real_dates(event):
@@ -261,9 +249,6 @@ def _get_timetable_events(full_modules):
 
 
 def _get_timetable_events_module_list(module_list):
-    if not _week_map:
-        _map_weeks()
-
     modules = get_cache("module")
     cminstances = get_cache("cminstances")
 
@@ -289,31 +274,11 @@ def _get_timetable_events_module_list(module_list):
         except (ObjectDoesNotExist, ValueError):
             return False
 
-    return _get_timetable_events(full_modules, False)
-
-
-def _map_weeks():
-    weekmapnumeric = get_cache("weekmapnumeric")
-    weekstructure = get_cache("weekstructure")
-    week_nums = weekmapnumeric.objects.all()
-    week_strs = weekstructure.objects.all()
-
-    for week in week_strs:
-        _week_num_date_map[week.weeknumber] = week.startdate
-
-    for week in week_nums:
-        if week.weekid not in _week_map:
-            _week_map[week.weekid] = []
-        _week_map[week.weekid].append(week.weeknumber)
+    return _get_timetable_events(full_modules)
 
 
 def _get_real_dates(slot):
-    return [
-        _week_num_date_map[startdate] + datetime.timedelta(
-            days=slot.weekday - 1
-        )
-        for startdate in _week_map[slot.weekid]
-    ]
+    return get_reference_data().get_dates(slot.weekid, slot.weekday)
 
 
 def _get_session_type_str(session_type):
@@ -324,55 +289,18 @@ def _get_session_type_str(session_type):
 
 
 def _get_location_details(siteid, roomid):
-    if not roomid:
-        return {}
-    if not siteid:
-        return {}
-
-    cache_id = siteid + "___" + roomid
-    if cache_id not in _rooms_cache:
-        rooms = get_cache("rooms")
-        sites = get_cache("sites")
-        try:
-            room = rooms.objects.filter(roomid=roomid, siteid=siteid)[0]
-            site = sites.objects.filter(siteid=siteid)[0]
-        except IndexError:
-            return {}
-        lat, lng = get_location_coordinates(siteid, roomid)
-        _rooms_cache[cache_id] = {
-            "name": room.roomname,
-            "capacity": room.capacity,
-            "type": room.bookabletype,
-            "address": [
-                site.address1,
-                site.address2,
-                site.address3,
-                site.address4
-            ],
-            "site_name": site.sitename,
-            "coordinates": {
-                "lat": lat,
-                "lng": lng
-            }
-        }
-
-    return _rooms_cache[cache_id]
+    return get_reference_data().get_location(siteid, roomid)
 
 
 def get_student_timetable(upi, date_filter=None):
-    r = redis.Redis(
-        host=settings.REDIS_UCLAPI_HOST,
-        charset="utf-8",
-        decode_responses=True
-    )
-    timetable_key = "timetable:personal:{}".format(upi)
-    if r.exists(timetable_key):
-        data = r.get(timetable_key)
-        student_events = json.loads(data)
-    else:
-        student_events = get_personal_timetable(upi)
+    # Every student's timetable is precomputed by update_gencache, so it
+    # only has to be built here for students who were missed
+    bucket = get_bucket_name(get_lock())
+    student_events = load_personal_timetable(bucket, upi)
+    if student_events is None:
+        student_events = get_personal_timetable(upi, bucket)
         # Celery task to cache for the next request
-        cache_student_timetable.delay(upi, student_events)
+        cache_student_timetable.delay(upi, student_events, bucket)
 
     if date_filter:
         if date_filter in student_events:
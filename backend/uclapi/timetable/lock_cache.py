@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+
+from collections import namedtuple
+
+from common.redis_pool import get_redis
+
+
+# The state of the gencache lock is published to Redis whenever it changes,
+# and each worker process keeps its own copy for LOCK_CACHE_TTL seconds, so
+# working out which bucket to read never needs a database query. The TTL
+# bounds how long a process can go on reading the old bucket after
+# update_gencache has inverted the lock.
+LOCK_KEY = "gencache:lock"
+LOCK_CACHE_TTL = 5
+
+# In case the lock is ever changed without going through save(), e.g. with
+# a bulk update, Redis is made to go back to the database every so often.
+LOCK_KEY_TTL = 3600
+
+# Incremented every time the lock is saved. The bucket alone cannot tell
+# apart two refreshes of the cache into the same bucket, so anything cached
+# from the cache tables should be keyed by the generation too.
+GENERATION_KEY = "gencache:generation"
+
+LockState = namedtuple("LockState", ["a", "b", "generation"])
+
+_cached_lock = None
+_cached_lock_expiry = 0
+_cached_lock_lock = threading.Lock()
+
+# The lock as it was when the current request first asked for it
+_pinned = threading.local()
+
+
+def _write_lock(lock, replace):
+    # Only touches Redis, so that it can be called while _cached_lock_lock
+    # is held
+    pipe = get_redis().pipeline(transaction=True)
+    if replace:
+        pipe.incr(GENERATION_KEY)
+    pipe.set(
+        LOCK_KEY,
+        json.dumps([bool(lock.a), bool(lock.b)]),
+        ex=LOCK_KEY_TTL,
+        nx=not replace
+    )
+    pipe.execute()
+
+
+def publish_lock(lock, replace=True):
+    """
+    Publishes the state of lock to Redis and starts a new generation. Without
+    replace, the state is only published if there is none already, so that a
+    worker that has just read the lock from the database cannot overwrite a
+    newer state, and the generation is left as it is.
+    """
+    global _cached_lock
+
+    _write_lock(lock, replace)
+    with _cached_lock_lock:
+        _cached_lock = None
+
+
+def forget_lock():
+    """Drops the published state, e.g. because the lock has been deleted"""
+    global _cached_lock
+
+    get_redis().delete(LOCK_KEY)
+    with _cached_lock_lock:
+        _cached_lock = None
+
+
+def _load_lock():
+    state, generation = get_redis().mget(LOCK_KEY, GENERATION_KEY)
+    generation = int(generation or 0)
+    if state is not None:
+        return LockState(*json.loads(state.decode()), generation)
+
+    # Imported here as the models import this module
+    from .models import Lock
+
+    lock = Lock.objects.all()[0]
+    # This is called with _cached_lock_lock held, which publish_lock takes
+    _write_lock(lock, replace=False)
+    return LockState(lock.a, lock.b, generation)
+
+
+def _get_cached_lock():
+    global _cached_lock, _cached_lock_expiry
+
+    lock = _cached_lock
+    if lock is not None and _cached_lock_expiry > time.monotonic():
+        return lock
+
+    with _cached_lock_lock:
+        if _cached_lock is None or _cached_lock_expiry <= time.monotonic():
+            _cached_lock = _load_lock()
+            _cached_lock_expiry = time.monotonic() + LOCK_CACHE_TTL
+        return _cached_lock
+
+
+def get_lock():
+    """
+    Returns the state of the gencache lock (with a and b just like the Lock
+    model, and its generation) without a database query.
+
+    While a request is being handled (see LockSnapshotMiddleware), every call
+    returns the state seen by the first one, so that a request can never
+    read from both buckets if the lock is inverted while it is running.
+    """
+    if not getattr(_pinned, "active", False):
+        return _get_cached_lock()
+
+    if _pinned.lock is None:
+        _pinned.lock = _get_cached_lock()
+    return _pinned.lock
+
+
+def pin_lock():
+    _pinned.active = True
+    _pinned.lock = None
+
+
+def unpin_lock():
+    _pinned.active = False
+    _pinned.lock = None
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from timetable.app_helpers import _get_timetable_events, get_cache
+from timetable.reference_data import get_reference_data_stats
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Times building the timetable of a number of modules from the '
+        'gencache, as /timetable/bymodule does'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modules',
+            type=int,
+            default=10,
+            help='Number of modules to build the timetable of'
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Number of times to build it'
+        )
+
+    def handle(self, *args, **options):
+        timetable = get_cache("timetable")
+        modules = get_cache("module")
+
+        moduleids = list(
+            timetable.objects.exclude(moduleid=None)
+            .order_by('moduleid')
+            .values_list('moduleid', flat=True)
+            .distinct()[:options['modules']]
+        )
+        full_modules = list(modules.objects.filter(moduleid__in=moduleids))
+        if not full_modules:
+            self.stderr.write("There are no timetabled modules in the cache")
+            return
+
+        # The first run also loads the reference data, so it is reported on
+        # its own
+        times = []
+        for _ in range(max(options['runs'], 1)):
+            with CaptureQueriesContext(connections['gencache']) as queries:
+                start_time = time.perf_counter()
+                events = _get_timetable_events(full_modules)
+                times.append(time.perf_counter() - start_time)
+
+        print("Built the timetable of {} modules ({} instances)".format(
+            len(moduleids),
+            len(full_modules)
+        ))
+        print("{} events on {} days".format(
+            sum(len(day) for day in events.values()),
+            len(events)
+        ))
+        print("First run: {:.3f}s".format(times[0]))
+        if len(times) > 1:
+            print("Best run:  {:.3f}s".format(min(times[1:])))
+        print("Queries in the last run: {}".format(len(queries)))
+
+        for stats in get_reference_data_stats():
+            print(
+                "Reference data for generation {} (bucket {}): loaded in "
+                "{:.3f}s, {:.1f} MiB, {:.1%} hit rate".format(
+                    stats["generation"],
+                    stats["bucket"],
+                    stats["load_time"],
+                    stats["size_bytes"] / 2 ** 20,
+                    stats["hit_rate"]
+                )
+            )
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from timetable.lock_cache import get_lock
+from timetable.personal_timetable_cache import (
+    CHUNK_SIZE,
+    get_bucket_name,
+    precompute_personal_timetables
+)
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Precomputes the personal timetable of every student in the current '
+        'gencache bucket. update_gencache does this for the next bucket '
+        'every time it runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Number of timetables to build at once'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Number of students each worker is given at a time'
+        )
+
+    def handle(self, *args, **options):
+        bucket = get_bucket_name(get_lock())
+
+        start_time = time.time()
+        precomputed = precompute_personal_timetables(
+            bucket,
+            options['workers'],
+            options['chunk_size']
+        )
+        print("Stored {} personal timetables from bucket {} in {:.1f}s".format(
+            precomputed,
+            bucket.upper(),
+            time.time() - start_time
+        ))
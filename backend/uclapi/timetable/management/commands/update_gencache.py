@@ -1,11 +1,16 @@
 import gc
+import hashlib
+import io
+import json
+import math
 
 import django
-import redis
 
 import time
 
+from collections import defaultdict
 from datetime import datetime
+from itertools import islice
 from multiprocessing import Pool
 
 from django.apps import apps
@@ -23,9 +28,12 @@ if not apps.ready and not settings.configured:
     django.setup()
 
 from common.helpers import LOCAL_TIMEZONE
+from common.redis_pool import get_redis
 from roombookings.models import \
     Room, RoomA, RoomB, \
     Booking, BookingA, BookingB
+from roombookings.occupancy import store_occupancy_bitmaps
+from roombookings.utilisation import store_utilisation
 from timetable.models import \
     Cminstances, CminstancesA, CminstancesB, \
     Course, CourseA, CourseB, \
@@ -42,6 +50,11 @@ from timetable.models import \
     Weekmapstring, WeekmapstringA, WeekmapstringB, \
     Weekstructure, WeekstructureA, WeekstructureB, \
     Lock
+from timetable.personal_timetable_cache import (
+    get_bucket_name,
+    precompute_personal_timetables,
+    retire_personal_timetables
+)
 
 
 """
@@ -77,120 +90,302 @@ tables = [
 ]
 
 
-def cache_table_process(index, destination_table_index, options):
-    # Number of objects to load into RAM at once from Oracle
-    # when chunking.
-    load_batch_size = 10000
-    # Maxmimum number of objects to insert into PostgreSQL
-    # at once.
-    insert_batch_size = 5000
+def drop_indexes(model):
+    """
+    Drops the indexes declared on a cache model. Keeping indexes up to date
+    row by row makes bulk loading much slower than building them once the
+    table is full, so they are dropped before a load and rebuilt after it
+    by build_indexes.
+    """
+    connection = connections['gencache']
+    with connection.cursor() as cursor:
+        for index in model._meta.indexes:
+            # IF EXISTS as a previous run may have died mid-load
+            cursor.execute("DROP INDEX IF EXISTS {};".format(
+                connection.ops.quote_name(index.name)
+            ))
 
-    table_data = tables[index]
 
-    # Delete existing cached data
-    gencache_cursor = connections['gencache'].cursor()
-    table_prefix = "roombookings_" if table_data[4] else "timetable_"
-    gencache_cursor.execute(
-        "TRUNCATE TABLE {}{} RESTART IDENTITY;".format(
-                table_prefix,
-                table_data[destination_table_index].__name__.lower()
+def build_indexes(model):
+    """
+    Builds the indexes declared on a cache model, then refreshes the table's
+    statistics so that the planner knows how to use them.
+    """
+    connection = connections['gencache']
+    with connection.schema_editor() as editor:
+        for index in model._meta.indexes:
+            editor.add_index(model, index)
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE {};".format(
+            connection.ops.quote_name(model._meta.db_table)
+        ))
+
+
+# Characters that have to be escaped in COPY's text format
+COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r'
+})
+
+
+def normalise_value(value):
+    """
+    Empty strings and zeroes from Oracle are stored as such, but any other
+    falsy value is stored as NULL.
+    """
+    if value:
+        return value
+    if isinstance(value, str):
+        return ''
+    if isinstance(value, int):
+        return 0
+    return None
+
+
+def copy_rows(model, columns, rows):
+    """
+    Loads rows (sequences of values in the same order as columns) into the
+    table for model with a single COPY. This skips building a model instance
+    for every row, and is much faster than the multi-row INSERTs that
+    bulk_create sends.
+    """
+    connection = connections['gencache']
+    # Convert values just as bulk_create would have done
+    converters = [
+        model._meta.get_field(column).get_db_prep_save
+        for column in columns
+    ]
+
+    buffer = io.StringIO()
+    for row in rows:
+        values = []
+        for convert, value in zip(converters, row):
+            value = convert(value, connection)
+            if value is None:
+                values.append('\\N')
+            else:
+                values.append(str(value).translate(COPY_ESCAPES))
+        buffer.write('\t'.join(values))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY {} ({}) FROM STDIN;".format(
+                connection.ops.quote_name(model._meta.db_table),
+                ", ".join(
+                    connection.ops.quote_name(column) for column in columns
+                )
+            ),
+            buffer
         )
-    )
 
+
+# The keys that large chunked source tables can be split on, so that
+# several workers can load ranges of them at once
+PARTITION_KEYS = {
+    Booking: "SLOTID",
+    Stumodules: "STUDENTID",
+    Students: "STUDENTID",
+    Timetable: "SLOTID",
+}
+
+# Redis hash holding the timings of the last run, keyed by source table
+TIMINGS_KEY = "gencache:timings"
+
+
+def get_table_timings(redis_client):
+    """
+    Returns the timings recorded for each source table by the last run, as
+    a dictionary of table name to {"seconds", "rows", "partitions"}.
+    """
+    return {
+        table: json.loads(timing)
+        for table, timing in redis_client.hgetall(TIMINGS_KEY).items()
+    }
+
+
+def schedule_tables(timings, workers, partition_rows):
+    """
+    Decides how many partitions to split each table into and the order to
+    load them in, returning a list of (table index, partitions).
+
+    Tables are loaded longest first, going by how long they took last time,
+    so that a big table is not left until the end to run on its own while
+    every other worker sits idle. Tables we have no timings for go first as
+    we cannot tell how big they are.
+    """
+    schedule = []
+    for index, table_data in enumerate(tables):
+        timing = timings.get(table_data[0].__name__)
+        if timing is None:
+            schedule.append((float('inf'), index, 1))
+            continue
+
+        partitions = 1
+        if table_data[5] and table_data[0] in PARTITION_KEYS:
+            partitions = max(1, min(
+                workers,
+                math.ceil(timing["rows"] / partition_rows)
+            ))
+        schedule.append((timing["seconds"] / partitions, index, partitions))
+
+    schedule.sort(key=lambda job: (-job[0], job[1]))
+    return [(index, partitions) for _, index, partitions in schedule]
+
+
+def _source_filter(table_data, partition=None):
+    """
+    Returns the WHERE clause and parameters that select the rows of a source
+    table to be cached, limited to a (lower, upper) key range if given.
+    Ranges include their lower bound and exclude their upper bound, and
+    either can be None for no bound. Rows with a NULL key go in the range
+    with no lower bound.
+    """
+    conditions = []
+    params = []
+    if table_data[3]:
+        conditions.append("SETID = %s")
+        params.append(settings.ROOMBOOKINGS_SETID)
+
+    if partition is not None:
+        key = PARTITION_KEYS[table_data[0]]
+        lower, upper = partition
+        range_conditions = []
+        if lower is not None:
+            range_conditions.append("{} >= %s".format(key))
+            params.append(lower)
+        if upper is not None:
+            range_conditions.append("{} < %s".format(key))
+            params.append(upper)
+
+        if range_conditions:
+            range_clause = " AND ".join(range_conditions)
+            if lower is None:
+                range_clause = "({} OR {} IS NULL)".format(range_clause, key)
+            conditions.append(range_clause)
+
+    if not conditions:
+        return "", params
+    return " WHERE " + " AND ".join(conditions), params
+
+
+def get_partitions(table_data, partitions):
+    """
+    Splits a source table into at most partitions key ranges holding about
+    the same number of rows each.
+    """
+    if partitions < 2:
+        return [None]
+
+    key = PARTITION_KEYS[table_data[0]]
+    where, params = _source_filter(table_data)
+    with connections['roombookings'].cursor() as cursor:
+        cursor.execute(
+            "SELECT MIN({key}) FROM ("
+            "SELECT {key}, NTILE({n}) OVER (ORDER BY {key}) AS PART "
+            "FROM {table}{where}"
+            ") GROUP BY PART ORDER BY 1".format(
+                key=key,
+                n=int(partitions),
+                table=table_data[0]._meta.db_table,
+                where=where
+            ),
+            params
+        )
+        # Many rows can share a key (a student takes many modules), so
+        # ranges can collapse into one another.
+        bounds = sorted(set(
+            row[0] for row in cursor.fetchall() if row[0] is not None
+        ))
+
+    # The first range has no lower bound so that it picks up NULL keys
+    lowers = [None] + bounds[1:]
+    uppers = bounds[1:] + [None]
+    return list(zip(lowers, uppers))
+
+
+def prepare_table_process(index, destination_table_index):
+    """Empties a cache table and drops its indexes ready for loading"""
+    table_data = tables[index]
+    destination_model = table_data[destination_table_index]
+
+    with connections['gencache'].cursor() as cursor:
+        cursor.execute("TRUNCATE TABLE {} RESTART IDENTITY;".format(
+            connections['gencache'].ops.quote_name(
+                destination_model._meta.db_table
+            )
+        ))
+    drop_indexes(destination_model)
+
+
+def finish_table_process(index, destination_table_index):
+    """Rebuilds a cache table's indexes, returning how long it took"""
+    start_time = time.time()
+    build_indexes(tables[index][destination_table_index])
+    return index, time.time() - start_time
+
+
+def row_hash(row):
+    """
+    Returns a hash of a source row's values, which is stored with the row in
+    the cache so that an incremental refresh can tell which rows changed.
+    """
+    return hashlib.md5(repr(tuple(row)).encode("utf-8")).hexdigest()
+
+
+def _with_hashes(rows):
+    for row in rows:
+        row = list(row)
+        row.append(row_hash(row))
+        yield row
+
+
+def _read_source(table_data, partition, batch_size):
+    """
+    Reads a source table, or one partition of it. Returns the column names,
+    the number of rows and an iterator over lists of at most batch_size
+    rows.
+    """
     # Decide whether to use a chunked query or not
     if table_data[5]:
         oracle_cursor = connections['roombookings'].cursor()
+        where, params = _source_filter(table_data, partition)
         if table_data[3]:
-            query = "SELECT COUNT(SETID) FROM {} WHERE SETID = '{}'".format(
+            query = "SELECT COUNT(SETID) FROM {}{}".format(
                 table_data[0]._meta.db_table,
-                settings.ROOMBOOKINGS_SETID
+                where
             )
         else:
-            query = "SELECT COUNT(*) FROM {}".format(
-                table_data[0]._meta.db_table
+            query = "SELECT COUNT(*) FROM {}{}".format(
+                table_data[0]._meta.db_table,
+                where
             )
 
-        oracle_cursor.execute(query)
+        oracle_cursor.execute(query, params)
         count_data = oracle_cursor.fetchone()
         total_records = count_data[0]
 
-        if table_data[3]:
-            query = "SELECT * FROM {} WHERE SETID = '{}'".format(
-                table_data[0]._meta.db_table,
-                settings.ROOMBOOKINGS_SETID
-            )
-        else:
-            query = "SELECT * FROM {}".format(
-                table_data[0]._meta.db_table
-            )
+        query = "SELECT * FROM {}{}".format(
+            table_data[0]._meta.db_table,
+            where
+        )
 
-        oracle_cursor.arraysize = load_batch_size
+        oracle_cursor.arraysize = batch_size
 
-        oracle_cursor.execute(query)
+        oracle_cursor.execute(query, params)
 
-        def columns(cursor):
-            return {cd[0]: i for i, cd in enumerate(cursor.description)}
-        cols = columns(oracle_cursor)
+        cols = [cd[0].lower() for cd in oracle_cursor.description]
 
-        if options['unattended']:
-            print("[Start] Chunk caching from {} [{} records]".format(
-                table_data[0].__name__,
-                total_records
-            ))
-        else:
-            progress_title = "Chunk caching from {} [{} records]".format(
-                table_data[0].__name__,
-                total_records
-            )
-            prog = tqdm(
-                desc=progress_title,
-                position=index + 1,
-                total=total_records
-            )
-            prog.update(0)
-
-        new_objs = []
-        objs = oracle_cursor.fetchmany(load_batch_size)
-        while objs:
-            for obj in objs:
-                new_obj = {}
-                for k, v in cols.items():
-                    if obj[v]:
-                        val = obj[v]
-                    else:
-                        if isinstance(obj[v], str):
-                            val = ''
-                        elif isinstance(obj[v], int):
-                            val = 0
-                        else:
-                            val = None
-                    new_obj[k.lower()] = val
-
-                new_objs.append(table_data[destination_table_index](**new_obj))
-
-                if not options['unattended']:
-                    prog.update(1)
-
-                if len(new_objs) >= load_batch_size:
-                    table_data[destination_table_index].objects.using(
-                        'gencache'
-                    ).bulk_create(new_objs, batch_size=insert_batch_size)
-                    new_objs.clear()
-                    gc.collect()
-
-            objs = oracle_cursor.fetchmany(load_batch_size)
-
-        # Insert any items left over
-        table_data[destination_table_index].objects.using(
-            'gencache'
-        ).bulk_create(new_objs, batch_size=insert_batch_size)
-        del new_objs
-        oracle_cursor.close()
-        if options['unattended']:
-            print("[Done!] Chunk caching from {} [{} records]".format(
-                table_data[0].__name__,
-                total_records
-            ))
+        def batches():
+            objs = oracle_cursor.fetchmany(batch_size)
+            while objs:
+                yield [[normalise_value(v) for v in obj] for obj in objs]
+                objs = oracle_cursor.fetchmany(batch_size)
+            oracle_cursor.close()
     else:
         if table_data[3]:
             objs = table_data[0].objects.filter(
@@ -199,53 +394,191 @@ def cache_table_process(index, destination_table_index, options):
         else:
             objs = table_data[0].objects.all()
 
-        new_objs = []
-        item_count = objs.count()
-        if options['unattended']:
-            print("[Start] Loading {} into RAM [{} records]".format(
-                table_data[0].__name__,
-                item_count
-            ))
-        else:
-            ram_load_header = "Loading {} into RAM [{} records]".format(
-                table_data[0].__name__,
-                item_count
-            )
+        total_records = objs.count()
+        cols = [f.attname for f in table_data[0]._meta.concrete_fields]
 
-            prog = tqdm(
-                desc=ram_load_header,
-                position=index + 1,
-                total=item_count
-            )
-            prog.update(0)
+        def batches():
+            rows = objs.values_list(*cols).iterator()
+            batch = list(islice(rows, batch_size))
+            while batch:
+                yield batch
+                batch = list(islice(rows, batch_size))
 
-        for obj in objs:
-            new_objs.append(table_data[destination_table_index](
-                **dict(
-                    map(lambda k: (k, getattr(obj, k)),
-                        map(lambda l: l.name, obj._meta.get_fields())))
-            ))
-            if not options['unattended']:
-                prog.update(1)
+    return cols, total_records, batches()
+
+
+def _cache_table_job(args):
+    return cache_table_process(*args)
+
+
+def cache_table_process(index, destination_table_index, partition, options):
+    """
+    Copies a source table, or one partition of it, into a cache table.
+    Returns the table index with the number of rows copied and how long it
+    took.
+    """
+    start_time = time.time()
+    # Number of rows to load into RAM at once from Oracle, and
+    # to copy into PostgreSQL at once.
+    load_batch_size = 10000
 
+    table_data = tables[index]
+    destination_model = table_data[destination_table_index]
+    table_name = table_data[0].__name__
+    if partition is not None:
+        table_name = "{} [{} to {}]".format(
+            table_name,
+            partition[0] if partition[0] is not None else "start",
+            partition[1] if partition[1] is not None else "end"
+        )
+    action = "Chunk caching from" if table_data[5] else "Loading"
+
+    cols, total_records, batches = _read_source(
+        table_data,
+        partition,
+        load_batch_size
+    )
+
+    if options['unattended']:
+        print("[Start] {} {} [{} records]".format(
+            action,
+            table_name,
+            total_records
+        ))
+    else:
+        progress_title = "{} {} [{} records]".format(
+            action,
+            table_name,
+            total_records
+        )
+        prog = tqdm(
+            desc=progress_title,
+            position=index + 1,
+            total=total_records
+        )
+        prog.update(0)
+
+    for batch in batches:
+        copy_rows(destination_model, cols + ['rowhash'], _with_hashes(batch))
         if not options['unattended']:
-            prog.close()
-
-        table_data[destination_table_index].objects.using(
-            'gencache'
-        ).bulk_create(new_objs, batch_size=insert_batch_size)
-        new_objs.clear()
-        del new_objs
-        del objs
-
-        if options['unattended']:
-            print("[Done!] Loading {} into RAM [{} records]".format(
-                table_data[0].__name__,
-                item_count
-            ))
+            prog.update(len(batch))
+
+    if not options['unattended']:
+        prog.close()
+    else:
+        print("[Done!] {} {} [{} records]".format(
+            action,
+            table_name,
+            total_records
+        ))
+
+    gc.collect()
+    db.reset_queries()
+    return index, total_records, time.time() - start_time
+
+
+def _delta_table_job(args):
+    return delta_table_process(*args)
+
+
+def delta_table_process(index, destination_table_index, options):
+    """
+    Brings a cache table up to date by applying only the rows that have
+    changed in the source, found by comparing the source rows' hashes with
+    those stored in the cache. A changed row is deleted and inserted again.
+
+    If more than options['max_delta'] of the rows have changed (or the cache
+    has no hashes to compare against), the table is reloaded in full
+    instead, as a large delta is slower to apply than a fresh load.
+    Returns the table index, the number of rows inserted and deleted, and
+    whether the table had to be reloaded.
+    """
+    load_batch_size = 10000
+
+    table_data = tables[index]
+    destination_model = table_data[destination_table_index]
+    table_name = table_data[0].__name__
+
+    # Rows are matched on their hash alone, so any duplicate rows are
+    # matched up one for one. Missing hashes are checked for before the
+    # rows are streamed, as breaking out of the stream would leave its
+    # cursor open and stop the table from being truncated for a reload.
+    cached_rows = defaultdict(list)
+    if destination_model.objects.filter(rowhash__isnull=True).exists():
+        cached_rows = None
+    else:
+        rows = destination_model.objects.values_list(
+            'id',
+            'rowhash'
+        ).iterator()
+        for row_id, rowhash in rows:
+            cached_rows[rowhash].append(row_id)
+
+    reload = not cached_rows
+    inserts = []
+    if not reload:
+        cols, total_records, batches = _read_source(
+            table_data,
+            None,
+            load_batch_size
+        )
+        max_changes = options['max_delta'] * max(total_records, 1)
+
+        changes = 0
+        for batch in batches:
+            for row in _with_hashes(batch):
+                row_ids = cached_rows.get(row[-1])
+                if row_ids:
+                    row_ids.pop()
+                else:
+                    inserts.append(row)
+                    changes += 1
+            if changes > max_changes:
+                reload = True
+                break
+
+        deletes = [
+            row_id for row_ids in cached_rows.values() for row_id in row_ids
+        ]
+        if len(inserts) + len(deletes) > max_changes:
+            reload = True
+    del cached_rows
+
+    if reload:
+        print("[Delta] {} has changed too much, reloading it".format(
+            table_name
+        ))
+        inserts.clear()
+        prepare_table_process(index, destination_table_index)
+        cache_table_process(index, destination_table_index, None, options)
+        finish_table_process(index, destination_table_index)
+        return index, 0, 0, True
+
+    connection = connections['gencache']
+    with connection.cursor() as cursor:
+        for start in range(0, len(deletes), load_batch_size):
+            cursor.execute(
+                "DELETE FROM {} WHERE id = ANY(%s);".format(
+                    connection.ops.quote_name(destination_model._meta.db_table)
+                ),
+                [deletes[start:start + load_batch_size]]
+            )
+    for start in range(0, len(inserts), load_batch_size):
+        copy_rows(
+            destination_model,
+            cols + ['rowhash'],
+            inserts[start:start + load_batch_size]
+        )
+
+    print("[Delta] {}: {} rows inserted, {} rows deleted".format(
+        table_name,
+        len(inserts),
+        len(deletes)
+    ))
 
     gc.collect()
     db.reset_queries()
+    return index, len(inserts), len(deletes), False
 
 
 class Command(BaseCommand):
@@ -271,16 +604,167 @@ class Command(BaseCommand):
             )
         )
 
+        parser.add_argument(
+            '--workers',
+            type=int,
+            dest='workers',
+            default=2,
+            help='Number of tables (or partitions of tables) to load at once'
+        )
+
+        parser.add_argument(
+            '--partition-rows',
+            type=int,
+            dest='partition_rows',
+            default=500000,
+            help=(
+                'Large tables are split into partitions of roughly this '
+                'many rows, going by the last run, to be loaded concurrently'
+            )
+        )
+
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            dest='incremental',
+            default=False,
+            help=(
+                'Only apply the rows that have changed since the cache '
+                'being written to was last refreshed'
+            )
+        )
+
+        parser.add_argument(
+            '--max-delta',
+            type=float,
+            dest='max_delta',
+            default=0.2,
+            help=(
+                'In incremental mode, reload a table in full if more than '
+                'this fraction of its rows have changed'
+            )
+        )
+
+        parser.add_argument(
+            '--skip-personal-timetables',
+            action='store_true',
+            dest='skip_personal_timetables',
+            default=False,
+            help=(
+                'Do not precompute every student\'s personal timetable, so '
+                'that they are built when they are first asked for instead'
+            )
+        )
+
+    def _load_full(self, destination_table_index, options):
+        """Reloads every cache table from scratch"""
+        timings = get_table_timings(self._redis)
+        schedule = schedule_tables(
+            timings,
+            options['workers'],
+            options['partition_rows']
+        )
+
+        for index, _ in schedule:
+            prepare_table_process(index, destination_table_index)
+
+        jobs = []
+        remaining_jobs = {}
+        for index, partitions in schedule:
+            table_partitions = get_partitions(tables[index], partitions)
+            remaining_jobs[index] = len(table_partitions)
+            for partition in table_partitions:
+                jobs.append(
+                    (index, destination_table_index, partition, options)
+                )
+
+        table_timings = {
+            index: {"seconds": 0.0, "rows": 0, "partitions": count}
+            for index, count in remaining_jobs.items()
+        }
+
+        # Connections must not be shared with the worker processes
+        db.connections.close_all()
+
+        with Pool(processes=options['workers']) as pool:
+            index_builds = []
+            for index, rows, seconds in pool.imap_unordered(
+                _cache_table_job,
+                jobs
+            ):
+                table_timings[index]["rows"] += rows
+                table_timings[index]["seconds"] += seconds
+                remaining_jobs[index] -= 1
+                # Build a table's indexes as soon as all of it is loaded,
+                # alongside whatever is still being loaded
+                if remaining_jobs[index] == 0:
+                    index_builds.append(pool.apply_async(
+                        finish_table_process,
+                        (index, destination_table_index)
+                    ))
+
+            for index_build in index_builds:
+                index, seconds = index_build.get()
+                table_timings[index]["seconds"] += seconds
+
+            pool.close()
+            pool.join()
+
+        print("Time spent on each table:")
+        for index, timing in sorted(
+            table_timings.items(),
+            key=lambda item: -item[1]["seconds"]
+        ):
+            print("{:>16} {:>8.1f}s {:>10} rows in {} partition(s)".format(
+                tables[index][0].__name__,
+                timing["seconds"],
+                timing["rows"],
+                timing["partitions"]
+            ))
+
+        self._redis.hmset(TIMINGS_KEY, {
+            tables[index][0].__name__: json.dumps(timing)
+            for index, timing in table_timings.items()
+        })
+
+    def _load_incremental(self, destination_table_index, options):
+        """Applies only the rows that have changed to each cache table"""
+        schedule = schedule_tables(
+            get_table_timings(self._redis),
+            options['workers'],
+            float('inf')
+        )
+        jobs = [
+            (index, destination_table_index, options)
+            for index, _ in schedule
+        ]
+
+        # Connections must not be shared with the worker processes
+        db.connections.close_all()
+
+        with Pool(processes=options['workers']) as pool:
+            results = list(pool.imap_unordered(_delta_table_job, jobs))
+
+            pool.close()
+            pool.join()
+
+        reloaded = [
+            tables[index][0].__name__
+            for index, _, _, reload in results if reload
+        ]
+        print("Rows inserted: {}, rows deleted: {}".format(
+            sum(inserted for _, inserted, _, _ in results),
+            sum(deleted for _, _, deleted, _ in results)
+        ))
+        if reloaded:
+            print("Tables reloaded in full: {}".format(", ".join(reloaded)))
+
     def handle(self, *args, **options):
         start_time = time.time()
         # We first check if we are already caching so that we don't
         # tread over ourselves by trying to cache twice at once
         print("Connecting to Redis")
-        self._redis = redis.Redis(
-            host=settings.REDIS_UCLAPI_HOST,
-            charset="utf-8",
-            decode_responses=True
-        )
+        self._redis = get_redis(decode_responses=True)
 
         cache_running_key = "cron:gencache:in_progress"
         running = self._redis.get(cache_running_key)
@@ -300,16 +784,11 @@ class Command(BaseCommand):
         lock = Lock.objects.all()[0]
         destination_table_index = 2 if lock.a else 1
 
-        with Pool(processes=2) as pool:
-            # Build up a list of argument tuples for the child process calls
-            pool_args = []
-            for i in range(0, len(tables)):
-                pool_args.append((i, destination_table_index, options))
-
-            pool.starmap(cache_table_process, pool_args)
+        if options['incremental']:
+            self._load_incremental(destination_table_index, options)
+        else:
+            self._load_full(destination_table_index, options)
 
-            pool.close()
-            pool.join()
         for i in tables:
             print()
 
@@ -322,9 +801,36 @@ class Command(BaseCommand):
             )
         )
 
+        print("Building room occupancy bitmaps")
+        bitmaps = store_occupancy_bitmaps(lock)
+        print("Stored {} room days".format(
+            sum(len(rooms) for rooms in bitmaps.values())
+        ))
+
+        print("Building room utilisation statistics")
+        utilisation = store_utilisation(lock, bitmaps)
+        print("Stored statistics for {} rooms".format(len(utilisation)))
+        del bitmaps
+
+        if not options['skip_personal_timetables']:
+            # Built from the bucket we have just written to, which the
+            # personal timetable reads from once the lock is inverted
+            print("Precomputing personal timetables")
+            precompute_start_time = time.time()
+            precomputed = precompute_personal_timetables(
+                "b" if lock.a else "a",
+                options['workers']
+            )
+            print("Stored {} personal timetables in {:.1f}s".format(
+                precomputed,
+                time.time() - precompute_start_time
+            ))
+
         print("Inverting lock")
+        old_bucket = get_bucket_name(lock)
         lock.a, lock.b = not lock.a, not lock.b
         lock.save()
+        retire_personal_timetables(old_bucket)
 
         print("Setting Last-Modified key")
         last_modified_key = "http:headers:Last-Modified:gencache"
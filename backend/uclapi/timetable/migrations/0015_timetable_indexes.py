@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0014_auto_20190302_0232_squashed_0019_auto_20190305_1729'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timetablea',
+            index=models.Index(fields=['moduleid', 'instid'], name='timetablea_module_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timetableb',
+            index=models.Index(fields=['moduleid', 'instid'], name='timetableb_module_idx'),
+        ),
+    ]
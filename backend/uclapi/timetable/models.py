@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .lock_cache import forget_lock, publish_lock
 
 models.options.DEFAULT_NAMES += ('_DATABASE',)
 
@@ -23,6 +27,7 @@ class WeekstructureA(models.Model):
     startdate = models.DateField()
     description = models.TextField(max_length=80, null=True)
     mappedto = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -35,6 +40,7 @@ class WeekstructureB(models.Model):
     startdate = models.DateField()
     description = models.TextField(max_length=80, null=True)
     mappedto = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -134,6 +140,7 @@ class StudentsA(models.Model):
     ema = models.CharField(max_length=1, null=True)
     emaid = models.TextField(max_length=12, null=True)
     dob = models.DateField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -183,6 +190,7 @@ class StudentsB(models.Model):
     ema = models.CharField(max_length=1, null=True)
     emaid = models.TextField(max_length=12, null=True)
     dob = models.DateField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -224,6 +232,7 @@ class SitesA(models.Model):
     contact2 = models.TextField(max_length=50, null=True)
     linkcode = models.TextField(max_length=20, null=True)
     campusid = models.TextField(max_length=10, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -244,6 +253,7 @@ class SitesB(models.Model):
     contact2 = models.TextField(max_length=50, null=True)
     linkcode = models.TextField(max_length=20, null=True)
     campusid = models.TextField(max_length=10, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -293,6 +303,7 @@ class ModuleA(models.Model):
     unitvalue = models.TextField(max_length=10)
     instid = models.BigIntegerField(null=True, blank=True)
     isactive = models.CharField(max_length=1, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -317,6 +328,7 @@ class ModuleB(models.Model):
     unitvalue = models.TextField(max_length=10)
     instid = models.BigIntegerField(null=True, blank=True)
     isactive = models.CharField(max_length=1, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -362,6 +374,7 @@ class LecturerA(models.Model):
     covprior = models.BigIntegerField(null=True, blank=True)
     covingprior = models.BigIntegerField(null=True, blank=True)
     excludecover = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -384,6 +397,7 @@ class LecturerB(models.Model):
     covprior = models.BigIntegerField(null=True, blank=True)
     covingprior = models.BigIntegerField(null=True, blank=True)
     excludecover = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -455,6 +469,7 @@ class DeptsA(models.Model):
     admincontact = models.TextField(max_length=50, null=True)
     adminphone = models.TextField(max_length=50, null=True)
     lecturerid = models.TextField(max_length=10, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -476,6 +491,7 @@ class DeptsB(models.Model):
     admincontact = models.TextField(max_length=50, null=True)
     adminphone = models.TextField(max_length=50, null=True)
     lecturerid = models.TextField(max_length=10, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -505,6 +521,7 @@ class WeekmapstringA(models.Model):
     numweeks = models.BigIntegerField(null=True, blank=True)
     statweeks = models.TextField(max_length=10, null=True)
     drstatus = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -519,6 +536,7 @@ class WeekmapstringB(models.Model):
     numweeks = models.BigIntegerField(null=True, blank=True)
     statweeks = models.TextField(max_length=10, null=True)
     drstatus = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -659,6 +677,7 @@ class WeekmapnumericA(models.Model):
     weekid = models.BigIntegerField(null=True, blank=True)
     weeknumber = models.BigIntegerField(null=True, blank=True)
     drstatus = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -670,6 +689,7 @@ class WeekmapnumericB(models.Model):
     weekid = models.BigIntegerField(null=True, blank=True)
     weeknumber = models.BigIntegerField(null=True, blank=True)
     drstatus = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -886,9 +906,16 @@ class TimetableA(models.Model):
     typeevent = models.BigIntegerField(null=True, blank=True)
     ncyear = models.TextField(max_length=3, null=True)
     reasonforchange = models.TextField(max_length=10, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
+        indexes = [
+            models.Index(
+                fields=['moduleid', 'instid'],
+                name='timetablea_module_idx'
+            ),
+        ]
 
 
 class TimetableB(models.Model):
@@ -985,9 +1012,16 @@ class TimetableB(models.Model):
     typeevent = models.BigIntegerField(null=True, blank=True)
     ncyear = models.TextField(max_length=3, null=True)
     reasonforchange = models.TextField(max_length=10, null=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
+        indexes = [
+            models.Index(
+                fields=['moduleid', 'instid'],
+                name='timetableb_module_idx'
+            ),
+        ]
 
 
 class Stumodules(models.Model):
@@ -1042,6 +1076,7 @@ class StumodulesA(models.Model):
     moddropped = models.CharField(max_length=1, null=True)
     donotcount = models.CharField(max_length=1, null=True)
     semrank = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1070,6 +1105,7 @@ class StumodulesB(models.Model):
     moddropped = models.CharField(max_length=1, null=True)
     donotcount = models.CharField(max_length=1, null=True)
     semrank = models.BigIntegerField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1149,6 +1185,7 @@ class CourseA(models.Model):
     oldcourseid = models.TextField(max_length=12, null=True, blank=True)
     isactive = models.CharField(max_length=1, null=True, blank=True)
     lecturerid = models.TextField(max_length=10, null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1174,6 +1211,7 @@ class CourseB(models.Model):
     oldcourseid = models.TextField(max_length=12, null=True, blank=True)
     isactive = models.CharField(max_length=1, null=True, blank=True)
     lecturerid = models.TextField(max_length=10, null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1205,6 +1243,7 @@ class CminstancesA(models.Model):
     instrank = models.BigIntegerField(null=True, blank=True)
     inststart = models.DateField(null=True, blank=True)
     instfinish = models.DateField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1220,6 +1259,7 @@ class CminstancesB(models.Model):
     instrank = models.BigIntegerField(null=True, blank=True)
     inststart = models.DateField(null=True, blank=True)
     instfinish = models.DateField(null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1267,6 +1307,7 @@ class ModulegroupsA(models.Model):
     groupnum = models.IntegerField(null=True, blank=True)
     mequivid = models.IntegerField(null=True, blank=True)
     instid = models.IntegerField()
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1290,6 +1331,7 @@ class ModulegroupsB(models.Model):
     groupnum = models.IntegerField(null=True, blank=True)
     mequivid = models.IntegerField(null=True, blank=True)
     instid = models.IntegerField()
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1321,6 +1363,7 @@ class StuclassesA(models.Model):
     courseyear = models.BigIntegerField(null=True, blank=True)
     fixingrp = models.CharField(max_length=1, null=True, blank=True)
     inactive = models.CharField(max_length=1, null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1336,6 +1379,7 @@ class StuclassesB(models.Model):
     courseyear = models.BigIntegerField(null=True, blank=True)
     fixingrp = models.CharField(max_length=1, null=True, blank=True)
     inactive = models.CharField(max_length=1, null=True, blank=True)
+    rowhash = models.CharField(max_length=32, blank=True, null=True)
 
     class Meta:
         _DATABASE = 'gencache'
@@ -1347,3 +1391,15 @@ class Lock(models.Model):
 
     class Meta:
         _DATABASE = 'default'
+
+
+# Django signals to publish the lock whenever it changes, which is how
+# every worker finds out that update_gencache has swapped the buckets.
+@receiver(post_save, sender=Lock)
+def publish_changed_lock(sender, instance, **kwargs):
+    publish_lock(instance)
+
+
+@receiver(post_delete, sender=Lock)
+def forget_deleted_lock(sender, instance, **kwargs):
+    forget_lock()
@@ -3,7 +3,7 @@ from django.conf import settings
 from psycopg2.extras import RealDictCursor
 
 from timetable.amp import ModuleInstance
-from timetable.models import Lock
+from timetable.lock_cache import get_lock
 
 from .utils import (
     get_location_coordinates,
@@ -11,7 +11,7 @@ from .utils import (
 )
 
 
-def get_personal_timetable_rows(upi):
+def get_personal_timetable_rows(upi, bucket=None):
     set_id = settings.ROOMBOOKINGS_SETID
 
     # Get from Django's ORM to raw psycopg2 so that a new cursor
@@ -23,7 +23,8 @@ def get_personal_timetable_rows(upi):
 
     raw_connection = wrapped_connection.connection
 
-    bucket = 'a' if Lock.objects.all()[0].a else 'b'
+    if bucket is None:
+        bucket = 'a' if get_lock().a else 'b'
 
     with raw_connection.cursor(cursor_factory=RealDictCursor) as cursor:
         cursor.callproc(
@@ -37,9 +38,9 @@ def get_personal_timetable_rows(upi):
         return rows
 
 
-def get_personal_timetable(upi):
+def get_personal_timetable(upi, bucket=None):
     full_timetable = {}
-    for row in get_personal_timetable_rows(upi):
+    for row in get_personal_timetable_rows(upi, bucket):
         instance = ModuleInstance(row['instcode'])
         lat, lng = get_location_coordinates(
             row['siteid'],
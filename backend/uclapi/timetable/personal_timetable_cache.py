@@ -0,0 +1,147 @@
+import json
+import logging
+import zlib
+
+from multiprocessing import Pool
+
+from django import db
+from django.conf import settings
+
+from common.redis_pool import get_redis
+
+from .models import StudentsA, StudentsB
+from .personal_timetable import get_personal_timetable
+
+
+logger = logging.getLogger(__name__)
+
+# Personal timetables are stored under the gencache bucket they were built
+# from, so a request only ever reads timetables built from the bucket that
+# the lock says is current. Timetables for the next bucket are built by
+# update_gencache before it inverts the lock, just like the occupancy
+# bitmaps, so they are all in place as soon as anyone can ask for them.
+KEY_PREFIX = "timetable:personal:"
+
+# Timetables built on demand, for students who were missed by the last
+# precompute, are only kept for this long
+ON_DEMAND_TTL = 43200
+
+# Once the lock has been inverted, the old bucket's timetables are kept for
+# this long for requests that were pinned to the old lock
+RETIRED_TTL = 600
+
+# Number of students whose timetables each worker builds at once
+CHUNK_SIZE = 200
+
+
+def get_bucket_name(lock):
+    return "a" if lock.a else "b"
+
+
+def _get_key(bucket, upi):
+    # The stored procedure upper-cases UPIs, so they are matched
+    # case-insensitively
+    return "{}{}:{}".format(KEY_PREFIX, bucket, upi.upper())
+
+
+def _encode(timetable):
+    # Timetables are very repetitive, so compressing them saves a lot of
+    # memory when every student's is stored
+    return zlib.compress(json.dumps(timetable).encode("utf-8"))
+
+
+def load_personal_timetable(bucket, upi):
+    """
+    Returns the timetable stored for upi from bucket, or None if there is
+    not one
+    """
+    data = get_redis().get(_get_key(bucket, upi))
+    if data is None:
+        return None
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def store_personal_timetable(bucket, upi, timetable, ex=ON_DEMAND_TTL):
+    get_redis().set(_get_key(bucket, upi), _encode(timetable), ex=ex)
+
+
+def _get_upis(bucket):
+    # qtype2 is the UPI field
+    students = StudentsA if bucket == "a" else StudentsB
+    return sorted(set(
+        students.objects.filter(
+            setid=settings.ROOMBOOKINGS_SETID
+        ).exclude(
+            qtype2=''
+        ).values_list('qtype2', flat=True)
+    ))
+
+
+def _precompute_chunk(args):
+    bucket, upis = args
+
+    pipe = get_redis().pipeline(transaction=False)
+    built = 0
+    for upi in upis:
+        # A student whose timetable cannot be built is left to be built on
+        # demand, rather than holding up everyone else's
+        try:
+            timetable = get_personal_timetable(upi, bucket)
+        except Exception:
+            logger.exception("Could not build the timetable of %s", upi)
+            continue
+        pipe.set(_get_key(bucket, upi), _encode(timetable))
+        built += 1
+    pipe.execute()
+
+    db.reset_queries()
+    return built
+
+
+def _delete_stale_personal_timetables(bucket, upis):
+    # Drops the timetables of students who are no longer in bucket
+    keep = {_get_key(bucket, upi).encode("utf-8") for upi in upis}
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    for key in r.scan_iter("{}{}:*".format(KEY_PREFIX, bucket)):
+        if key not in keep:
+            pipe.delete(key)
+    pipe.execute()
+
+
+def precompute_personal_timetables(bucket, workers, chunk_size=CHUNK_SIZE):
+    """
+    Builds the timetable of every student in bucket with a pool of workers,
+    each of which builds chunk_size students' timetables at a time, and
+    stores them until the next time the bucket is precomputed. Returns the
+    number of timetables stored.
+    """
+    upis = _get_upis(bucket)
+    jobs = [
+        (bucket, upis[start:start + chunk_size])
+        for start in range(0, len(upis), chunk_size)
+    ]
+
+    # Connections must not be shared with the worker processes
+    db.connections.close_all()
+
+    with Pool(processes=workers) as pool:
+        built = sum(pool.imap_unordered(_precompute_chunk, jobs))
+
+        pool.close()
+        pool.join()
+
+    _delete_stale_personal_timetables(bucket, upis)
+    return built
+
+
+def retire_personal_timetables(bucket):
+    """
+    Expires the timetables of a bucket that is no longer current, after
+    RETIRED_TTL seconds
+    """
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    for key in r.scan_iter("{}{}:*".format(KEY_PREFIX, bucket)):
+        pipe.expire(key, RETIRED_TTL)
+    pipe.execute()
@@ -0,0 +1,310 @@
+import datetime
+import logging
+import sys
+import threading
+import time
+
+from collections import Counter
+
+from roombookings.models import Location, RoomA, RoomB, SiteLocation
+
+from .amp import ModuleInstance
+from .lock_cache import get_lock
+from .models import (CminstancesA, CminstancesB, DeptsA, DeptsB, LecturerA,
+                     LecturerB, SitesA, SitesB, WeekmapnumericA,
+                     WeekmapnumericB, WeekstructureA, WeekstructureB)
+
+
+logger = logging.getLogger(__name__)
+
+_BUCKET_MODELS = {
+    "cminstances": (CminstancesA, CminstancesB),
+    "departments": (DeptsA, DeptsB),
+    "lecturer": (LecturerA, LecturerB),
+    "rooms": (RoomA, RoomB),
+    "sites": (SitesA, SitesB),
+    "weekmapnumeric": (WeekmapnumericA, WeekmapnumericB),
+    "weekstructure": (WeekstructureA, WeekstructureB)
+}
+
+# The snapshots in use, newest first. The one before the newest is kept for
+# requests that were pinned to the old lock when it was inverted.
+MAX_SNAPSHOTS = 2
+
+_snapshots = ()
+_snapshots_lock = threading.Lock()
+
+
+def _get_size(obj, seen):
+    # Roughly how many bytes obj and everything in it take up
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            _get_size(key, seen) + _get_size(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_get_size(item, seen) for item in obj)
+    return size
+
+
+class ReferenceData():
+    """
+    Every department, lecturer, room, site, instance and week of one
+    generation of the gencache, loaded in one query per table.
+
+    Lookups never touch the database. Anything that is not in the cache
+    tables is looked up as "Unknown", just like it was when each lookup
+    was a query.
+    """
+
+    def __init__(self, lock):
+        self.key = (lock.a, lock.generation)
+        # Snapshots are shared by every thread in the process, so the
+        # counters have a lock of their own. Taking _snapshots_lock instead
+        # would hold up every lookup while a new generation was loading.
+        self.hits = Counter()
+        self.misses = Counter()
+        self._counters_lock = threading.Lock()
+
+        start_time = time.perf_counter()
+        self._load(0 if lock.a else 1)
+        self.load_time = time.perf_counter() - start_time
+        self.loaded_at = time.time()
+
+        logger.info(
+            "Loaded reference data for generation %d (bucket %s) in %.3fs",
+            lock.generation,
+            "A" if lock.a else "B",
+            self.load_time
+        )
+
+    def _load(self, bucket):
+        def get_model(name):
+            return _BUCKET_MODELS[name][bucket]
+
+        self._departments = dict(
+            get_model("departments").objects.values_list("deptid", "name")
+        )
+
+        self._lecturers = {}
+        for lecturerid, name, linkcode, owner in (
+            get_model("lecturer").objects.values_list(
+                "lecturerid", "name", "linkcode", "owner"
+            )
+        ):
+            details = {
+                "name": name,
+                "email": (
+                    linkcode + "@ucl.ac.uk" if linkcode else "Unknown"
+                ),
+                "department_id": "Unknown",
+                "department_name": "Unknown"
+            }
+            if owner:
+                details["department_id"] = owner
+                details["department_name"] = self._departments.get(
+                    owner,
+                    "Unknown"
+                )
+            self._lecturers.setdefault(lecturerid, details)
+
+        # Instance codes are only parsed when they are first asked for, so
+        # that a bad code fails the request for it rather than the load
+        self._instance_codes = {}
+        for instid, instcode in (
+            get_model("cminstances").objects.values_list("instid", "instcode")
+        ):
+            self._instance_codes.setdefault(instid, instcode)
+        self._instances = {}
+
+        self._week_dates = dict(
+            get_model("weekstructure").objects.values_list(
+                "weeknumber", "startdate"
+            )
+        )
+        self._weeks = {}
+        for weekid, weeknumber in (
+            get_model("weekmapnumeric").objects.values_list(
+                "weekid", "weeknumber"
+            )
+        ):
+            self._weeks.setdefault(weekid, []).append(weeknumber)
+
+        self._room_coordinates = {
+            (siteid, roomid): (lat, lng)
+            for siteid, roomid, lat, lng in Location.objects.values_list(
+                "siteid", "roomid", "lat", "lng"
+            )
+        }
+        self._site_coordinates = {
+            siteid: (lat, lng)
+            for siteid, lat, lng in SiteLocation.objects.values_list(
+                "siteid", "lat", "lng"
+            )
+        }
+
+        sites = {}
+        for site in get_model("sites").objects.values_list(
+            "siteid", "sitename", "address1", "address2", "address3",
+            "address4"
+        ):
+            sites.setdefault(site[0], site)
+
+        self._locations = {}
+        for siteid, roomid, roomname, capacity, bookabletype in (
+            get_model("rooms").objects.values_list(
+                "siteid", "roomid", "roomname", "capacity", "bookabletype"
+            )
+        ):
+            if (siteid, roomid) in self._locations or siteid not in sites:
+                continue
+            _, sitename, address1, address2, address3, address4 = sites[siteid]
+            lat, lng = self._get_coordinates(siteid, roomid)
+            self._locations[(siteid, roomid)] = {
+                "name": roomname,
+                "capacity": capacity,
+                "type": bookabletype,
+                "address": [address1, address2, address3, address4],
+                "site_name": sitename,
+                "coordinates": {
+                    "lat": lat,
+                    "lng": lng
+                }
+            }
+
+    def _count(self, table, hit):
+        with self._counters_lock:
+            if hit:
+                self.hits[table] += 1
+            else:
+                self.misses[table] += 1
+
+    def _lookup(self, table, values, key, default=None):
+        if key in values:
+            self._count(table, True)
+            return values[key]
+        self._count(table, False)
+        return default
+
+    def get_department_name(self, deptid):
+        return self._lookup(
+            "departments",
+            self._departments,
+            deptid,
+            "Unknown"
+        )
+
+    def get_lecturer(self, lecturerid):
+        return self._lookup(
+            "lecturers",
+            self._lecturers,
+            lecturerid,
+            {
+                "name": "Unknown",
+                "email": "Unknown",
+                "department_id": "Unknown",
+                "department_name": "Unknown"
+            }
+        )
+
+    def get_instance(self, instid):
+        """Returns the details of an instance, or None if there is none"""
+        instcode = self._lookup("instances", self._instance_codes, instid)
+        if instcode is None:
+            return None
+
+        if instid not in self._instances:
+            instance = ModuleInstance(instcode)
+            self._instances[instid] = {
+                "delivery": instance.delivery.get_delivery(),
+                "periods": instance.periods.get_periods(),
+                "instance_code": instcode
+            }
+        return self._instances[instid]
+
+    def get_dates(self, weekid, weekday):
+        """Returns every date that a slot in the given week pattern is on"""
+        weeknumbers = self._lookup("weeks", self._weeks, weekid, [])
+        return [
+            self._week_dates[weeknumber] + datetime.timedelta(
+                days=weekday - 1
+            )
+            for weeknumber in weeknumbers
+        ]
+
+    def get_location(self, siteid, roomid):
+        if not siteid or not roomid:
+            return {}
+        return self._lookup("rooms", self._locations, (siteid, roomid), {})
+
+    def _get_coordinates(self, siteid, roomid):
+        # The room's own location, or else its building's
+        if (siteid, roomid) in self._room_coordinates:
+            return self._room_coordinates[(siteid, roomid)]
+        return self._site_coordinates.get(siteid, (None, None))
+
+    def get_coordinates(self, siteid, roomid):
+        coordinates = self._get_coordinates(siteid, roomid)
+        self._count("coordinates", coordinates != (None, None))
+        return coordinates
+
+    def get_stats(self):
+        with self._counters_lock:
+            hits_by_table = dict(self.hits)
+            misses_by_table = dict(self.misses)
+        hits = sum(hits_by_table.values())
+        lookups = hits + sum(misses_by_table.values())
+        return {
+            "bucket": "A" if self.key[0] else "B",
+            "generation": self.key[1],
+            "loaded_at": self.loaded_at,
+            "load_time": self.load_time,
+            "size_bytes": _get_size(self.__dict__, set()),
+            "hits": hits_by_table,
+            "misses": misses_by_table,
+            "hit_rate": hits / lookups if lookups else 0
+        }
+
+
+def get_reference_data():
+    """
+    Returns the ReferenceData of the gencache generation that the current
+    request reads from, loading it if this process has not yet.
+
+    When the lock is inverted, the first request to see the new generation
+    loads it and swaps it in, so no other thread ever sees a snapshot that
+    is only partly loaded.
+    """
+    global _snapshots
+
+    lock = get_lock()
+    key = (lock.a, lock.generation)
+    for snapshot in _snapshots:
+        if snapshot.key == key:
+            return snapshot
+
+    with _snapshots_lock:
+        for snapshot in _snapshots:
+            if snapshot.key == key:
+                return snapshot
+
+        snapshot = ReferenceData(lock)
+        _snapshots = ((snapshot, ) + _snapshots)[:MAX_SNAPSHOTS]
+        return snapshot
+
+
+def get_reference_data_stats():
+    """Returns the stats of each snapshot this process has, newest first"""
+    return [snapshot.get_stats() for snapshot in _snapshots]
+
+
+def clear_reference_data():
+    global _snapshots
+
+    with _snapshots_lock:
+        _snapshots = ()
@@ -1,25 +1,13 @@
 from __future__ import absolute_import
 
-import json
-
-import redis
-
 from celery import shared_task
-from django.conf import settings
 
+from .lock_cache import get_lock
+from .personal_timetable_cache import get_bucket_name, store_personal_timetable
 
-@shared_task
-def cache_student_timetable(upi, timetable_data):
-    timetable_key = "timetable:personal:{}".format(upi)
 
-    r = redis.Redis(
-        host=settings.REDIS_UCLAPI_HOST,
-        charset="utf-8",
-        decode_responses=True
-    )
-
-    r.set(
-        timetable_key,
-        json.dumps(timetable_data),
-        ex=43200
-    )
+@shared_task
+def cache_student_timetable(upi, timetable_data, bucket=None):
+    if bucket is None:
+        bucket = get_bucket_name(get_lock())
+    store_personal_timetable(bucket, upi, timetable_data)
@@ -1,10 +1,73 @@
-from django.test import SimpleTestCase
+import datetime
+import signal
+import threading
+import time
+import unittest.mock
 
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from common.middleware.lock_snapshot_middleware import LockSnapshotMiddleware
+from common.redis_pool import get_redis
+from roombookings.models import BookingA, BookingB, Location, RoomA
+from uclapi.custom_test_runner import GencacheTestMixin
+
+from . import app_helpers
 from .amp import (
     InvalidAMPCodeException,
     ModuleInstance,
     STUDENT_TYPES
 )
+from .lock_cache import (
+    LOCK_CACHE_TTL,
+    LOCK_KEY,
+    LockState,
+    forget_lock,
+    get_lock,
+    pin_lock,
+    unpin_lock
+)
+from .management.commands.update_gencache import (
+    _source_filter,
+    _with_hashes,
+    build_indexes,
+    copy_rows,
+    delta_table_process,
+    drop_indexes,
+    normalise_value,
+    schedule_tables,
+    tables
+)
+from .models import (
+    CminstancesA,
+    DeptsA,
+    LecturerA,
+    Lock,
+    SitesA,
+    StudentsA,
+    TimetableA,
+    TimetableB,
+    WeekmapnumericA,
+    WeekstructureA
+)
+from .personal_timetable_cache import (
+    RETIRED_TTL,
+    _delete_stale_personal_timetables,
+    _get_upis,
+    _precompute_chunk,
+    load_personal_timetable,
+    retire_personal_timetables,
+    store_personal_timetable
+)
+from .reference_data import (
+    clear_reference_data,
+    get_reference_data,
+    get_reference_data_stats
+)
 
 
 class AmpCodeParsing(SimpleTestCase):
@@ -849,3 +912,710 @@ class AmpCodeParsing(SimpleTestCase):
         for code in test_codes:
             # We should not get an error for any of these codes
             ModuleInstance(code)
+
+
+class GencacheIndexTestCase(GencacheTestMixin, TestCase):
+    """
+    Checks that the queries we make most often against the cache tables are
+    answered with the indexes declared on the cache models, using enough
+    synthetic data that the planner would rather not scan the whole table.
+    """
+
+    def setUp(self):
+        first_day = datetime.datetime(2019, 10, 1)
+        BookingA.objects.bulk_create([
+            BookingA(
+                setid='LIVE-19-20',
+                siteid=str(200 + i % 3),
+                roomid='ROOM{}'.format(i % 200),
+                bookabletype='CB' if i % 4 else 'XX',
+                slotid=i,
+                startdatetime=first_day + datetime.timedelta(hours=i // 10),
+                finishdatetime=first_day + datetime.timedelta(
+                    hours=i // 10 + 1
+                )
+            )
+            for i in range(20000)
+        ], batch_size=5000)
+        TimetableA.objects.bulk_create([
+            TimetableA(
+                setid='LIVE-19-20',
+                slotid=i,
+                moduleid='MODL{:04d}'.format(i % 500),
+                instid=i % 7,
+                fixevent='N',
+                mequipnotes='N'
+            )
+            for i in range(5000)
+        ], batch_size=5000)
+
+        self._analyze(BookingA)
+        self._analyze(TimetableA)
+
+    def _analyze(self, model):
+        with connections['gencache'].cursor() as cursor:
+            cursor.execute("ANALYZE {};".format(model._meta.db_table))
+
+    def _get_plan(self, queryset):
+        # Whether the planner would rather scan a table this small depends
+        # on the version of Postgres, so it is only asked whether the
+        # indexes can answer the query at all
+        sql, params = queryset.query.sql_with_params()
+        with connections['gencache'].cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off;")
+            try:
+                cursor.execute("EXPLAIN " + sql, params)
+                return "\n".join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute("RESET enable_seqscan;")
+
+    def _get_index_names(self, model):
+        with connections['gencache'].cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s;",
+                [model._meta.db_table]
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_indexes_exist(self):
+        for model in [BookingA, BookingB, TimetableA, TimetableB]:
+            self.assertTrue(model._meta.indexes)
+            self.assertLessEqual(
+                {index.name for index in model._meta.indexes},
+                self._get_index_names(model)
+            )
+
+    def _bookable(self):
+        return BookingA.objects.filter(
+            Q(bookabletype='CB') | Q(siteid='238') | Q(siteid='240')
+        )
+
+    def test_bookings_by_slot(self):
+        plan = self._get_plan(BookingA.objects.filter(slotid=1234))
+        self.assertIn("bookinga_slotid_idx", plan)
+
+    def test_bookings_by_time(self):
+        plan = self._get_plan(self._bookable().filter(
+            startdatetime__gte=datetime.datetime(2019, 10, 20),
+            finishdatetime__lte=datetime.datetime(2019, 10, 21)
+        ).order_by('startdatetime', 'id'))
+        self.assertIn("bookinga_start_idx", plan)
+
+    def test_bookings_by_room(self):
+        plan = self._get_plan(self._bookable().filter(
+            siteid='201',
+            roomid='ROOM7'
+        ).order_by('startdatetime'))
+        self.assertIn("bookinga_room_idx", plan)
+
+    def test_timetable_by_module(self):
+        plan = self._get_plan(TimetableA.objects.filter(
+            moduleid='MODL0042',
+            instid=0
+        ))
+        self.assertIn("timetablea_module_idx", plan)
+
+    def test_indexes_rebuilt_after_load(self):
+        drop_indexes(BookingA)
+        plan = self._get_plan(BookingA.objects.filter(slotid=1234))
+        self.assertNotIn("bookinga_slotid_idx", plan)
+        self.assertIn("Seq Scan", plan)
+
+        build_indexes(BookingA)
+        plan = self._get_plan(BookingA.objects.filter(slotid=1234))
+        self.assertIn("bookinga_slotid_idx", plan)
+
+
+class NormaliseValueTestCase(SimpleTestCase):
+    def test_truthy_values_kept(self):
+        self.assertEqual(normalise_value("B01"), "B01")
+        self.assertEqual(normalise_value(12), 12)
+
+    def test_falsy_values(self):
+        self.assertEqual(normalise_value(""), "")
+        self.assertEqual(normalise_value(0), 0)
+        self.assertIsNone(normalise_value(None))
+        self.assertIsNone(normalise_value(0.0))
+
+
+class CopyRowsTestCase(GencacheTestMixin, TestCase):
+    def test_values_round_trip(self):
+        columns = ['slotid', 'roomid', 'title', 'startdatetime']
+        rows = [
+            (
+                1,
+                'B01',
+                'Tabs\there, new\nlines and a \\ backslash',
+                datetime.datetime(2019, 10, 14, 9)
+            ),
+            (2, '', '\\N', None),
+            (3, None, 'Quotes " and \' and, commas', None),
+        ]
+        copy_rows(BookingA, columns, rows)
+
+        self.assertEqual(
+            list(BookingA.objects.order_by('slotid').values_list(*columns)),
+            rows
+        )
+
+
+class ScheduleTablesTestCase(SimpleTestCase):
+    def setUp(self):
+        self.timings = {
+            table_data[0].__name__: {
+                "seconds": 10, "rows": 1000, "partitions": 1
+            }
+            for table_data in tables
+        }
+        self.timings["Timetable"] = {
+            "seconds": 600, "rows": 2000000, "partitions": 1
+        }
+        self.timings["Module"] = {
+            "seconds": 60, "rows": 20000, "partitions": 1
+        }
+
+    def _names(self, schedule):
+        return [tables[index][0].__name__ for index, _ in schedule]
+
+    def test_longest_first(self):
+        schedule = schedule_tables(self.timings, 1, 10000000)
+        self.assertEqual(self._names(schedule)[:2], ["Timetable", "Module"])
+        self.assertEqual(len(schedule), len(tables))
+
+    def test_unknown_tables_first(self):
+        del self.timings["Depts"]
+        schedule = schedule_tables(self.timings, 1, 10000000)
+        self.assertEqual(self._names(schedule)[0], "Depts")
+
+    def test_large_tables_partitioned(self):
+        schedule = dict(
+            (tables[index][0].__name__, partitions)
+            for index, partitions in schedule_tables(self.timings, 4, 500000)
+        )
+        self.assertEqual(schedule["Timetable"], 4)
+        # Module is fetched all at once, so it is never partitioned
+        self.assertEqual(schedule["Module"], 1)
+        self.assertEqual(schedule["Booking"], 1)
+
+    def test_partitions_limited_by_workers(self):
+        schedule = dict(schedule_tables(self.timings, 2, 1000))
+        self.assertEqual(max(schedule.values()), 2)
+
+
+@override_settings(ROOMBOOKINGS_SETID="LIVE-19-20")
+class SourceFilterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.timetable = next(
+            table_data for table_data in tables
+            if table_data[0].__name__ == "Timetable"
+        )
+
+    def test_no_partition(self):
+        self.assertEqual(
+            _source_filter(self.timetable),
+            (" WHERE SETID = %s", ["LIVE-19-20"])
+        )
+
+    def test_first_partition_includes_nulls(self):
+        self.assertEqual(
+            _source_filter(self.timetable, (None, 100)),
+            (
+                " WHERE SETID = %s AND (SLOTID < %s OR SLOTID IS NULL)",
+                ["LIVE-19-20", 100]
+            )
+        )
+
+    def test_middle_partition(self):
+        self.assertEqual(
+            _source_filter(self.timetable, (100, 200)),
+            (
+                " WHERE SETID = %s AND SLOTID >= %s AND SLOTID < %s",
+                ["LIVE-19-20", 100, 200]
+            )
+        )
+
+    def test_last_partition(self):
+        self.assertEqual(
+            _source_filter(self.timetable, (200, None)),
+            (" WHERE SETID = %s AND SLOTID >= %s", ["LIVE-19-20", 200])
+        )
+
+
+class DeltaTableTestCase(GencacheTestMixin, TestCase):
+    def setUp(self):
+        self.index = next(
+            index for index, table_data in enumerate(tables)
+            if table_data[0].__name__ == "Booking"
+        )
+        self.columns = ['slotid', 'roomid', 'title']
+        self.rows = [
+            [slotid, 'B0{}'.format(slotid), 'Booking {}'.format(slotid)]
+            for slotid in range(1, 11)
+        ]
+        copy_rows(
+            BookingA,
+            self.columns + ['rowhash'],
+            _with_hashes(self.rows)
+        )
+
+    def _refresh(self, rows, max_delta=0.5):
+        def read_source(*args):
+            return self.columns, len(rows), iter([rows])
+
+        with unittest.mock.patch(
+            "timetable.management.commands.update_gencache._read_source",
+            side_effect=read_source
+        ):
+            return delta_table_process(
+                self.index,
+                1,
+                {"max_delta": max_delta, "unattended": True}
+            )
+
+    def _cached_rows(self):
+        return [
+            list(row) for row in
+            BookingA.objects.order_by('slotid').values_list(*self.columns)
+        ]
+
+    def test_changes_applied(self):
+        unchanged_id = BookingA.objects.get(slotid=1).id
+        rows = [list(row) for row in self.rows]
+        rows[1][2] = 'Renamed'
+        del rows[2]
+        rows.append([11, 'B11', 'New booking'])
+
+        self.assertEqual(self._refresh(rows), (self.index, 2, 2, False))
+        self.assertEqual(self._cached_rows(), rows)
+        self.assertEqual(BookingA.objects.get(slotid=1).id, unchanged_id)
+
+    def test_nothing_changed(self):
+        self.assertEqual(self._refresh(self.rows), (self.index, 0, 0, False))
+        self.assertEqual(self._cached_rows(), self.rows)
+
+    def test_duplicate_rows(self):
+        rows = self.rows + [self.rows[0]]
+        self.assertEqual(self._refresh(rows), (self.index, 1, 0, False))
+        self.assertEqual(len(self._cached_rows()), 11)
+
+    def test_large_delta_reloaded(self):
+        rows = [[slotid, 'C01', 'Moved'] for slotid in range(1, 11)]
+        self.assertEqual(self._refresh(rows), (self.index, 0, 0, True))
+        self.assertEqual(self._cached_rows(), rows)
+
+    def test_missing_hashes_reloaded(self):
+        BookingA.objects.create(slotid=12)
+        self.assertEqual(self._refresh(self.rows), (self.index, 0, 0, True))
+        self.assertEqual(self._cached_rows(), self.rows)
+
+
+class LockCacheTestCase(TestCase):
+    def setUp(self):
+        Lock.objects.all().delete()
+        self.lock = Lock.objects.create(a=True, b=False)
+
+    def tearDown(self):
+        unpin_lock()
+        forget_lock()
+
+    def _invert_lock(self):
+        self.lock.a, self.lock.b = not self.lock.a, not self.lock.b
+        self.lock.save()
+
+    def test_saved_lock_published(self):
+        self.assertEqual(get_lock()[:2], (True, False))
+        self._invert_lock()
+        self.assertEqual(get_lock()[:2], (False, True))
+
+    def test_generation_incremented(self):
+        generation = get_lock().generation
+        self._invert_lock()
+        self.assertEqual(get_lock().generation, generation + 1)
+
+    def test_no_queries(self):
+        get_lock()
+        with self.assertNumQueries(0):
+            self.assertTrue(get_lock().a)
+
+    def _fail_after(self, seconds):
+        # Lock.acquire can be interrupted by a signal, so a deadlock fails
+        # the test instead of hanging it
+        def timed_out(signum, frame):
+            raise AssertionError("Timed out after {}s".format(seconds))
+
+        previous_handler = signal.signal(signal.SIGALRM, timed_out)
+        self.addCleanup(signal.signal, signal.SIGALRM, previous_handler)
+        self.addCleanup(signal.alarm, 0)
+        signal.alarm(seconds)
+
+    def test_falls_back_to_database(self):
+        generation = get_lock().generation
+        forget_lock()
+
+        self._fail_after(5)
+        self.assertEqual(get_lock(), LockState(True, False, generation))
+        self.assertIsNotNone(get_redis().get(LOCK_KEY))
+
+    def test_falls_back_when_key_expires(self):
+        get_lock()
+        get_redis().delete(LOCK_KEY)
+
+        self._fail_after(5)
+        with unittest.mock.patch(
+            "timetable.lock_cache.time.monotonic",
+            return_value=time.monotonic() + LOCK_CACHE_TTL + 1
+        ):
+            self.assertTrue(get_lock().a)
+        self.assertIsNotNone(get_redis().get(LOCK_KEY))
+
+    def test_pinned_for_request(self):
+        middleware = LockSnapshotMiddleware()
+        middleware.process_request(None)
+
+        self.assertEqual(get_lock()[:2], (True, False))
+        self._invert_lock()
+        self.assertEqual(get_lock()[:2], (True, False))
+
+        middleware.process_response(None, None)
+        self.assertEqual(get_lock()[:2], (False, True))
+
+
+class TimetableEventsQueryTestCase(GencacheTestMixin, TestCase):
+    def setUp(self):
+        Lock.objects.all().delete()
+        Lock.objects.create(a=True, b=False)
+
+        # Each module has two events in its instance, one of which has been
+        # booked twice, and one event in an instance that is not asked for
+        events = []
+        bookings = []
+        for i in range(3):
+            moduleid = 'MODL000{}'.format(i)
+            for j, instid in enumerate([1, 1, 2]):
+                slotid = i * 10 + j
+                events.append(TimetableA(
+                    setid='LIVE-19-20',
+                    slotid=slotid,
+                    moduleid=moduleid,
+                    instid=instid,
+                    weekid=1,
+                    weekday=1,
+                    starttime='09:00',
+                    finishtime='10:00',
+                    duration=60,
+                    lecturerid='',
+                    fixevent='N',
+                    mequipnotes='N'
+                ))
+            bookings.extend(
+                BookingA(
+                    setid='LIVE-19-20',
+                    slotid=i * 10,
+                    title=moduleid,
+                    starttime='09:00',
+                    finishtime='10:00',
+                    startdatetime=datetime.datetime(2019, 10, 7 + week, 9)
+                )
+                for week in range(2)
+            )
+        TimetableA.objects.bulk_create(events)
+        BookingA.objects.bulk_create(bookings)
+
+        self.modules = [
+            SimpleNamespace(
+                moduleid='MODL000{}'.format(i),
+                instid=1,
+                name='Module {}'.format(i),
+                lecturerid=''
+            )
+            for i in range(3)
+        ]
+
+        patches = [
+            unittest.mock.patch.object(
+                app_helpers,
+                "_get_real_dates",
+                return_value=[datetime.date(2019, 10, 7)]
+            )
+        ]
+        for name in [
+            "_get_full_department_name",
+            "_get_instance_details",
+            "_get_lecturer_details",
+            "_get_location_details"
+        ]:
+            patches.append(unittest.mock.patch.object(
+                app_helpers,
+                name,
+                return_value={}
+            ))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        # So that the lock is not counted
+        get_lock()
+
+    def tearDown(self):
+        forget_lock()
+
+    def test_two_queries(self):
+        with self.assertNumQueries(2, using='gencache'):
+            events = app_helpers._get_timetable_events(self.modules)
+
+        self.assertEqual(sorted(events), ["2019-10-07", "2019-10-08"])
+        self.assertEqual(
+            sorted(event["session_title"] for event in events["2019-10-07"]),
+            [
+                "MODL0000", "MODL0001", "MODL0002",
+                "Module 0", "Module 1", "Module 2"
+            ]
+        )
+        self.assertEqual(len(events["2019-10-08"]), 3)
+
+    def test_queries_do_not_grow_with_modules(self):
+        with self.assertNumQueries(2, using='gencache'):
+            app_helpers._get_timetable_events(self.modules[:1])
+
+    def test_no_modules(self):
+        with self.assertNumQueries(0, using='gencache'):
+            self.assertEqual(app_helpers._get_timetable_events([]), {})
+
+
+class ReferenceDataTestCase(GencacheTestMixin, TestCase):
+    def setUp(self):
+        Lock.objects.all().delete()
+        self.lock = Lock.objects.create(a=True, b=False)
+        clear_reference_data()
+
+        DeptsA.objects.create(deptid='COMPS_ENG', name='Computer Science')
+        LecturerA.objects.create(
+            setid='LIVE-19-20',
+            lecturerid='LECT1',
+            name='Ada Lovelace',
+            linkcode='ccaalov',
+            owner='COMPS_ENG',
+            displectid='LECT1'
+        )
+        CminstancesA.objects.create(
+            setid='LIVE-19-20',
+            instid=1,
+            instcode='A6U-T1'
+        )
+        WeekstructureA.objects.bulk_create([
+            WeekstructureA(
+                setid='LIVE-19-20',
+                weeknumber=week,
+                startdate=datetime.date(2019, 9, 30) + datetime.timedelta(
+                    weeks=week - 1
+                )
+            )
+            for week in [1, 2]
+        ])
+        WeekmapnumericA.objects.bulk_create([
+            WeekmapnumericA(setid='LIVE-19-20', weekid=10, weeknumber=week)
+            for week in [1, 2]
+        ])
+        SitesA.objects.create(
+            setid='LIVE-19-20',
+            siteid='086',
+            sitename='Torrington Place',
+            address1='1-19 Torrington Place'
+        )
+        RoomA.objects.create(
+            siteid='086',
+            roomid='433',
+            roomname='Room 433',
+            capacity=40,
+            bookabletype='CB'
+        )
+        Location.objects.create(
+            siteid='086',
+            roomid='433',
+            lat='51.52',
+            lng='-0.13'
+        )
+
+    def tearDown(self):
+        clear_reference_data()
+        unpin_lock()
+        forget_lock()
+
+    def test_lookups(self):
+        data = get_reference_data()
+
+        self.assertEqual(
+            data.get_department_name('COMPS_ENG'),
+            'Computer Science'
+        )
+        self.assertEqual(data.get_department_name('NOPE'), 'Unknown')
+        self.assertEqual(data.get_lecturer('LECT1'), {
+            "name": "Ada Lovelace",
+            "email": "ccaalov@ucl.ac.uk",
+            "department_id": "COMPS_ENG",
+            "department_name": "Computer Science"
+        })
+        self.assertEqual(data.get_lecturer('NOPE')["name"], "Unknown")
+        self.assertEqual(data.get_instance(1)["instance_code"], "A6U-T1")
+        self.assertIsNone(data.get_instance(2))
+        self.assertEqual(data.get_dates(10, 3), [
+            datetime.date(2019, 10, 2),
+            datetime.date(2019, 10, 9)
+        ])
+
+        location = data.get_location('086', '433')
+        self.assertEqual(location["site_name"], "Torrington Place")
+        self.assertEqual(
+            location["coordinates"],
+            {"lat": "51.52", "lng": "-0.13"}
+        )
+        self.assertEqual(data.get_location('086', '999'), {})
+        self.assertEqual(data.get_location('', '433'), {})
+
+    def test_no_queries_once_loaded(self):
+        get_reference_data()
+        with self.assertNumQueries(0, using='gencache'), \
+                self.assertNumQueries(0, using='default'):
+            data = get_reference_data()
+            data.get_lecturer('LECT1')
+            data.get_location('086', '433')
+            data.get_coordinates('086', '433')
+
+    def test_swapped_when_lock_inverted(self):
+        old_data = get_reference_data()
+        self.assertIs(get_reference_data(), old_data)
+
+        pin_lock()
+        get_lock()
+        self.lock.a, self.lock.b = False, True
+        self.lock.save()
+
+        # A request that started before the lock was inverted keeps the
+        # snapshot it started with
+        self.assertIs(get_reference_data(), old_data)
+        unpin_lock()
+
+        # Bucket B is empty
+        new_data = get_reference_data()
+        self.assertIsNot(new_data, old_data)
+        self.assertEqual(
+            new_data.get_department_name('COMPS_ENG'),
+            'Unknown'
+        )
+
+    def test_stats(self):
+        data = get_reference_data()
+        data.get_department_name('COMPS_ENG')
+        data.get_department_name('COMPS_ENG')
+        data.get_department_name('NOPE')
+
+        stats = get_reference_data_stats()[0]
+        self.assertEqual(stats["hits"], {"departments": 2})
+        self.assertEqual(stats["misses"], {"departments": 1})
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+        self.assertGreater(stats["size_bytes"], 0)
+        self.assertEqual(stats["bucket"], "A")
+
+    def test_stats_counted_from_many_threads(self):
+        data = get_reference_data()
+
+        def look_up():
+            for _ in range(1000):
+                data.get_department_name('COMPS_ENG')
+
+        threads = [threading.Thread(target=look_up) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = get_reference_data_stats()[0]
+        self.assertEqual(stats["hits"], {"departments": 8000})
+
+
+class PersonalTimetableCacheTestCase(GencacheTestMixin, TestCase):
+    def setUp(self):
+        Lock.objects.all().delete()
+        Lock.objects.create(a=True, b=False)
+
+    def tearDown(self):
+        r = get_redis()
+        for key in r.scan_iter("timetable:personal:*:TEST*"):
+            r.delete(key)
+        forget_lock()
+
+    def _timetable(self, upi):
+        return {"2019-10-07": [{"session_title": upi}]}
+
+    def test_round_trip(self):
+        store_personal_timetable("a", "test1", self._timetable("TEST1"))
+
+        self.assertEqual(
+            load_personal_timetable("a", "TEST1"),
+            self._timetable("TEST1")
+        )
+        self.assertIsNone(load_personal_timetable("b", "TEST1"))
+        self.assertIsNone(load_personal_timetable("a", "TEST2"))
+
+    def test_get_upis(self):
+        StudentsA.objects.bulk_create([
+            StudentsA(setid=settings.ROOMBOOKINGS_SETID, qtype2=upi)
+            for upi in ["TEST2", "TEST1", "TEST2", ""]
+        ] + [
+            StudentsA(setid="LIVE-00-01", qtype2="TEST3")
+        ])
+        self.assertEqual(_get_upis("a"), ["TEST1", "TEST2"])
+
+    def test_precompute_chunk(self):
+        def get_personal_timetable(upi, bucket):
+            self.assertEqual(bucket, "b")
+            if upi == "TEST2":
+                raise ValueError("Bad instance code")
+            return self._timetable(upi)
+
+        with unittest.mock.patch(
+            "timetable.personal_timetable_cache.get_personal_timetable",
+            side_effect=get_personal_timetable
+        ):
+            built = _precompute_chunk(("b", ["TEST1", "TEST2", "TEST3"]))
+
+        self.assertEqual(built, 2)
+        self.assertEqual(
+            load_personal_timetable("b", "TEST3"),
+            self._timetable("TEST3")
+        )
+        self.assertIsNone(load_personal_timetable("b", "TEST2"))
+        self.assertEqual(get_redis().ttl("timetable:personal:b:TEST1"), -1)
+
+    def test_stale_timetables_deleted(self):
+        for upi in ["TEST1", "TEST2"]:
+            store_personal_timetable("a", upi, self._timetable(upi))
+
+        _delete_stale_personal_timetables("a", ["TEST1"])
+        self.assertIsNotNone(load_personal_timetable("a", "TEST1"))
+        self.assertIsNone(load_personal_timetable("a", "TEST2"))
+
+    def test_retired(self):
+        store_personal_timetable("a", "TEST1", self._timetable("TEST1"), None)
+        retire_personal_timetables("a")
+
+        ttl = get_redis().ttl("timetable:personal:a:TEST1")
+        self.assertGreater(ttl, 0)
+        self.assertLessEqual(ttl, RETIRED_TTL)
+
+    def test_precomputed_timetable_served(self):
+        store_personal_timetable("a", "TEST1", self._timetable("TEST1"))
+
+        with unittest.mock.patch.object(
+            app_helpers,
+            "get_personal_timetable"
+        ) as get_personal_timetable:
+            self.assertEqual(
+                app_helpers.get_student_timetable("test1"),
+                self._timetable("TEST1")
+            )
+            self.assertEqual(
+                app_helpers.get_student_timetable("test1", "2019-10-08"),
+                {"2019-10-08": []}
+            )
+        get_personal_timetable.assert_not_called()
@@ -1,4 +1,4 @@
-from roombookings.models import Location, SiteLocation
+from .reference_data import get_reference_data
 
 
 SESSION_TYPE_MAP = {
@@ -8,35 +8,10 @@ SESSION_TYPE_MAP = {
     "PBL": "Problem Based Learning",
 }
 
-_site_coord_cache = {}
-_room_coord_cache = {}
-
 
 def get_location_coordinates(siteid, roomid):
-    # First try and get the specific room's location
-    try:
-        if roomid in _room_coord_cache:
-            return _room_coord_cache[roomid]
-        location = Location.objects.get(
-            siteid=siteid,
-            roomid=roomid
-        )
-        _room_coord_cache[roomid] = (location.lat, location.lng)
-        return location.lat, location.lng
-    except Location.DoesNotExist:
-        pass
-
-    # Now try and get the building's location
-    try:
-        if siteid in _site_coord_cache:
-            return _site_coord_cache[siteid]
-        location = SiteLocation.objects.get(
-            siteid=siteid
-        )
-        _site_coord_cache[siteid] = (location.lat, location.lng)
-        return location.lat, location.lng
-    except SiteLocation.DoesNotExist:
-        pass
-
-    # Now just bail
-    return None, None
+    """
+    Returns the latitude and longitude of a room, or of its building if the
+    room's own location is not known, or else (None, None)
+    """
+    return get_reference_data().get_coordinates(siteid, roomid)
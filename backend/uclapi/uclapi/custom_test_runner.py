@@ -12,3 +12,23 @@ class NoDbTestRunner(DiscoverRunner):
     def teardown_databases(self, old_config, **kwargs):
         """ Override the database teardown defined in parent class """
         pass
+
+
+class GencacheTestMixin():
+    """
+    For TestCases that use the gencache as well as the default database.
+    multi_db on its own would open a transaction on every database,
+    including the Oracle roombookings database, which there is not one of
+    when the tests are run.
+    """
+
+    multi_db = True
+    databases = ('default', 'gencache')
+
+    @classmethod
+    def _databases_names(cls, include_mirrors=True):
+        return [
+            alias
+            for alias in super()._databases_names(include_mirrors)
+            if alias in cls.databases
+        ]
@@ -74,6 +74,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'common.middleware.json_compression_middleware.JsonCompressionMiddleware',
+    'common.middleware.lock_snapshot_middleware.LockSnapshotMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -203,14 +205,79 @@ with open(fair_use_policy_path, 'r', encoding='utf-8') as fp:
 
 REDIS_UCLAPI_HOST = os.environ["REDIS_UCLAPI_HOST"]
 
+# Shared Redis connection pool settings (see common/redis_pool.py)
+# Connections kept per worker process, per response type
+REDIS_UCLAPI_MAX_CONNECTIONS = int(
+    os.environ.get("REDIS_UCLAPI_MAX_CONNECTIONS", 50)
+)
+# Seconds to wait for a free connection before giving up
+REDIS_UCLAPI_POOL_TIMEOUT = float(
+    os.environ.get("REDIS_UCLAPI_POOL_TIMEOUT", 5)
+)
+# Seconds to wait when connecting to or reading from Redis
+REDIS_UCLAPI_SOCKET_TIMEOUT = float(
+    os.environ.get("REDIS_UCLAPI_SOCKET_TIMEOUT", 5)
+)
+# Idle connections are PINGed after this many seconds before being reused
+REDIS_UCLAPI_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get("REDIS_UCLAPI_HEALTH_CHECK_INTERVAL", 30)
+)
+
 # Celery Settings
 CELERY_BROKER_URL = 'redis://' + REDIS_UCLAPI_HOST
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# API call analytics (see common/analytics.py)
+# Where batches of events go: "keen" or "log" (a local stand-in for Keen)
+ANALYTICS_SINK = os.environ.get("ANALYTICS_SINK", "keen")
+# Events held in memory per worker before the oldest start being dropped
+ANALYTICS_BUFFER_CAPACITY = int(
+    os.environ.get("ANALYTICS_BUFFER_CAPACITY", 10000)
+)
+# Maximum number of events sent to the sink at once
+ANALYTICS_BATCH_SIZE = int(os.environ.get("ANALYTICS_BATCH_SIZE", 500))
+# Seconds between flushes of a partially filled buffer
+ANALYTICS_FLUSH_INTERVAL = float(
+    os.environ.get("ANALYTICS_FLUSH_INTERVAL", 5)
+)
+
+# Webhook delivery (see dashboard/webhook_delivery.py)
+# Number of webhooks posted at once, and at most to any one host
+WEBHOOK_DELIVERY_WORKERS = int(os.environ.get("WEBHOOK_DELIVERY_WORKERS", 20))
+WEBHOOK_DELIVERY_HOST_LIMIT = int(
+    os.environ.get("WEBHOOK_DELIVERY_HOST_LIMIT", 4)
+)
+# Seconds to wait for a webhook to connect and to respond
+WEBHOOK_DELIVERY_TIMEOUT = float(
+    os.environ.get("WEBHOOK_DELIVERY_TIMEOUT", 10)
+)
+# Failed deliveries are retried with exponential backoff, starting from
+# WEBHOOK_DELIVERY_RETRY_DELAY seconds, until they have been tried this
+# many times
+WEBHOOK_DELIVERY_MAX_ATTEMPTS = int(
+    os.environ.get("WEBHOOK_DELIVERY_MAX_ATTEMPTS", 5)
+)
+WEBHOOK_DELIVERY_RETRY_DELAY = float(
+    os.environ.get("WEBHOOK_DELIVERY_RETRY_DELAY", 60)
+)
+
 ROOMBOOKINGS_SETID = 'LIVE-18-19'
 
+# Whether /roombookings/bookings page tokens carry their own signed state
+# rather than pointing at state stored in Redis. Signed tokens need no
+# storage, so paging through results does not write to Redis.
+ROOMBOOKINGS_SIGNED_PAGE_TOKENS = strtobool(
+    os.environ.get("ROOMBOOKINGS_SIGNED_PAGE_TOKENS", "False")
+)
+
+# The hours that /roombookings/utilisation measures utilisation against,
+# and the days of the week (Monday is 0) that rooms are open on
+ROOMBOOKINGS_OPENING_TIME = "09:00"
+ROOMBOOKINGS_CLOSING_TIME = "18:00"
+ROOMBOOKINGS_OPEN_DAYS = [0, 1, 2, 3, 4]
+
 # This dictates how many Medium articles we scrape
 MEDIUM_ARTICLE_QUANTITY = 3
 
@@ -1,7 +1,6 @@
-import redis
-
 from lxml import etree
-from django.conf import settings
+
+from common.redis_pool import get_redis
 
 from .occupeye.api import OccupEyeApi
 from .occupeye.exceptions import BadOccupEyeRequest, OccupEyeOtherSensorState
@@ -24,11 +23,7 @@ class ImageBuilder():
         if not self._api.check_map_exists(survey_id, map_id):
             raise BadOccupEyeRequest
 
-        self._redis = redis.Redis(
-            host=settings.REDIS_UCLAPI_HOST,
-            charset="utf-8",
-            decode_responses=True
-        )
+        self._redis = get_redis(decode_responses=True)
         self._sensors = self._api.get_survey_sensors(
             survey_id
             # return_states=True
@@ -2,9 +2,7 @@ import json
 
 from collections import OrderedDict
 
-import redis
-
-from django.conf import settings
+from common.redis_pool import get_redis
 
 from .constants import OccupEyeConstants
 from .exceptions import BadOccupEyeRequest, OccupEyeOtherSensorState
@@ -24,11 +22,7 @@ class OccupEyeApi():
     """
 
     def __init__(self):
-        self._redis = redis.Redis(
-            host=settings.REDIS_UCLAPI_HOST,
-            charset="utf-8",
-            decode_responses=True
-        )
+        self._redis = get_redis(decode_responses=True)
         self._const = OccupEyeConstants()
 
     def get_surveys(self):
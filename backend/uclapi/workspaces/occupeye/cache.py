@@ -3,12 +3,10 @@ import json
 from base64 import b64encode
 from datetime import datetime, timedelta
 
-import redis
 import requests
 
 from common.helpers import LOCAL_TIMEZONE
-
-from django.conf import settings
+from common.redis_pool import get_redis
 
 from .api import OccupEyeApi
 from .constants import OccupEyeConstants
@@ -23,11 +21,7 @@ from .utils import (
 
 class OccupeyeCache():
     def __init__(self):
-        self._redis = redis.Redis(
-            host=settings.REDIS_UCLAPI_HOST,
-            charset="utf-8",
-            decode_responses=True
-        )
+        self._redis = get_redis(decode_responses=True)
         self._const = OccupEyeConstants()
 
         access_token = self._redis.get(
@@ -16,6 +16,7 @@ import GetRooms from './Routes/RoomBookings/GetRooms.jsx';
 import GetBookings from './Routes/RoomBookings/GetBookings.jsx';
 import GetEquiment from './Routes/RoomBookings/GetEquipment.jsx';
 import GetFreeRooms from './Routes/RoomBookings/GetFreeRooms.jsx';
+import GetUtilisation from './Routes/RoomBookings/GetUtilisation.jsx';
 import Webhooks from './Routes/RoomBookings/Webhooks.jsx';
 
 import SearchVersionHeader from './Routes/Search/VersionHeader.jsx';
@@ -67,6 +68,7 @@ export default class DocumentationComponent extends React.Component {
             <GetBookings />
             <GetEquiment />
             <GetFreeRooms />
+            <GetUtilisation />
             <Webhooks />
 
             <SectionHeader link="search" title="Search" />
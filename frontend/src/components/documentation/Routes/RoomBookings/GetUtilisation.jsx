@@ -0,0 +1,198 @@
+import React from 'react';
+
+import Topic from './../../Topic.jsx';
+import Table from './../../Table.jsx';
+import Cell from './../../Cell.jsx';
+
+
+let codeExamples = {
+  python: `import requests
+
+params = {
+  "token": "uclapi-5d58c3c4e6bf9c-c2910ad3b6e054-7ef60f44f1c14f-a05147bfd17fdb",
+  "siteid": "086",
+  "period": "week"
+}
+r = requests.get("https://uclapi.com/roombookings/utilisation", params=params)
+print(r.json())`,
+
+  shell: `curl -G https://uclapi.com/roombookings/utilisation \\
+-d token=uclapi-5d58c3c4e6bf9c-c2910ad3b6e054-7ef60f44f1c14f-a05147bfd17fdb \\
+-d siteid=086 \\
+-d period=week`,
+
+  javascript: `fetch("https://uclapi.com/roombookings/utilisation?token=uclapi-5d58c3c4e6bf9c-c2910ad3b6e054-7ef60f44f1c14f-a05147bfd17fdb&siteid=086&period=week")
+.then((response) => {
+  return response.json()
+})
+.then((json) => {
+  console.log(json);
+})`
+}
+
+let response = `{
+  "ok": true,
+  "start_date": "2018-09-24",
+  "end_date": "2019-06-14",
+  "period": "week",
+  "rooms": [
+    {
+      "roomid": "433",
+      "siteid": "086",
+      "roomname": "Chadwick Building G07",
+      "booked_minutes": 32400,
+      "opening_minutes": 99900,
+      "utilisation": 32.4,
+      "peak_hours": [11, 10, 14],
+      "periods": [
+        {
+          "start_date": "2018-09-24",
+          "booked_minutes": 1020,
+          "opening_minutes": 2700,
+          "utilisation": 37.8
+        },
+        ...
+      ]
+    },
+    ...
+  ]
+}
+`
+
+let responseCodeExample = {
+  python: response,
+  javascript: response,
+  shell: response
+}
+
+
+export default class GetUtilisation extends React.Component {
+
+    render () {
+      return (
+        <div>
+          <Topic
+            activeLanguage={this.props.activeLanguage}
+            codeExamples={codeExamples}>
+            <h1 id="roombookings/utilisation">Get Utilisation</h1>
+            <p>
+              Endpoint: <code>https://uclapi.com/roombookings/utilisation</code>
+            </p>
+            <p>
+              This endpoint returns how busy rooms are: the number of minutes each room is booked for, and the percentage of its opening hours (9am to 6pm, Monday to Friday) that this makes up. Statistics are broken down by day or by week, and are recalculated every time the bookings data is updated, so there is no need to page through every booking to work them out yourself.
+            </p>
+            <p>
+              <i>
+                Note: This endpoint only returns publicly bookable rooms. Departmentally bookable rooms are not included.
+              </i>
+            </p>
+            <Table
+              name="Query Pararmeters">
+              <Cell
+                name="token"
+                requirement="required"
+                example="uclapi-5d58c3c4e6bf9c-c2910ad3b6e054-7ef60f44f1c14f-a05147bfd17fdb"
+                description="Authentication token" />
+              <Cell
+                name="roomid"
+                requirement="optional"
+                example="433"
+                description="The room ID (not to be confused with the roomname)." />
+              <Cell
+                name="siteid"
+                requirement="optional"
+                example="086"
+                description="Every room is inside a site (building). All sites have IDs." />
+              <Cell
+                name="period"
+                requirement="optional"
+                example="day"
+                description="Either day or week. Defaults to week. Weeks start on Mondays." />
+              <Cell
+                name="start_date"
+                requirement="optional"
+                example="20181001"
+                description="The first day to include, in the format YYYYMMDD. Defaults to the first day for which there are bookings." />
+              <Cell
+                name="end_date"
+                requirement="optional"
+                example="20181031"
+                description="The last day to include, in the format YYYYMMDD. Defaults to the last day for which there are bookings." />
+            </Table>
+          </Topic>
+
+          <Topic
+            activeLanguage={this.props.activeLanguage}
+            codeExamples={responseCodeExample}>
+            <h2>Response</h2>
+            <p>
+              The rooms field contains the statistics for every room that matches the query. Periods in which a room is not booked at all are left out of its periods list.
+            </p>
+            <Table
+              name="Response">
+              <Cell
+                name="roomid"
+                extra="string"
+                example="433"
+                description="The room ID (not to be confused with the roomname)." />
+              <Cell
+                name="siteid"
+                extra="string"
+                example="086"
+                description="Every room is inside a site (building). All sites have IDs." />
+              <Cell
+                name="roomname"
+                extra="string"
+                example="Chadwick Building G07"
+                description="The name of the room." />
+              <Cell
+                name="booked_minutes"
+                extra="int"
+                example="32400"
+                description="The number of minutes within opening hours that the room is booked for. Overlapping bookings are only counted once." />
+              <Cell
+                name="opening_minutes"
+                extra="int"
+                example="99900"
+                description="The number of minutes that the room is open for." />
+              <Cell
+                name="utilisation"
+                extra="float"
+                example="32.4"
+                description="The percentage of opening hours that the room is booked for. This is null if the room is not open at all in the period." />
+              <Cell
+                name="peak_hours"
+                extra="list"
+                example="[11, 10, 14]"
+                description="Up to three hours of the day (from 0 to 23) in which the room is booked the most, busiest first." />
+              <Cell
+                name="periods"
+                extra="list"
+                example="-"
+                description="The same statistics for each day or week, identified by the date that it starts on." />
+            </Table>
+          </Topic>
+
+          <Topic
+            noExamples={true}>
+            <Table
+              name="Errors">
+              <Cell
+                name="No token provided"
+                description="Gets returned when you have not supplied a token in your request." />
+              <Cell
+                name="Token does not exist"
+                description="Gets returned when you supply an invalid token." />
+              <Cell
+                name="period should be either day or week"
+                description="Gets returned when you supply a period other than day or week." />
+              <Cell
+                name="date isn't formatted as suggested in the docs"
+                description="Gets returned when start_date or end_date are not in the format YYYYMMDD." />
+            </Table>
+          </Topic>
+        </div>
+      )
+    }
+
+}
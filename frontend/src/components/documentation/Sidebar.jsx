@@ -121,6 +121,10 @@ export default class Sidebar extends React.Component {
                 primaryText="Get Free Rooms"
                 href="#roombookings/freerooms"
               />,
+              <ListItem
+                primaryText="Get Utilisation"
+                href="#roombookings/utilisation"
+              />,
               <ListItem
                 primaryText="Webhooks"
                 href="#roombookings/webhooks"